@@ -0,0 +1,242 @@
+import os
+import asyncio
+import itertools
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from stripe_pagination import default_page_limit
+from pipeline_metrics import span
+
+
+# Asyncio versions of the report functions that fan out into one Stripe request per customer or per email. The blocking requests run
+# on a thread pool through the reporting_functions data source, so they share its rate limiters, retries, report cache and platform
+# context, and a semaphore bounds how many are in flight. The Stripe rate limit still applies: with the default 20 searches per
+# second, 300 customers take about 15 seconds instead of one request round trip after another.
+#   charges = await return_charges_for_customers_async(20240101, 20240115, customer_ids)
+# Existing synchronous callers use the wrappers at the bottom:
+#   charges = return_charges_for_customers(20240101, 20240115, customer_ids)
+
+default_max_concurrency = int(os.getenv("STRIPE_ASYNC_CONCURRENCY", "16"))
+
+blocking_executor = None
+blocking_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool the blocking Stripe calls run on, created on first use. asyncio's default executor is sized by CPU count,
+    which would cap the fan-out well below the semaphore on small machines.
+
+    Returns:
+        ThreadPoolExecutor: shared pool of STRIPE_ASYNC_CONCURRENCY (default 16) threads.
+    """
+    global blocking_executor
+    with blocking_executor_lock:
+        if blocking_executor is None:
+            blocking_executor = ThreadPoolExecutor(max_workers=default_max_concurrency, thread_name_prefix="stripe_async")
+    return blocking_executor
+
+
+async def run_blocking(blocking_function, *args, **kwargs):
+    """Runs a blocking function on the thread pool in a copy of the current context, like asyncio.to_thread, so the platform context
+    carries over.
+
+    Args:
+        blocking_function (function): function to call.
+
+    Returns:
+        Return value of the function.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_blocking_executor(), functools.partial(context.run, blocking_function, *args, **kwargs))
+
+
+async def iterate_objects_async(object_type: str, start_epoch: int, end_epoch: int, customer_id: str = None, batch_size: int = default_page_limit):
+    """Async generator over the objects created strictly between the two epoch times. Each batch is pulled from the data source's
+    generator on the thread pool, so the event loop is never blocked by a page request.
+
+    Args:
+        object_type (str): customers, charges, payment_intents or subscriptions.
+        start_epoch (int): exclusive lower bound on created.
+        end_epoch (int): exclusive upper bound on created.
+        customer_id (str, optional): only objects of this customer.
+        batch_size (int, optional): objects pulled per thread hop. Defaults to the Stripe page size, about one page per hop.
+
+    Yields:
+        stripe.StripeObject: one object at a time, in Stripe order.
+    """
+    import reporting_functions
+
+    objects_iterator = await run_blocking(
+        lambda: iter(reporting_functions.get_data_source().search_objects(object_type, start_epoch, end_epoch, customer_id=customer_id)))
+    while True:
+        batch = await run_blocking(lambda: list(itertools.islice(objects_iterator, batch_size)))
+        if not batch:
+            return
+        for stripe_object in batch:
+            yield stripe_object
+
+
+async def gather_with_concurrency(coroutines: list, max_concurrency: int = None) -> list:
+    """Awaits the coroutines with at most max_concurrency running at once.
+
+    Args:
+        coroutines (list): coroutines to await.
+        max_concurrency (int, optional): Defaults to STRIPE_ASYNC_CONCURRENCY or 16.
+
+    Returns:
+        list: results in the order of the coroutines.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or default_max_concurrency)
+
+    async def run_with_semaphore(coroutine):
+        async with semaphore:
+            return await coroutine
+    return await asyncio.gather(*(run_with_semaphore(coroutine) for coroutine in coroutines))
+
+
+async def return_list_of_charges_async(start_date: int, end_date: int) -> list:
+    """Async reporting_functions.return_list_of_charges.
+
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+
+    Returns:
+        list: charge dictionaries, see reporting_functions.iterate_charges.
+    """
+    import reporting_functions
+
+    with span("return_list_of_charges_async"):
+        return await run_blocking(reporting_functions.return_list_of_charges, start_date, end_date)
+
+
+async def return_list_of_clients_and_duplicates_async(start_date: int, end_date: int) -> tuple:
+    """Async reporting_functions.return_list_of_clients_and_duplicates, paging with iterate_objects_async.
+
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+
+    Returns:
+        tuple: (customer_list, duplicate_accounts), see reporting_functions.deduplicate_clients_by_email.
+    """
+    import reporting_functions
+
+    with span("return_list_of_clients_and_duplicates_async"):
+        customers = [customer async for customer in iterate_objects_async(
+            "customers", int(reporting_functions.convert_datetime_to_epoch_unix(start_date)),
+            int(reporting_functions.convert_datetime_to_epoch_unix(end_date)))]
+        return reporting_functions.deduplicate_clients_by_email(customers)
+
+
+async def return_list_of_charges_by_customer_async(start_date: int, end_date: int, customer_id: str = None) -> list:
+    """Async reporting_functions.return_list_of_charges_by_customer, cached the same way.
+
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+        customer_id (str, optional): cus_123xyz
+
+    Returns:
+        list: see reporting_functions.return_list_of_charges_by_customer.
+    """
+    import reporting_functions
+
+    return await run_blocking(reporting_functions.return_list_of_charges_by_customer, start_date, end_date, customer_id)
+
+
+async def return_charges_for_customers_async(start_date: int, end_date: int, customer_ids: list, max_concurrency: int = None) -> list:
+    """Drills down into the charges of each customer, with one concurrent Stripe search per customer.
+
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+        customer_ids (list): customer IDs, ex. from return_list_of_customer_ids.
+        max_concurrency (int, optional): searches in flight at once. Defaults to STRIPE_ASYNC_CONCURRENCY or 16.
+
+    Returns:
+        list: one dictionary per customer in customer_ids order, see reporting_functions.return_list_of_charges_by_customer.
+    """
+    with span("return_charges_for_customers_async"):
+        customer_results = await gather_with_concurrency(
+            [return_list_of_charges_by_customer_async(start_date, end_date, customer_id) for customer_id in customer_ids], max_concurrency)
+    return [customer_charges for customer_result in customer_results for customer_charges in customer_result]
+
+
+async def get_customer_email_data_async(start_date: int = 20200101, end_date: int = 20241230, email_list: list = None,
+                                        max_concurrency: int = None) -> list:
+    """Async reporting_functions.get_customer_email_data with bulk_resolve off: one Stripe search per email, run concurrently.
+
+    Args:
+        start_date (int, optional): YYYYMMDD, used when no email list is given.
+        end_date (int, optional): YYYYMMDD, used when no email list is given.
+        email_list (list, optional): emails to look up. Defaults to the emails of the customers created in the period.
+        max_concurrency (int, optional): searches in flight at once. Defaults to STRIPE_ASYNC_CONCURRENCY or 16.
+
+    Returns:
+        list: customer details in email_list order, see reporting_functions.get_customer_email_data.
+    """
+    import reporting_functions
+
+    if email_list is None:
+        email_list = await run_blocking(reporting_functions.return_list_of_customer_emails, start_date, end_date)
+
+    def search_email(customer_email):
+        return list(reporting_functions.get_data_source().search_customers_by_email(customer_email))
+
+    with span("get_customer_email_data_async"):
+        search_results = await gather_with_concurrency(
+            [run_blocking(search_email, customer_email) for customer_email in email_list], max_concurrency)
+
+    # Built exactly like get_customer_email_data, so the two can be swapped: the details of every customer sharing an email go into
+    # one list, added once per customer.
+    customer_details_list = []
+    for search_result in search_results:
+        indv_details = []
+        for data in search_result:
+            indv_details.append(data.get("id"))
+            indv_details.append(data.get("email"))
+            indv_details.append(reporting_functions.convert_epoch_unix_to_human_readable(data.get("created")))
+            customer_details_list.append(indv_details)
+    return customer_details_list
+
+
+# Synchronous wrappers for existing callers.
+
+def run_async(coroutine):
+    """Runs a coroutine to completion from synchronous code.
+
+    Args:
+        coroutine: coroutine to run.
+
+    Raises:
+        RuntimeError: if called from a running event loop, await the _async function there instead.
+
+    Returns:
+        Return value of the coroutine.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    coroutine.close()
+    raise RuntimeError("run_async cannot be used inside a running event loop, await the _async function instead.")
+
+
+def return_charges_for_customers(start_date: int, end_date: int, customer_ids: list, max_concurrency: int = None) -> list:
+    """Synchronous return_charges_for_customers_async."""
+    return run_async(return_charges_for_customers_async(start_date, end_date, customer_ids, max_concurrency))
+
+
+def get_customer_email_data_concurrently(start_date: int = 20200101, end_date: int = 20241230, email_list: list = None,
+                                         max_concurrency: int = None) -> list:
+    """Synchronous get_customer_email_data_async."""
+    return run_async(get_customer_email_data_async(start_date, end_date, email_list, max_concurrency))
+
+
+def return_list_of_clients_and_duplicates_concurrently(start_date: int, end_date: int) -> tuple:
+    """Synchronous return_list_of_clients_and_duplicates_async."""
+    return run_async(return_list_of_clients_and_duplicates_async(start_date, end_date))
@@ -0,0 +1,200 @@
+import os
+import shutil
+import logging
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Typed, columnar copy of the cleaned StudioBookings attendance history. The combined .csv written by
+# studiobooking_data_modifications.combine_all_modified_csv_file is converted once into a Parquet dataset partitioned by year_month, so
+# queries read only the months they ask for and get dates, integers and categoricals back instead of untyped strings:
+#   python attendance_store.py combined_modified_files.csv
+#   query_attendance(start_date=20240101, end_date=20240331, members=["Jane Doe"])
+
+default_store_path = os.getenv("SB_ATTENDANCE_STORE_PATH", "attendance_store")
+
+balance_column_names = ["balance", "balance_used", "remaining_balance"]
+categorical_column_names = ["package_name", "transaction_type"]
+text_column_names = ["date", "class_booked", "class_date", "class_time", "modified_by", "account_owner"]
+
+attendance_schema = pa.schema(
+    [(column_name, pa.string()) for column_name in text_column_names]
+    + [(column_name, pa.dictionary(pa.int32(), pa.string())) for column_name in categorical_column_names]
+    + [(column_name, pa.int64()) for column_name in balance_column_names]
+    + [("cleaned_date", pa.date32()), ("year_month", pa.string())]
+)
+
+# Rows without a cleaned_date go to this partition.
+unknown_partition = "unknown"
+
+
+def convert_to_date(date_value) -> date:
+    """Converts a YYYYMMDD int, a YYYY-MM-DD string or a date to a date.
+
+    Args:
+        date_value (int, str or date): date.
+
+    Returns:
+        date: date.
+    """
+    if isinstance(date_value, date):
+        return date_value
+    if isinstance(date_value, int):
+        return datetime.strptime(str(date_value), "%Y%m%d").date()
+    return datetime.strptime(date_value, "%Y-%m-%d").date()
+
+
+def to_typed_attendance_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Converts rows of the combined .csv, read as strings, to the attendance store types. Balances that are not whole numbers become
+    null.
+
+    Args:
+        data (pd.DataFrame): rows with the modified file columns, see studiobooking_data_modifications.modified_file_column_names.
+
+    Returns:
+        pd.DataFrame: rows with the attendance_schema columns.
+    """
+    typed_data = pd.DataFrame(index=data.index)
+    for column_name in text_column_names:
+        typed_data[column_name] = data[column_name].where(data[column_name] != "", None)
+    for column_name in categorical_column_names:
+        typed_data[column_name] = data[column_name].where(data[column_name] != "", None).astype("category")
+    for column_name in balance_column_names:
+        numbers = pd.to_numeric(data[column_name], errors="coerce")
+        typed_data[column_name] = numbers.where(numbers % 1 == 0).astype("Int64")
+
+    cleaned_dates = pd.to_datetime(data["cleaned_date"], format="%Y-%m-%d", errors="coerce")
+    typed_data["cleaned_date"] = cleaned_dates.dt.date
+    typed_data["year_month"] = cleaned_dates.dt.strftime("%Y-%m").fillna(unknown_partition)
+    return typed_data
+
+
+def build_attendance_store(combined_file_path: str, store_path: str = default_store_path, chunk_size: int = 100000) -> int:
+    """Rebuilds the attendance store from the combined .csv, a chunk at a time. The store is built next to store_path and swapped in once
+    complete, so readers never see a half written store.
+
+    Args:
+        combined_file_path (str): path to combined_modified_files.csv.
+        store_path (str, optional): directory of the store. Defaults to SB_ATTENDANCE_STORE_PATH or attendance_store.
+        chunk_size (int, optional): rows converted at a time. Defaults to 100000.
+
+    Returns:
+        int: number of rows stored.
+    """
+    partial_path = store_path + ".part"
+    if os.path.exists(partial_path):
+        shutil.rmtree(partial_path)
+    os.makedirs(partial_path)
+
+    row_count = 0
+    for chunk_number, chunk in enumerate(pd.read_csv(combined_file_path, dtype=str, keep_default_na=False, chunksize=chunk_size)):
+        pq.write_to_dataset(
+            pa.Table.from_pandas(to_typed_attendance_frame(chunk), schema=attendance_schema, preserve_index=False),
+            partial_path,
+            partition_cols=["year_month"],
+            basename_template=f"part-{chunk_number}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        row_count += len(chunk.index)
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.replace(partial_path, store_path)
+    logging.info(f"Stored {row_count} attendance rows from {combined_file_path} in {store_path}.")
+    return row_count
+
+
+def open_attendance_store(store_path: str = default_store_path) -> ds.Dataset:
+    """Opens the store as a pyarrow dataset with year_month as a hive partition.
+
+    Args:
+        store_path (str, optional): directory of the store.
+
+    Returns:
+        ds.Dataset: attendance dataset.
+    """
+    partitioning = ds.partitioning(pa.schema([("year_month", pa.string())]), flavor="hive")
+    return ds.dataset(store_path, schema=attendance_schema, format="parquet", partitioning=partitioning)
+
+
+def query_attendance(start_date=None, end_date=None, members: list = None, transaction_types: list = None, columns: list = None,
+                     store_path: str = default_store_path) -> pd.DataFrame:
+    """Returns the attendance rows matching the filters. The date range is applied to year_month as well as cleaned_date, so only the
+    partitions of the requested months are read, and the member and transaction type filters are pushed down into the Parquet scan.
+
+    Args:
+        start_date (int, str or date, optional): first cleaned_date included, ex. 20240101 or "2024-01-01".
+        end_date (int, str or date, optional): last cleaned_date included.
+        members (list, optional): account_owner names to include.
+        transaction_types (list, optional): transaction_type values to include.
+        columns (list, optional): columns to return, all when None.
+        store_path (str, optional): directory of the store.
+
+    Returns:
+        pd.DataFrame: matching rows.
+    """
+    filters = []
+    if start_date is not None:
+        start_date = convert_to_date(start_date)
+        filters.append(ds.field("year_month") >= start_date.strftime("%Y-%m"))
+        filters.append(ds.field("cleaned_date") >= pa.scalar(start_date, pa.date32()))
+    if end_date is not None:
+        end_date = convert_to_date(end_date)
+        filters.append(ds.field("year_month") <= end_date.strftime("%Y-%m"))
+        filters.append(ds.field("cleaned_date") <= pa.scalar(end_date, pa.date32()))
+    if members:
+        filters.append(ds.field("account_owner").isin(members))
+    if transaction_types:
+        filters.append(ds.field("transaction_type").isin(transaction_types))
+
+    combined_filter = None
+    for expression in filters:
+        combined_filter = expression if combined_filter is None else combined_filter & expression
+
+    table = open_attendance_store(store_path).to_table(columns=columns, filter=combined_filter)
+    # Keep the balances as nullable integers instead of falling back to floats when a value is missing.
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+
+def get_member_attendance(member: str, start_date, end_date, store_path: str = default_store_path) -> pd.DataFrame:
+    """Returns one member's attendance history between two dates, ex. for the last quarter.
+
+    Args:
+        member (str): account_owner name.
+        start_date (int, str or date): first date included.
+        end_date (int, str or date): last date included.
+        store_path (str, optional): directory of the store.
+
+    Returns:
+        pd.DataFrame: the member's rows.
+    """
+    return query_attendance(start_date, end_date, members=[member], store_path=store_path)
+
+
+def get_rows_for_year(year: int, transaction_types: list = None, store_path: str = default_store_path) -> pd.DataFrame:
+    """Returns every row of a calendar year, optionally limited to some transaction types, ex. the package purchases of 2023.
+
+    Args:
+        year (int): calendar year.
+        transaction_types (list, optional): transaction_type values to include.
+        store_path (str, optional): directory of the store.
+
+    Returns:
+        pd.DataFrame: the year's rows.
+    """
+    return query_attendance(date(year, 1, 1), date(year, 12, 31), transaction_types=transaction_types, store_path=store_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the Parquet attendance store from the combined StudioBookings .csv.")
+    parser.add_argument("combined_file_path")
+    parser.add_argument("--store-path", default=default_store_path)
+    args = parser.parse_args()
+
+    print(f"Stored {build_attendance_store(args.combined_file_path, args.store_path)} rows in {args.store_path}.")
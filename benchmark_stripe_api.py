@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from fake_stripe_server import generate_synthetic_data, start_fake_stripe_server
+
+
+# Measures how many Stripe requests, how many response bytes and how much wall time each report entry point costs, by running the
+# reports against the local fake Stripe server seeded with synthetic data. Compare against a saved baseline to catch regressions in
+# API efficiency:
+#   python benchmark_stripe_api.py --output bench_baseline.json
+#   python benchmark_stripe_api.py --baseline bench_baseline.json
+# --latency-ms adds a delay to every response, so the concurrent entry points can be compared with the sequential ones as they would
+# run against Stripe rather than against a server on the same machine:
+#   python benchmark_stripe_api.py --latency-ms 50
+
+
+def configure_environment(api_base: str, respect_rate_limits: bool) -> None:
+    """Points reporting_functions at the fake server. Has to run before the first report since reporting_functions reads the .env values
+    on first use.
+
+    Args:
+        api_base (str): URL of the fake Stripe server.
+        respect_rate_limits (bool): keep the Stripe rate limits from .env, otherwise they are raised so only API cost is measured.
+    """
+    os.environ["STRIPE_API_BASE"] = api_base
+    os.environ["PLATFORM"] = "kahunas"
+    os.environ["STRIPE_SECRET_API_KEY_KAHUNAS"] = "sk_test_fake_stripe_server"
+    os.environ["RUN_FROM_LIVE_API_ENABLED"] = "true"
+    os.environ["RUN_FROM_JSON_ENABLED"] = "false"
+    os.environ["LOCAL_STORE_ENABLED"] = "false"
+    os.environ["EXPORT_ANY_ALL_FILES_ENABLED"] = "false"
+    # Cached results would cost no requests at all, so the benchmark would measure nothing.
+    os.environ["REPORT_CACHE_ENABLED"] = "false"
+    if not respect_rate_limits:
+        os.environ["STRIPE_READ_RATE_LIMIT"] = "100000"
+        os.environ["STRIPE_SEARCH_RATE_LIMIT"] = "100000"
+
+
+def benchmark_entry_points(server, start_date: int, end_date: int) -> dict:
+    """Runs each report entry point once and records the requests, bytes and wall time it cost.
+
+    Args:
+        server (FakeStripeServer): running fake server.
+        start_date (int): YYYYMMDD start of the reporting period.
+        end_date (int): YYYYMMDD end of the reporting period.
+
+    Returns:
+        dict: {entry point: {"total_requests", "bytes_sent", "requests_by_endpoint", "wall_time_seconds"}}
+    """
+    import reporting_functions
+    import async_stripe_access
+
+    entry_points = {
+        "main_create_weekly_xlsx_report": lambda: reporting_functions.main_create_weekly_xlsx_report(start_date, end_date),
+        "main_create_period_trend_report": lambda: reporting_functions.main_create_period_trend_report(end_date, "biweekly", 12),
+        "get_customer_email_data": lambda: reporting_functions.get_customer_email_data(start_date, end_date),
+        "get_customer_email_data_per_email_search": lambda: reporting_functions.get_customer_email_data(start_date, end_date, bulk_resolve=False),
+        "get_customer_email_data_concurrently": lambda: async_stripe_access.get_customer_email_data_concurrently(start_date, end_date),
+        "return_list_of_charges": lambda: reporting_functions.return_list_of_charges(start_date, end_date),
+        "return_list_of_charges_by_customer": lambda: reporting_functions.return_list_of_charges_by_customer(start_date, end_date),
+        "return_charges_for_customers": lambda: async_stripe_access.return_charges_for_customers(
+            start_date, end_date, reporting_functions.return_list_of_customer_ids(start_date, end_date)),
+        # The same per-customer drill down one search after another, to compare with return_charges_for_customers.
+        "return_charges_for_customers_sequentially": lambda: [
+            reporting_functions.return_list_of_charges_by_customer(start_date, end_date, customer_id)
+            for customer_id in reporting_functions.return_list_of_customer_ids(start_date, end_date)],
+        "return_total_of_charges_list": lambda: reporting_functions.return_total_of_charges_list(start_date, end_date),
+    }
+
+    results = {}
+    for name, entry_point in entry_points.items():
+        server.reset_stats()
+        started = time.perf_counter()
+        entry_point()
+        wall_time = time.perf_counter() - started
+        results[name] = server.get_stats()
+        results[name]["wall_time_seconds"] = round(wall_time, 3)
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lists the entry points whose request count or bytes grew more than the tolerance over the baseline.
+
+    Args:
+        results (dict): output of benchmark_entry_points.
+        baseline (dict): saved output of an earlier run.
+        tolerance (float): allowed growth, ex. 0.1 for 10%.
+
+    Returns:
+        list: descriptions of each regression, empty if there are none.
+    """
+    regressions = []
+    for name, baseline_result in baseline.get("entry_points", {}).items():
+        if name not in results:
+            continue
+        for metric in ("total_requests", "bytes_sent"):
+            allowed = baseline_result[metric] * (1 + tolerance)
+            if results[name][metric] > allowed:
+                regressions.append(f"{name}: {metric} went from {baseline_result[metric]} to {results[name][metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Stripe API cost of the report entry points against a local fake server.")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--charges", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-date", type=int, default=20240601)
+    parser.add_argument("--end-date", type=int, default=20240615)
+    parser.add_argument("--respect-rate-limits", action="store_true", help="keep the Stripe rate limits configured in .env")
+    parser.add_argument("--output", help="write the results to this JSON file, ex. to use as a baseline")
+    parser.add_argument("--baseline", help="fail if request counts or bytes regress compared to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay the fake server adds to every response")
+    args = parser.parse_args()
+
+    data = generate_synthetic_data(args.customers, args.charges, seed=args.seed)
+    server = start_fake_stripe_server(data, latency_seconds=args.latency_ms / 1000)
+    configure_environment(server.url, args.respect_rate_limits)
+
+    try:
+        results = benchmark_entry_points(server, args.start_date, args.end_date)
+    finally:
+        server.shutdown()
+
+    report = {
+        "dataset": {"customers": args.customers, "charges": args.charges, "seed": args.seed},
+        "period": {"start_date": args.start_date, "end_date": args.end_date},
+        "latency_ms": args.latency_ms,
+        "entry_points": results,
+    }
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w") as write_file:
+            json.dump(report, write_file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as read_file:
+            regressions = compare_to_baseline(results, json.load(read_file), args.tolerance)
+        if regressions:
+            print("API efficiency regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
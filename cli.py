@@ -0,0 +1,144 @@
+import argparse
+
+from dotenv import load_dotenv
+
+import pipeline_metrics
+
+
+# Command line entry point for the reports and the StudioBookings pipeline. Each command imports the module it needs when it runs, so
+# starting the CLI does not load pandas, Stripe or Selenium for commands that do not use them.
+#   python cli.py weekly-report 20240115 20240129
+#   python cli.py transform studiobooking_downloads --workers 4
+#   python cli.py --metrics-path metrics.json --profile tracemalloc combine modified_files .
+
+
+def run_weekly_report(args) -> None:
+    import reporting_functions
+    reporting_functions.main_create_weekly_xlsx_report(args.start_date, args.end_date)
+
+
+def run_trend_report(args) -> None:
+    import reporting_functions
+    print(reporting_functions.main_create_period_trend_report(args.end_date, args.period_type, args.period_count).to_string())
+
+
+def run_export_charges(args) -> None:
+    import reporting_functions
+    for file_path in reporting_functions.main_export_charges_report(args.start_date, args.end_date, args.output_format):
+        print(file_path)
+
+
+def run_gather(args) -> None:
+    import reporting_functions
+    print(reporting_functions.gather_stripe_reports(args.start_date, args.end_date))
+
+
+def run_sync_local_store(args) -> None:
+    import reporting_functions
+    print(reporting_functions.main_sync_local_store())
+
+
+def run_flags(args) -> None:
+    import reporting_functions
+    reporting_functions.print_feature_flags()
+
+
+def run_scrape(args) -> None:
+    import scrape_studiobooking_data
+    scrape_studiobooking_data.main_scrape_member_reports(args.first_member_id, args.last_member_id)
+
+
+def run_transform(args) -> None:
+    import studiobooking_data_modifications
+    worker_settings = {"max_workers": args.workers} if args.workers else {}
+    results = studiobooking_data_modifications.transform_file_directory(args.directory, manifest_path=args.manifest_path, **worker_settings)
+    print(f"{len(results)} files processed.")
+
+
+def run_combine(args) -> None:
+    import studiobooking_data_modifications
+    print(studiobooking_data_modifications.combine_all_modified_csv_file(args.directory, args.save_path, args.output_format, args.chunk_size))
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Builds the parser with a subcommand per entry point.
+
+    Returns:
+        argparse.ArgumentParser: parser, the chosen command's function is in the func attribute of the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Stripe reports and StudioBookings data pipeline.")
+    parser.add_argument("--metrics-path", help="write the run's timings and counters to this JSON file, defaults to PIPELINE_METRICS_PATH")
+    parser.add_argument("--profile", choices=pipeline_metrics.profile_modes, help="profile the run, defaults to PIPELINE_PROFILE")
+    parser.add_argument("--profile-path", help="with --profile cprofile, also dump the raw stats to this file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("weekly-report", help="new clients and charges of a period and the period before it")
+    command.add_argument("start_date", type=int, help="YYYYMMDD")
+    command.add_argument("end_date", type=int, help="YYYYMMDD")
+    command.set_defaults(func=run_weekly_report)
+
+    command = commands.add_parser("trend-report", help="clients and charges over several periods")
+    command.add_argument("end_date", type=int, help="YYYYMMDD")
+    command.add_argument("--period-type", default="biweekly", choices=["weekly", "biweekly", "monthly", "trailing_12_months"])
+    command.add_argument("--period-count", type=int, default=12)
+    command.set_defaults(func=run_trend_report)
+
+    command = commands.add_parser("export-charges", help="every charge of a period")
+    command.add_argument("start_date", type=int, help="YYYYMMDD")
+    command.add_argument("end_date", type=int, help="YYYYMMDD")
+    command.add_argument("--output-format", choices=["xlsx", "csv", "parquet"])
+    command.set_defaults(func=run_export_charges)
+
+    command = commands.add_parser("gather", help="export the Stripe objects of a period to NDJSON")
+    command.add_argument("start_date", type=int, help="YYYYMMDD")
+    command.add_argument("end_date", type=int, help="YYYYMMDD")
+    command.set_defaults(func=run_gather)
+
+    command = commands.add_parser("sync-local-store", help="bring the local Stripe store up to date")
+    command.set_defaults(func=run_sync_local_store)
+
+    command = commands.add_parser("flags", help="show which feature flags are enabled")
+    command.set_defaults(func=run_flags)
+
+    command = commands.add_parser("scrape", help="download the StudioBookings member credit reports")
+    command.add_argument("--first-member-id", type=int, default=1)
+    command.add_argument("--last-member-id", type=int, default=642)
+    command.set_defaults(func=run_scrape)
+
+    command = commands.add_parser("transform", help="clean the downloaded member reports")
+    command.add_argument("directory")
+    command.add_argument("--manifest-path")
+    command.add_argument("--workers", type=int, help="defaults to SB_TRANSFORM_WORKERS or 1")
+    command.set_defaults(func=run_transform)
+
+    command = commands.add_parser("combine", help="combine the cleaned member reports into one file")
+    command.add_argument("directory")
+    command.add_argument("save_path")
+    command.add_argument("--output-format", default="csv", choices=["csv", "parquet"])
+    command.add_argument("--chunk-size", type=int, default=50000)
+    command.set_defaults(func=run_combine)
+
+    return parser
+
+
+def main(argv: list = None) -> None:
+    """Runs the command given on the command line.
+
+    Args:
+        argv (list, optional): arguments without the program name. Defaults to sys.argv.
+    """
+    args = create_parser().parse_args(argv)
+    # Settings the modules read at import, ex. SB_TRANSFORM_WORKERS, have to be in the environment before the command imports them.
+    load_dotenv()
+    pipeline_metrics.metrics.reset()
+    profile_results = {}
+    try:
+        with pipeline_metrics.profile_run(args.profile, args.profile_path) as profile_results:
+            args.func(args)
+    finally:
+        # Written for failed runs too, they are the ones worth looking at. 
+        pipeline_metrics.write_metrics_summary(args.metrics_path, profile_results, {"command": args.command})
+
+
+if __name__ == "__main__":
+    main()
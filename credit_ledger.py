@@ -0,0 +1,161 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+# Per member credit ledger computed from the StudioBookings attendance history. Each row of a member's credit report carries the
+# package's credit balance, the credits a booking used and the remaining balance. Rows are grouped into package instances (one purchase
+# of a package, up to the next refill) and everything is computed with grouped cumulative sums over all members at once:
+#   ledger = build_credit_ledger(attendance_store.query_attendance())
+#   ledger["packages"], ledger["members"], ledger["rows"]
+
+# Days a package's credits stay valid after the purchase, after which unused credits count as expired.
+default_package_validity_days = int(os.getenv("SB_PACKAGE_VALIDITY_DAYS", "365"))
+
+balance_column_names = ["balance", "balance_used", "remaining_balance"]
+
+
+def prepare_ledger_rows(attendance: pd.DataFrame) -> pd.DataFrame:
+    """Types and orders the attendance rows for the ledger. Accepts either rows from attendance_store.query_attendance or the combined
+    .csv read as strings. Rows without a cleaned_date cannot be placed in time and are left out.
+
+    Args:
+        attendance (pd.DataFrame): rows with account_owner, package_name, cleaned_date and the balance columns.
+
+    Returns:
+        pd.DataFrame: rows sorted by member, package and date, with numeric balances and credits_used.
+    """
+    rows = attendance[["account_owner", "package_name", "cleaned_date"] + balance_column_names].copy()
+    rows["package_name"] = rows["package_name"].astype(object).fillna("")
+    rows["cleaned_date"] = pd.to_datetime(rows["cleaned_date"], errors="coerce")
+    for column_name in balance_column_names:
+        rows[column_name] = pd.to_numeric(rows[column_name], errors="coerce").astype(float)
+    rows["credits_used"] = rows["balance_used"].fillna(0).clip(lower=0)
+
+    rows = rows[rows["cleaned_date"].notna()]
+    return rows.sort_values(["account_owner", "package_name", "cleaned_date"], kind="stable").reset_index(drop=True)
+
+
+def compute_running_balances(attendance: pd.DataFrame) -> pd.DataFrame:
+    """Assigns each row to a package instance and computes the running balances. A new instance starts at a member's first row of a
+    package, when the package's credit balance changes, or when the remaining balance goes up (a refill).
+
+    Args:
+        attendance (pd.DataFrame): see prepare_ledger_rows.
+
+    Returns:
+        pd.DataFrame: ledger rows with package_instance, credits_purchased, cumulative_credits_used, running_remaining_credits and
+            member_running_balance (credits purchased minus credits used over all of the member's packages so far).
+    """
+    rows = prepare_ledger_rows(attendance)
+
+    same_package = (rows["account_owner"] == rows["account_owner"].shift()) & (rows["package_name"] == rows["package_name"].shift())
+    balance_changed = rows["balance"].ne(rows["balance"].shift()) & rows["balance"].notna()
+    refilled = rows["remaining_balance"] > rows["remaining_balance"].shift()
+    rows["package_instance"] = (~same_package | balance_changed | refilled).cumsum() - 1
+
+    # Credits bought with the instance, from its first row. Falls back to what was left plus what that row used.
+    first_rows = rows.groupby("package_instance").head(1).set_index("package_instance")
+    purchased = first_rows["balance"].fillna(first_rows["remaining_balance"] + first_rows["credits_used"]).fillna(0)
+    rows["credits_purchased"] = rows["package_instance"].map(purchased)
+
+    rows["cumulative_credits_used"] = rows.groupby("package_instance")["credits_used"].cumsum()
+    rows["running_remaining_credits"] = rows["credits_purchased"] - rows["cumulative_credits_used"]
+
+    # Member level balance in date order across all of the member's packages.
+    member_order = rows.sort_values(["account_owner", "cleaned_date"], kind="stable")
+    is_instance_start = ~member_order["package_instance"].duplicated()
+    member_credits_in = member_order["credits_purchased"].where(is_instance_start, 0)
+    member_grouped = pd.DataFrame({"account_owner": member_order["account_owner"], "credits_in": member_credits_in,
+                                   "credits_out": member_order["credits_used"]}).groupby("account_owner")
+    rows["member_running_balance"] = member_grouped["credits_in"].cumsum() - member_grouped["credits_out"].cumsum()
+    return rows
+
+
+def summarize_packages(ledger_rows: pd.DataFrame, as_of: date = None, validity_days: int = default_package_validity_days) -> pd.DataFrame:
+    """Summarizes each package instance: utilization, how long the credits took to run out, credits that expired unused, and credits that
+    rolled over into the next calendar year.
+
+    Args:
+        ledger_rows (pd.DataFrame): output of compute_running_balances.
+        as_of (date, optional): date expiry is judged at. Defaults to today.
+        validity_days (int, optional): days credits stay valid after the purchase. Defaults to SB_PACKAGE_VALIDITY_DAYS or 365.
+
+    Returns:
+        pd.DataFrame: one row per package instance.
+    """
+    as_of = pd.Timestamp(as_of or date.today())
+    grouped = ledger_rows.groupby("package_instance")
+    packages = grouped.agg(
+        account_owner=("account_owner", "first"),
+        package_name=("package_name", "first"),
+        purchase_date=("cleaned_date", "min"),
+        last_activity_date=("cleaned_date", "max"),
+        credits_purchased=("credits_purchased", "first"),
+        credits_used=("credits_used", "sum"),
+        activity_count=("credits_used", "size"),
+    )
+    packages["credits_remaining"] = (packages["credits_purchased"] - packages["credits_used"]).clip(lower=0)
+    packages["utilization_rate"] = (packages["credits_used"] / packages["credits_purchased"].replace(0, np.nan)).round(4)
+
+    # First date the cumulative use reached the credits purchased.
+    exhausted_dates = ledger_rows["cleaned_date"].where(ledger_rows["cumulative_credits_used"] >= ledger_rows["credits_purchased"])
+    packages["exhausted_date"] = exhausted_dates.groupby(ledger_rows["package_instance"]).min()
+    packages["days_to_exhaust"] = (packages["exhausted_date"] - packages["purchase_date"]).dt.days
+
+    packages["expiry_date"] = packages["purchase_date"] + pd.Timedelta(days=validity_days)
+    is_expired = packages["expiry_date"] < as_of
+    packages["credits_expired_unused"] = packages["credits_remaining"].where(is_expired, 0)
+
+    # Credits still unused at the end of the purchase year, while the package was still valid, carry over into the next year. Nothing has
+    # rolled over yet for a purchase year that has not ended by as_of.
+    purchase_year = packages["purchase_date"].dt.year
+    row_purchase_year = ledger_rows["package_instance"].map(purchase_year)
+    used_after_year_end = ledger_rows["credits_used"].where(ledger_rows["cleaned_date"].dt.year > row_purchase_year, 0)
+    packages["credits_used_after_year_end"] = used_after_year_end.groupby(ledger_rows["package_instance"]).sum()
+    year_end = pd.to_datetime(purchase_year.astype(str) + "-12-31")
+    remaining_at_year_end = (packages["credits_purchased"] - (packages["credits_used"] - packages["credits_used_after_year_end"])).clip(lower=0)
+    packages["rolled_over_credits"] = remaining_at_year_end.where((packages["expiry_date"] > year_end) & (year_end < as_of), 0)
+    return packages.reset_index()
+
+
+def summarize_members(packages: pd.DataFrame) -> pd.DataFrame:
+    """Rolls the package summary up to one row per member.
+
+    Args:
+        packages (pd.DataFrame): output of summarize_packages.
+
+    Returns:
+        pd.DataFrame: one row per member.
+    """
+    members = packages.groupby("account_owner").agg(
+        package_count=("package_instance", "size"),
+        credits_purchased=("credits_purchased", "sum"),
+        credits_used=("credits_used", "sum"),
+        credits_remaining=("credits_remaining", "sum"),
+        credits_expired_unused=("credits_expired_unused", "sum"),
+        rolled_over_credits=("rolled_over_credits", "sum"),
+        average_days_to_exhaust=("days_to_exhaust", "mean"),
+        first_purchase_date=("purchase_date", "min"),
+        last_activity_date=("last_activity_date", "max"),
+    )
+    members["utilization_rate"] = (members["credits_used"] / members["credits_purchased"].replace(0, np.nan)).round(4)
+    return members.reset_index()
+
+
+def build_credit_ledger(attendance: pd.DataFrame, as_of: date = None, validity_days: int = default_package_validity_days) -> dict:
+    """Computes the full credit ledger for every member in the attendance data.
+
+    Args:
+        attendance (pd.DataFrame): see prepare_ledger_rows.
+        as_of (date, optional): date expiry is judged at. Defaults to today.
+        validity_days (int, optional): days credits stay valid after the purchase. Defaults to SB_PACKAGE_VALIDITY_DAYS or 365.
+
+    Returns:
+        dict: {"rows": ledger rows with running balances, "packages": per package instance summary, "members": per member summary}
+    """
+    ledger_rows = compute_running_balances(attendance)
+    packages = summarize_packages(ledger_rows, as_of, validity_days)
+    return {"rows": ledger_rows, "packages": packages, "members": summarize_members(packages)}
@@ -0,0 +1,385 @@
+import json
+import random
+import re
+import time
+import threading
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+# Local stand-in for the parts of the Stripe API the reports use: list and search for customers, charges, payment intents,
+# subscriptions and events, with Stripe's pagination. Point stripe at it with STRIPE_API_BASE=http://127.0.0.1:<port> to run the
+# reports without credentials and to count how many requests and bytes each report costs.
+
+# Maps the URL path segment to the object type Stripe returns.
+served_object_types = {
+    "customers": "customer",
+    "charges": "charge",
+    "payment_intents": "payment_intent",
+    "subscriptions": "subscription",
+    "events": "event",
+}
+
+# Object types Stripe supports search on.
+searchable_object_types = ("customers", "charges", "payment_intents", "subscriptions")
+
+first_names = ["Alex", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn", "Parker", "Drew", "Skyler"]
+last_names = ["Smith", "Johnson", "Lee", "Brown", "Garcia", "Miller", "Davis", "Lopez", "Wilson", "Clark", "Young", "Walker"]
+charge_descriptions = ["10 Class Pack", "Monthly Unlimited", "Drop In", "Personal Training", "Annual Membership"]
+
+
+def generate_synthetic_data(num_customers: int = 1000, num_charges: int = 10000, start_date: int = 20230101, end_date: int = 20241231,
+                            seed: int = 0) -> dict:
+    """Generates Stripe-shaped customers, charges, payment intents, subscriptions and events spread over the date range. About 3% of
+    customers reuse an earlier customer's email so duplicate handling is exercised, and about 8% of charges fail.
+
+    Args:
+        num_customers (int, optional): number of customers. Defaults to 1000.
+        num_charges (int, optional): number of charges, each with a matching payment intent. Defaults to 10000.
+        start_date (int, optional): YYYYMMDD of the earliest object. Defaults to 20230101.
+        end_date (int, optional): YYYYMMDD of the latest object. Defaults to 20241231.
+        seed (int, optional): random seed, the same seed always produces the same data. Defaults to 0.
+
+    Returns:
+        dict: {object type: list of objects}
+    """
+    generator = random.Random(seed)
+    start_epoch = int(datetime.strptime(str(start_date), "%Y%m%d").timestamp())
+    end_epoch = int(datetime.strptime(str(end_date), "%Y%m%d").timestamp())
+
+    customers = []
+    for i in range(num_customers):
+        if customers and generator.random() < 0.03:
+            email = generator.choice(customers)["email"]
+        else:
+            email = f"member{i}@example.com"
+        customers.append({
+            "id": f"cus_{i:010d}",
+            "object": "customer",
+            "name": f"{generator.choice(first_names)} {generator.choice(last_names)}",
+            "email": email,
+            "created": generator.randint(start_epoch, end_epoch),
+        })
+
+    charges = []
+    payment_intents = []
+    for i in range(num_charges):
+        customer = generator.choice(customers)
+        created = generator.randint(customer["created"], end_epoch)
+        amount = generator.choice([2000, 2500, 15000, 18000, 22000])
+        status = "failed" if generator.random() < 0.08 else "succeeded"
+        description = generator.choice(charge_descriptions)
+        charges.append({
+            "id": f"ch_{i:010d}",
+            "object": "charge",
+            "customer": customer["id"],
+            "receipt_email": customer["email"],
+            "description": description,
+            "amount": amount,
+            "amount_captured": amount if status == "succeeded" else 0,
+            "status": status,
+            "created": created,
+        })
+        payment_intents.append({
+            "id": f"pi_{i:010d}",
+            "object": "payment_intent",
+            "customer": customer["id"],
+            "description": description,
+            "amount": amount,
+            "amount_received": amount if status == "succeeded" else 0,
+            "status": "succeeded" if status == "succeeded" else "requires_payment_method",
+            "created": created,
+        })
+
+    subscriptions = []
+    for i, customer in enumerate(generator.sample(customers, num_customers // 3)):
+        period_start = generator.randint(customer["created"], end_epoch)
+        subscriptions.append({
+            "id": f"sub_{i:010d}",
+            "object": "subscription",
+            "customer": customer["id"],
+            "status": generator.choice(["active", "active", "active", "canceled"]),
+            "current_period_start": period_start,
+            "current_period_end": period_start + 30 * 24 * 3600,
+            "cancel_at": None,
+            "created": customer["created"],
+        })
+
+    # Stripe keeps 30 days of events.
+    events = []
+    for stripe_object in customers + charges:
+        if stripe_object["created"] >= end_epoch - 30 * 24 * 3600:
+            if stripe_object["object"] == "customer":
+                event_type = "customer.created"
+            else:
+                event_type = f"charge.{stripe_object['status']}"
+            events.append({
+                "id": f"evt_{len(events):010d}",
+                "object": "event",
+                "type": event_type,
+                "created": stripe_object["created"],
+                "data": {"object": stripe_object},
+            })
+
+    return {
+        "customers": customers,
+        "charges": charges,
+        "payment_intents": payment_intents,
+        "subscriptions": subscriptions,
+        "events": events,
+    }
+
+
+class FakeStripeData:
+    def __init__(self, data: dict):
+        """Indexes the served objects by created date and ID.
+
+        Args:
+            data (dict): {object type: list of objects}, see generate_synthetic_data.
+        """
+        self.objects = {}
+        self.created = {}
+        self.positions_by_id = {}
+        for object_type in served_object_types:
+            # Stored oldest first for bisecting, served newest first like Stripe.
+            objects = sorted(data.get(object_type, []), key=lambda stripe_object: (stripe_object["created"], stripe_object["id"]))
+            self.objects[object_type] = objects
+            self.created[object_type] = [stripe_object["created"] for stripe_object in objects]
+            self.positions_by_id[object_type] = {stripe_object["id"]: position for position, stripe_object in enumerate(objects)}
+        self.search_cache = {}
+        self.lock = threading.Lock()
+
+    def list_objects(self, object_type: str, params: dict) -> dict:
+        """Answers a list request with Stripe's list pagination (limit and starting_after) and created/customer/status filters.
+
+        Args:
+            object_type (str): path segment, ex. charges
+            params (dict): query string parameters, one value each.
+
+        Returns:
+            dict: Stripe list object.
+        """
+        objects = self.objects[object_type]
+        created = self.created[object_type]
+        first = 0
+        last = len(objects)
+        if "created[gt]" in params:
+            first = max(first, bisect_right(created, int(params["created[gt]"])))
+        if "created[gte]" in params:
+            first = max(first, bisect_left(created, int(params["created[gte]"])))
+        if "created[lt]" in params:
+            last = min(last, bisect_left(created, int(params["created[lt]"])))
+        if "created[lte]" in params:
+            last = min(last, bisect_right(created, int(params["created[lte]"])))
+        if "starting_after" in params:
+            position = self.positions_by_id[object_type].get(params["starting_after"])
+            if position is not None:
+                last = min(last, position)
+
+        limit = int(params.get("limit", 10))
+        page = []
+        position = last - 1
+        while position >= first and len(page) < limit:
+            stripe_object = objects[position]
+            position -= 1
+            if "customer" in params and stripe_object.get("customer") != params["customer"]:
+                continue
+            # Like Stripe, canceled subscriptions are only listed when asked for.
+            if object_type == "subscriptions" and params.get("status", "") != "all" and stripe_object.get("status") == "canceled":
+                continue
+            page.append(stripe_object)
+        return {"object": "list", "url": f"/v1/{object_type}", "data": page, "has_more": position >= first}
+
+    def search_objects(self, object_type: str, params: dict) -> dict:
+        """Answers a search request. Supports the clauses the reports use, joined by AND: created</>/<=/>= comparisons and
+        field:'value' matches. Matches are computed on the first page and cached for the following pages.
+
+        Args:
+            object_type (str): path segment, ex. charges
+            params (dict): query string parameters, one value each.
+
+        Returns:
+            dict: Stripe search result object.
+        """
+        query = params.get("query", "")
+        cache_key = (object_type, query)
+        with self.lock:
+            matches = self.search_cache.get(cache_key)
+        if matches is None:
+            matches = self.match_search_query(object_type, query)
+            with self.lock:
+                self.search_cache[cache_key] = matches
+
+        offset = int(params.get("page") or 0)
+        limit = int(params.get("limit", 10))
+        page = matches[offset:offset + limit]
+        has_more = offset + limit < len(matches)
+        return {
+            "object": "search_result",
+            "url": f"/v1/{object_type}/search",
+            "data": page,
+            "has_more": has_more,
+            "next_page": str(offset + limit) if has_more else None,
+        }
+
+    def match_search_query(self, object_type: str, query: str) -> list:
+        """Returns the objects matching a search query, newest first.
+
+        Args:
+            object_type (str): path segment, ex. charges
+            query (str): Stripe search query.
+
+        Returns:
+            list: matching objects.
+        """
+        objects = self.objects[object_type]
+        created = self.created[object_type]
+        first = 0
+        last = len(objects)
+        field_matches = []
+        for clause in query.split(" AND "):
+            clause = clause.strip()
+            comparison = re.match(r"^created(<=|>=|<|>)(\d+)$", clause)
+            field_match = re.match(r"^(\w+):'(.*)'$", clause)
+            if comparison:
+                operator, value = comparison.group(1), int(comparison.group(2))
+                if operator == ">":
+                    first = max(first, bisect_right(created, value))
+                elif operator == ">=":
+                    first = max(first, bisect_left(created, value))
+                elif operator == "<":
+                    last = min(last, bisect_left(created, value))
+                else:
+                    last = min(last, bisect_right(created, value))
+            elif field_match:
+                field_matches.append((field_match.group(1), field_match.group(2).lower()))
+            elif clause:
+                logging.debug(f"Fake Stripe server ignored unsupported search clause: {clause}")
+
+        matches = []
+        for stripe_object in reversed(objects[first:last]):
+            if all(str(stripe_object.get(field) or "").lower() == value for field, value in field_matches):
+                matches.append(stripe_object)
+        return matches
+
+
+class FakeStripeRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Routes GET /v1/<type> and GET /v1/<type>/search and records the request and response size on the server."""
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path_parts = url.path.strip("/").split("/")
+
+        if len(path_parts) == 2 and path_parts[0] == "v1" and path_parts[1] in served_object_types:
+            endpoint = f"GET /v1/{path_parts[1]}"
+            response = self.server.data.list_objects(path_parts[1], params)
+            status = 200
+        elif len(path_parts) == 3 and path_parts[0] == "v1" and path_parts[1] in searchable_object_types and path_parts[2] == "search":
+            endpoint = f"GET /v1/{path_parts[1]}/search"
+            response = self.server.data.search_objects(path_parts[1], params)
+            status = 200
+        else:
+            endpoint = "unsupported"
+            response = {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL (GET: {url.path})"}}
+            status = 404
+
+        body = json.dumps(response).encode()
+        if self.server.latency_seconds:
+            time.sleep(self.server.latency_seconds)
+        # Recorded before responding so the counts are complete as soon as the client has its response.
+        self.server.record_request(endpoint, len(body), self.headers.get("Stripe-Version"))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Request lines are counted instead of printed.
+        pass
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data: dict, port: int = 0, latency_seconds: float = 0.0):
+        """HTTP server serving the fake Stripe API on 127.0.0.1. Use port 0 to pick a free port, see .url.
+
+        Args:
+            data (dict): {object type: list of objects}, see generate_synthetic_data.
+            port (int, optional): port to listen on. Defaults to 0.
+            latency_seconds (float, optional): delay added to every response, to stand in for the round trip to Stripe. Defaults to 0.
+        """
+        super().__init__(("127.0.0.1", port), FakeStripeRequestHandler)
+        self.data = FakeStripeData(data)
+        self.latency_seconds = latency_seconds
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as STRIPE_API_BASE."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def record_request(self, endpoint: str, response_bytes: int, api_version: str = None) -> None:
+        """Counts one request to the endpoint, the size of its response body and the API version it asked for."""
+        with self.stats_lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+            self.bytes_sent += response_bytes
+            self.api_version_counts[api_version] = self.api_version_counts.get(api_version, 0) + 1
+
+    def reset_stats(self) -> None:
+        """Clears the request and byte counters, ex. between benchmarked entry points."""
+        with self.stats_lock:
+            self.request_counts = {}
+            self.bytes_sent = 0
+            self.api_version_counts = {}
+
+    def get_stats(self) -> dict:
+        """Returns the counters collected since the last reset.
+
+        Returns:
+            dict: total_requests, bytes_sent, requests per endpoint and requests per Stripe-Version header (None when not sent).
+        """
+        with self.stats_lock:
+            return {
+                "total_requests": sum(self.request_counts.values()),
+                "bytes_sent": self.bytes_sent,
+                "requests_by_endpoint": dict(self.request_counts),
+                "requests_by_api_version": dict(self.api_version_counts),
+            }
+
+
+def start_fake_stripe_server(data: dict, port: int = 0, latency_seconds: float = 0.0) -> FakeStripeServer:
+    """Starts the fake Stripe server on a background thread.
+
+    Args:
+        data (dict): {object type: list of objects}, see generate_synthetic_data.
+        port (int, optional): port to listen on, 0 picks a free port. Defaults to 0.
+        latency_seconds (float, optional): delay added to every response. Defaults to 0.
+
+    Returns:
+        FakeStripeServer: running server, call .shutdown() when done.
+    """
+    server = FakeStripeServer(data, port, latency_seconds)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve synthetic Stripe data locally.")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--charges", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every response")
+    args = parser.parse_args()
+
+    server = FakeStripeServer(generate_synthetic_data(args.customers, args.charges, seed=args.seed), args.port, args.latency_ms / 1000)
+    print(f"Fake Stripe API serving on {server.url}. Set STRIPE_API_BASE={server.url} to use it.")
+    server.serve_forever()
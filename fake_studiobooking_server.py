@@ -0,0 +1,95 @@
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# Local stand-in for the StudioBookings member credit report export, to exercise studiobooking_downloader without logging in to the
+# real site. Point the downloader at it with SB_BASE_URL=http://127.0.0.1:<port> or the base_url argument.
+
+member_report_path = re.compile(r"^/(?P<gym_name>[^/]+)/excelreport/member-creditreport/client_id/(?P<member_id>\d+)/excelexport/true$")
+
+
+class FakeStudioBookingRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Serves GET /<gym>/excelreport/member-creditreport/client_id/<member_id>/excelexport/true and counts the request."""
+        match = member_report_path.match(self.path)
+        member_id = int(match.group("member_id")) if match else None
+        self.server.record_request(member_id)
+
+        if match is None or member_id not in self.server.reports:
+            self.send_error(404)
+            return
+        body = self.server.reports[member_id]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.ms-excel")
+        self.send_header("Content-Disposition", f'attachment; filename="{self.server.get_file_name(member_id)}"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Request lines are counted instead of printed.
+        pass
+
+
+class FakeStudioBookingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, reports: dict, file_name: str = None, port: int = 0):
+        """HTTP server serving member reports on 127.0.0.1. Use port 0 to pick a free port, see .url.
+
+        Args:
+            reports (dict): {member_id: report bytes}, other member IDs answer 404.
+            file_name (str, optional): file name suggested for every report, like the real site does. Defaults to one name per member.
+            port (int, optional): port to listen on. Defaults to 0.
+        """
+        super().__init__(("127.0.0.1", port), FakeStudioBookingRequestHandler)
+        self.reports = reports
+        self.file_name = file_name
+        self.stats_lock = threading.Lock()
+        self.requested_member_ids = []
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as SB_BASE_URL."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def get_file_name(self, member_id: int) -> str:
+        """Returns the file name suggested in the Content-Disposition header of the member's report."""
+        return self.file_name or f"Member {member_id}.xls"
+
+    def record_request(self, member_id: int) -> None:
+        """Counts one request, member_id is None for URLs that are not a member report."""
+        with self.stats_lock:
+            self.requested_member_ids.append(member_id)
+
+
+def start_fake_studiobooking_server(reports: dict, file_name: str = None, port: int = 0) -> FakeStudioBookingServer:
+    """Starts the fake StudioBookings server on a background thread.
+
+    Args:
+        reports (dict): {member_id: report bytes}
+        file_name (str, optional): file name suggested for every report.
+        port (int, optional): port to listen on, 0 picks a free port. Defaults to 0.
+
+    Returns:
+        FakeStudioBookingServer: running server, call .shutdown() when done.
+    """
+    server = FakeStudioBookingServer(reports, file_name, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve placeholder StudioBookings member reports locally.")
+    parser.add_argument("--port", type=int, default=12112)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--file-name", help="file name suggested for every report, ex. MemberCreditReport.xls")
+    args = parser.parse_args()
+
+    server = FakeStudioBookingServer({member_id: f"report of member {member_id}".encode() for member_id in range(1, args.members + 1)},
+                                     args.file_name, args.port)
+    print(f"Fake StudioBookings serving on {server.url}. Set SB_BASE_URL={server.url} to use it.")
+    server.serve_forever()
@@ -0,0 +1,242 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Timing spans, counters and byte counts for the pipeline's hot paths: Stripe paging, parsing and transforming the StudioBookings files,
+# the CSV combine, the report writers and the scraper. Everything is kept in memory in one process wide PipelineMetrics, so recording
+# costs a lock and a dictionary update. The CLI writes a JSON summary per run with --metrics-path (or PIPELINE_METRICS_PATH) and can
+# profile the run with --profile cprofile or --profile tracemalloc (or PIPELINE_PROFILE):
+#   python cli.py --metrics-path metrics.json --profile cprofile weekly-report 20240115 20240129
+# In code:
+#   with span("combine"):
+#       ...
+#   increment("stripe_pages")
+
+# PIPELINE_METRICS_PATH, PIPELINE_PROFILE and PIPELINE_PROFILE_TOP_ENTRIES (functions or allocation sites listed in the profile section
+# of the summary, default 25) are read when a run is profiled or summarized, so values loaded from the .env file after import apply.
+profile_modes = ("cprofile", "tracemalloc")
+
+
+class PipelineMetrics:
+    def __init__(self):
+        """Counters and timing spans of one run. Safe to update from several threads."""
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clears every counter and span and restarts the run clock."""
+        with self.lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.spans = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Adds to a counter, ex. increment("stripe_response_bytes", 5120)."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_span(self, name: str, seconds: float) -> None:
+        """Adds one timing to a span."""
+        with self.lock:
+            span_totals = self.spans.get(name)
+            if span_totals is None:
+                self.spans[name] = {"count": 1, "total_seconds": seconds, "max_seconds": seconds}
+            else:
+                span_totals["count"] += 1
+                span_totals["total_seconds"] += seconds
+                span_totals["max_seconds"] = max(span_totals["max_seconds"], seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """Times the with block, exceptions included.
+
+        Args:
+            name (str): span name, ex. "stripe.page.search".
+        """
+        span_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - span_start)
+
+    def timed(self, name: str = None):
+        """Decorator timing every call of a function.
+
+        Args:
+            name (str, optional): span name. Defaults to the function's name.
+
+        Returns:
+            function: decorator.
+        """
+        def decorator(timed_function):
+            span_name = name or timed_function.__name__
+
+            @functools.wraps(timed_function)
+            def timed_wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return timed_function(*args, **kwargs)
+            return timed_wrapper
+        return decorator
+
+    def get_snapshot(self) -> dict:
+        """Returns a copy of the counters and spans, ex. to send a worker process's metrics back to the parent.
+
+        Returns:
+            dict: {"counters", "spans"}
+        """
+        with self.lock:
+            return {"counters": dict(self.counters), "spans": {name: dict(span_totals) for name, span_totals in self.spans.items()}}
+
+    def merge(self, snapshot: dict) -> None:
+        """Adds the counters and spans of a snapshot, see get_snapshot.
+
+        Args:
+            snapshot (dict): metrics recorded elsewhere, ex. in a worker process.
+        """
+        with self.lock:
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for name, span_totals in snapshot["spans"].items():
+                if name not in self.spans:
+                    self.spans[name] = dict(span_totals)
+                else:
+                    self.spans[name]["count"] += span_totals["count"]
+                    self.spans[name]["total_seconds"] += span_totals["total_seconds"]
+                    self.spans[name]["max_seconds"] = max(self.spans[name]["max_seconds"], span_totals["max_seconds"])
+
+    def get_summary(self) -> dict:
+        """Returns the run's metrics, spans sorted by total time.
+
+        Returns:
+            dict: {"started_at", "duration_seconds", "counters", "spans": {name: {"count", "total_seconds", "mean_seconds", "max_seconds"}}}
+        """
+        snapshot = self.get_snapshot()
+        spans = {}
+        for name, span_totals in sorted(snapshot["spans"].items(), key=lambda item: item[1]["total_seconds"], reverse=True):
+            spans[name] = {
+                "count": span_totals["count"],
+                "total_seconds": round(span_totals["total_seconds"], 6),
+                "mean_seconds": round(span_totals["total_seconds"] / span_totals["count"], 6),
+                "max_seconds": round(span_totals["max_seconds"], 6),
+            }
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "duration_seconds": round(time.time() - self.started_at, 6),
+            "counters": dict(sorted(snapshot["counters"].items())),
+            "spans": spans,
+        }
+
+
+# Shared by every module of the pipeline.
+metrics = PipelineMetrics()
+increment = metrics.increment
+span = metrics.span
+timed = metrics.timed
+
+
+def get_path_size(path: str) -> int:
+    """Returns the size in bytes of a file, or of every file under a directory such as a Parquet dataset. 0 when the path is missing.
+
+    Args:
+        path (str): file or directory.
+
+    Returns:
+        int: bytes on disk.
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(directory, file_name)) for directory, _, file_names in os.walk(path) for file_name in file_names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+@contextmanager
+def profile_run(profile_mode: str = None, profile_path: str = None):
+    """Profiles the with block. The yielded dictionary is filled in when the block ends, pass it to write_metrics_summary.
+
+    Args:
+        profile_mode (str, optional): "cprofile" for the functions with the most cumulative time, "tracemalloc" for the peak memory and
+            the allocation sites holding the most memory, None to not profile. Defaults to PIPELINE_PROFILE.
+        profile_path (str, optional): with cprofile, the raw stats are also dumped here for snakeviz or pstats.
+
+    Raises:
+        ValueError: if the profile mode is not one of profile_modes.
+
+    Yields:
+        dict: profile results, empty when not profiling.
+    """
+    profile_mode = profile_mode if profile_mode is not None else os.getenv("PIPELINE_PROFILE")
+    profile_top_entries = int(os.getenv("PIPELINE_PROFILE_TOP_ENTRIES", "25"))
+    profile_results = {}
+    if not profile_mode:
+        yield profile_results
+        return
+    if profile_mode not in profile_modes:
+        raise ValueError(f"{profile_mode} is not a profile mode, use one of {profile_modes}.")
+
+    if profile_mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profile_results
+        finally:
+            profiler.disable()
+            if profile_path:
+                profiler.dump_stats(profile_path)
+            stats_output = io.StringIO()
+            pstats.Stats(profiler, stream=stats_output).sort_stats("cumulative").print_stats(profile_top_entries)
+            profile_results.update({"mode": profile_mode, "stats_path": profile_path, "top_functions": stats_output.getvalue()})
+    else:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield profile_results
+        finally:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            top_allocations = tracemalloc.take_snapshot().statistics("lineno")[:profile_top_entries]
+            if not was_tracing:
+                tracemalloc.stop()
+            profile_results.update({
+                "mode": profile_mode,
+                "current_bytes": current_bytes,
+                "peak_bytes": peak_bytes,
+                "top_allocations": [{"location": str(statistic.traceback[0]), "size_bytes": statistic.size, "count": statistic.count}
+                                    for statistic in top_allocations],
+            })
+
+
+def write_metrics_summary(file_path: str = None, profile_results: dict = None, run_details: dict = None) -> dict:
+    """Writes the run's metrics as JSON and logs the slowest spans.
+
+    Args:
+        file_path (str, optional): JSON file to write. Defaults to PIPELINE_METRICS_PATH, the summary is only returned when neither is set.
+        profile_results (dict, optional): output of profile_run.
+        run_details (dict, optional): extra fields describing the run, ex. the CLI command.
+
+    Returns:
+        dict: the summary.
+    """
+    summary = metrics.get_summary()
+    summary.update(run_details or {})
+    if profile_results:
+        summary["profile"] = profile_results
+
+    for name, span_totals in list(summary["spans"].items())[:5]:
+        logging.info(f"{name} took {span_totals['total_seconds']:.3f}s over {span_totals['count']} call(s).")
+
+    file_path = file_path or os.getenv("PIPELINE_METRICS_PATH")
+    if file_path:
+        with open(file_path, "w") as write_file:
+            json.dump(summary, write_file, indent=4, default=str)
+        logging.info(f"Pipeline metrics written to {file_path}.")
+    return summary
@@ -0,0 +1,169 @@
+import os
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import stripe
+
+import stripe_fetch_executor
+from stripe_data_sources import LiveStripeSource, LocalStoreSource, JsonReplaySource
+
+
+# Everything the report functions need to report on one business: its name, its own StripeClient and the data source it reads from.
+# The report functions look the current platform up with get_current_platform_context instead of module globals, so reports for both
+# businesses can run at the same time in different threads:
+#   with use_platform_context(create_platform_context("studiobookings")):
+#       return_list_of_charges(20240101, 20240115)
+
+# PLATFORM value: (platform name used in reports and file names, .env variable holding the API key)
+platform_settings = {
+    "kahunas": ("KAHUNAS", "STRIPE_SECRET_API_KEY_KAHUNAS"),
+    "studiobookings": ("STUDIO_BOOKINGS", "STRIPE_SECRET_API_KEY_STUDIO_BOOKINGS"),
+}
+
+current_platform_context = contextvars.ContextVar("current_platform_context", default=None)
+
+
+class PlatformContext:
+    def __init__(self, platform: str, api_key: str, data_source_selection: str = "Live API", local_store_enabled: bool = False,
+                 local_store_path: str = None, json_dir: str = None, api_base: str = None, stripe_version: str = None):
+        """Holds the Stripe client and data source of one platform.
+
+        Args:
+            platform (str): kahunas or studiobookings.
+            api_key (str): the platform's secret API key.
+            data_source_selection (str, optional): "Live API" or "Local JSON". Defaults to "Live API".
+            local_store_enabled (bool, optional): read the live data from the platform's local store. Defaults to False.
+            local_store_path (str, optional): path to the platform's local store. Defaults to <platform name>_stripe_local_store.db
+            json_dir (str, optional): directory of the platform's JSON dumps. Defaults to STRIPE_JSON_DIR_<PLATFORM NAME>, then STRIPE_JSON_DIR.
+            api_base (str, optional): API host, ex. the local fake_stripe_server.
+            stripe_version (str, optional): API version the client requests. Defaults to stripe.api_version, the STRIPE_API_VERSION the
+                single platform reports use.
+        """
+        self.platform = platform
+        self.name = platform_settings[platform][0]
+        self.api_key = api_key
+        self.data_source_selection = data_source_selection
+        self.local_store_enabled = local_store_enabled
+        self.local_store_path = local_store_path or f"{self.name.lower()}_stripe_local_store.db"
+        self.json_dir = json_dir or os.getenv(f"STRIPE_JSON_DIR_{self.name}") or os.getenv("STRIPE_JSON_DIR", ".")
+        self.stripe_version = stripe_version or stripe.api_version
+        self.client = stripe.StripeClient(api_key, stripe_version=self.stripe_version, base_addresses={"api": api_base} if api_base else {})
+        self.data_source = None
+        self.data_source_lock = threading.Lock()
+
+    def get_data_source(self):
+        """Returns the data source of the platform, created on first use.
+
+        Returns:
+            LiveStripeSource, LocalStoreSource or JsonReplaySource
+        """
+        # Report queries run concurrently, the lock keeps them from each creating a source.
+        with self.data_source_lock:
+            if self.data_source is None:
+                if self.data_source_selection == "Local JSON":
+                    self.data_source = JsonReplaySource(self.json_dir)
+                elif self.local_store_enabled:
+                    self.data_source = LocalStoreSource(self.local_store_path)
+                else:
+                    self.data_source = LiveStripeSource(self.client)
+                logging.info(f"{self.name} Stripe data is read from the {self.data_source.name} data source.")
+        return self.data_source
+
+
+def create_platform_context(platform: str, **context_settings) -> PlatformContext:
+    """Creates the context of a platform with the API key configured for it in the .env file.
+
+    Args:
+        platform (str): kahunas or studiobookings, case and surrounding whitespace are ignored.
+        **context_settings: passed to PlatformContext.
+
+    Raises:
+        ValueError: if the platform is unknown or has no API key configured.
+
+    Returns:
+        PlatformContext: new context.
+    """
+    platform = (platform or "").lower().strip()
+    if platform not in platform_settings:
+        raise ValueError(f"{platform} is not a platform, use one of {list(platform_settings)}.")
+    api_key = os.getenv(platform_settings[platform][1])
+    if not api_key:
+        raise ValueError(f"{platform_settings[platform][1]} is not set, the {platform} reports cannot be created.")
+    return PlatformContext(platform, api_key, **context_settings)
+
+
+def create_all_platform_contexts(**context_settings) -> list:
+    """Creates a context for every platform with an API key configured. Platforms without a key are skipped and logged.
+
+    Args:
+        **context_settings: passed to PlatformContext.
+
+    Raises:
+        ValueError: when replaying JSON dumps and a platform has no STRIPE_JSON_DIR_<PLATFORM NAME> of its own. Sharing one dump
+            directory would report the same objects under every platform.
+
+    Returns:
+        list: PlatformContext for each configured platform.
+    """
+    contexts = []
+    for platform in platform_settings:
+        try:
+            contexts.append(create_platform_context(platform, **context_settings))
+        except ValueError as e:
+            logging.info(f"{e} It is left out of the combined reports.")
+
+    if context_settings.get("data_source_selection") == "Local JSON":
+        json_dirs = {}
+        for context in contexts:
+            if not os.getenv(f"STRIPE_JSON_DIR_{context.name}"):
+                raise ValueError(f"STRIPE_JSON_DIR_{context.name} is not set, each platform needs its own dump directory to combine "
+                                 "reports from JSON dumps.")
+            json_dirs.setdefault(os.path.abspath(context.json_dir), []).append(context.name)
+        for json_dir, platform_names in json_dirs.items():
+            if len(platform_names) > 1:
+                raise ValueError(f"{', '.join(platform_names)} share the dump directory {json_dir}, each platform needs its own.")
+    return contexts
+
+
+def get_current_platform_context(default: PlatformContext = None) -> PlatformContext:
+    """Returns the platform the current thread is reporting on.
+
+    Args:
+        default (PlatformContext, optional): returned when no context has been set.
+
+    Returns:
+        PlatformContext: current context.
+    """
+    return current_platform_context.get() or default
+
+
+@contextmanager
+def use_platform_context(context: PlatformContext):
+    """Makes the context current for the duration of the with block, including the Stripe rate limiters, which are per account.
+
+    Args:
+        context (PlatformContext): context to use.
+    """
+    context_token = current_platform_context.set(context)
+    rate_limit_token = stripe_fetch_executor.rate_limit_account.set(context.name)
+    try:
+        yield context
+    finally:
+        stripe_fetch_executor.rate_limit_account.reset(rate_limit_token)
+        current_platform_context.reset(context_token)
+
+
+def run_in_platform_context(context: PlatformContext, function, *args, **kwargs):
+    """Calls the function with the context current, ex. as a FetchExecutor task.
+
+    Args:
+        context (PlatformContext): context to use.
+        function (function): function to call.
+
+    Returns:
+        Return value of the function.
+    """
+    with use_platform_context(context):
+        return function(*args, **kwargs)
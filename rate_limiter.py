@@ -0,0 +1,39 @@
+import time
+import threading
+
+
+# Token bucket shared by the Stripe fetch executor and the StudioBookings downloader to keep request rates under a limit across threads.
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """Thread-safe token bucket. Tokens refill continuously at `rate` per second up to `capacity`.
+
+        Args:
+            rate (float): tokens added per second.
+            capacity (float, optional): maximum burst size. Defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping until one is available.
+
+        Returns:
+            float: seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
@@ -0,0 +1,280 @@
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+import functools
+import inspect
+from datetime import datetime, timedelta
+
+from pipeline_metrics import increment
+
+
+# Persistent cache of report function results, keyed by (platform, data source, function, start_date, end_date, API version, other
+# arguments).
+# A period that ended more than the refund window ago can no longer change, so its entries are closed: they never expire and are never
+# evicted. Entries for open periods expire after a TTL, and the least recently used open entries are evicted past a size limit.
+#   python report_cache.py stats
+#   python report_cache.py invalidate --function return_list_of_charges --start-date 20240101
+
+default_cache_path = os.getenv("REPORT_CACHE_PATH", "report_cache.db")
+# Days after a period ends during which refunds and disputes can still change its numbers.
+refund_window_days = int(os.getenv("REPORT_CACHE_REFUND_WINDOW_DAYS", "90"))
+open_period_ttl_seconds = int(os.getenv("REPORT_CACHE_TTL_SECONDS", "3600"))
+max_open_entries = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "1000"))
+
+
+def open_report_cache(db_path: str = None) -> sqlite3.Connection:
+    """Opens (and creates if needed) the cache database.
+
+    Args:
+        db_path (str, optional): path to the SQLite file. Defaults to REPORT_CACHE_PATH or report_cache.db in cwd.
+
+    Returns:
+        sqlite3.Connection: open connection to the cache.
+    """
+    connection = sqlite3.connect(db_path or default_cache_path, timeout=30)
+    # Caches written before the data source was part of the key cannot tell live results from partial dump results, they are dropped.
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(report_cache)")]
+    if columns and "data_source" not in columns:
+        connection.execute("DROP TABLE report_cache")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS report_cache ("
+        "platform TEXT NOT NULL, "
+        "data_source TEXT NOT NULL, "
+        "function_name TEXT NOT NULL, "
+        "start_date INTEGER NOT NULL, "
+        "end_date INTEGER NOT NULL, "
+        "api_version TEXT NOT NULL, "
+        "arguments TEXT NOT NULL, "
+        "is_closed INTEGER NOT NULL, "
+        "created_at REAL NOT NULL, "
+        "last_used_at REAL NOT NULL, "
+        "value BLOB NOT NULL, "
+        "PRIMARY KEY (platform, data_source, function_name, start_date, end_date, api_version, arguments))"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS report_cache_lru_idx ON report_cache (is_closed, last_used_at)")
+    connection.execute("CREATE TABLE IF NOT EXISTS cache_stats (function_name TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)")
+    connection.commit()
+    return connection
+
+
+def is_closed_period(end_date: int, today: datetime = None) -> bool:
+    """Returns True when the period ended more than refund_window_days ago, so its results can no longer change.
+
+    Args:
+        end_date (int): YYYYMMDD end of the period.
+        today (datetime, optional): defaults to now.
+
+    Returns:
+        bool: True for a closed period.
+    """
+    today = today or datetime.now()
+    return datetime.strptime(str(end_date), "%Y%m%d") + timedelta(days=refund_window_days) < today
+
+
+class ReportCache:
+    def __init__(self, db_path: str = None, get_cache_context=None, enabled: bool = True, closed_data_sources: tuple = None):
+        """Caches the results of report functions that take (start_date, end_date, ...) arguments.
+
+        Args:
+            db_path (str, optional): path to the SQLite file. Defaults to REPORT_CACHE_PATH or report_cache.db in cwd.
+            get_cache_context (function, optional): returns the (platform, data source name, API version) the functions currently report
+                on, called on every lookup so a change of platform or data source never returns results computed from other data.
+            enabled (bool or function, optional): when False the decorated functions always run. A function is called on every lookup,
+                so the setting can be read lazily. Defaults to True.
+            closed_data_sources (tuple, optional): data sources whose results for closed periods are final. Results from any other source,
+                ex. a local store that has not been fully synced, are kept as open entries so they expire. Defaults to every source.
+        """
+        self.db_path = db_path or default_cache_path
+        self.get_cache_context = get_cache_context or (lambda: ("", "", ""))
+        self.enabled = enabled
+        self.closed_data_sources = closed_data_sources
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_enabled(self) -> bool:
+        """Returns whether the cache is used."""
+        return self.enabled() if callable(self.enabled) else self.enabled
+
+    def record_lookup(self, connection: sqlite3.Connection, function_name: str, is_hit: bool) -> None:
+        """Counts a hit or miss in memory and in the cache_stats table."""
+        with self.stats_lock:
+            if is_hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        increment("report_cache_hits" if is_hit else "report_cache_misses")
+        connection.execute(
+            "INSERT INTO cache_stats (function_name, hits, misses) VALUES (?, ?, ?) "
+            "ON CONFLICT (function_name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+            (function_name, int(is_hit), int(not is_hit)),
+        )
+
+    def get(self, key: tuple):
+        """Returns (True, value) for a fresh entry, (False, None) otherwise. Open entries older than the TTL count as missing.
+
+        Args:
+            key (tuple): (platform, data_source, function_name, start_date, end_date, api_version, arguments)
+
+        Returns:
+            tuple: (found, value)
+        """
+        connection = open_report_cache(self.db_path)
+        try:
+            row = connection.execute(
+                "SELECT value, is_closed, created_at FROM report_cache WHERE platform = ? AND data_source = ? AND function_name = ? "
+                "AND start_date = ? AND end_date = ? AND api_version = ? AND arguments = ?", key,
+            ).fetchone()
+            is_hit = row is not None and (row[1] or time.time() - row[2] < open_period_ttl_seconds)
+            if is_hit:
+                connection.execute(
+                    "UPDATE report_cache SET last_used_at = ? WHERE platform = ? AND data_source = ? AND function_name = ? "
+                    "AND start_date = ? AND end_date = ? AND api_version = ? AND arguments = ?", (time.time(),) + key,
+                )
+            self.record_lookup(connection, key[2], is_hit)
+            connection.commit()
+            return (True, pickle.loads(row[0])) if is_hit else (False, None)
+        finally:
+            connection.close()
+
+    def put(self, key: tuple, value) -> None:
+        """Stores a result. Closed entries are immutable, an existing closed entry is kept as it is. Results for closed periods from a source
+        outside closed_data_sources are stored as open entries. Storing an open entry evicts the
+        least recently used open entries past max_open_entries.
+
+        Args:
+            key (tuple): see get.
+            value: picklable result.
+        """
+        is_closed = is_closed_period(key[4]) and (self.closed_data_sources is None or key[1] in self.closed_data_sources)
+        now = time.time()
+        connection = open_report_cache(self.db_path)
+        try:
+            if is_closed:
+                # Replaces an entry stored while the period was still open, but never an existing closed entry.
+                connection.execute(
+                    "INSERT INTO report_cache VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?) "
+                    "ON CONFLICT (platform, data_source, function_name, start_date, end_date, api_version, arguments) "
+                    "DO UPDATE SET is_closed = 1, "
+                    "created_at = excluded.created_at, last_used_at = excluded.last_used_at, value = excluded.value "
+                    "WHERE report_cache.is_closed = 0", key + (now, now, pickle.dumps(value)),
+                )
+            else:
+                connection.execute("INSERT OR REPLACE INTO report_cache VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                                   key + (now, now, pickle.dumps(value)))
+                connection.execute(
+                    "DELETE FROM report_cache WHERE is_closed = 0 AND rowid NOT IN "
+                    "(SELECT rowid FROM report_cache WHERE is_closed = 0 ORDER BY last_used_at DESC LIMIT ?)", (max_open_entries,),
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+    def cached(self, report_function):
+        """Decorator caching a report function with start_date and end_date (YYYYMMDD) arguments. Its other arguments are part of the key.
+
+        Args:
+            report_function (function): function to cache.
+
+        Returns:
+            function: cached function.
+        """
+        signature = inspect.signature(report_function)
+
+        @functools.wraps(report_function)
+        def cached_report_function(*args, **kwargs):
+            if not self.is_enabled():
+                return report_function(*args, **kwargs)
+            bound_arguments = signature.bind(*args, **kwargs)
+            bound_arguments.apply_defaults()
+            arguments = dict(bound_arguments.arguments)
+            start_date = int(arguments.pop("start_date"))
+            end_date = int(arguments.pop("end_date"))
+            platform, data_source, api_version = self.get_cache_context()
+            key = (platform, data_source, report_function.__name__, start_date, end_date, str(api_version or ""),
+                   repr(sorted(arguments.items())))
+
+            found, value = self.get(key)
+            if found:
+                logging.debug(f"{report_function.__name__} for {start_date} to {end_date} was read from the report cache.")
+                return value
+            value = report_function(*args, **kwargs)
+            self.put(key, value)
+            return value
+        return cached_report_function
+
+    def get_stats(self) -> dict:
+        """Returns the hit and miss counts of this process and, per function, of every run recorded in the cache.
+
+        Returns:
+            dict: {"hits", "misses", "hit_rate", "entries", "closed_entries", "functions": {function_name: {"hits", "misses"}}}
+        """
+        connection = open_report_cache(self.db_path)
+        try:
+            entries, closed_entries = connection.execute("SELECT COUNT(*), COALESCE(SUM(is_closed), 0) FROM report_cache").fetchone()
+            functions = {function_name: {"hits": hits, "misses": misses}
+                         for function_name, hits, misses in connection.execute("SELECT function_name, hits, misses FROM cache_stats")}
+        finally:
+            connection.close()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "closed_entries": closed_entries,
+            "functions": functions,
+        }
+
+
+def invalidate(db_path: str = None, platform: str = None, function_name: str = None, start_date: int = None, end_date: int = None) -> int:
+    """Deletes cache entries, closed ones included. Every filter left as None matches everything.
+
+    Args:
+        db_path (str, optional): path to the SQLite file.
+        platform (str, optional): ex. KAHUNAS
+        function_name (str, optional): ex. return_list_of_charges
+        start_date (int, optional): only entries of periods starting on or after this date.
+        end_date (int, optional): only entries of periods ending on or before this date.
+
+    Returns:
+        int: number of entries deleted.
+    """
+    conditions = []
+    parameters = []
+    for condition, parameter in (("platform = ?", platform), ("function_name = ?", function_name),
+                                 ("start_date >= ?", start_date), ("end_date <= ?", end_date)):
+        if parameter is not None:
+            conditions.append(condition)
+            parameters.append(parameter)
+    connection = open_report_cache(db_path)
+    try:
+        deleted = connection.execute("DELETE FROM report_cache" + (" WHERE " + " AND ".join(conditions) if conditions else ""),
+                                     parameters).rowcount
+        connection.commit()
+    finally:
+        connection.close()
+    logging.info(f"Invalidated {deleted} report cache entries.")
+    return deleted
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the persistent report cache.")
+    parser.add_argument("command", choices=["stats", "invalidate"])
+    parser.add_argument("--cache-path", default=default_cache_path)
+    parser.add_argument("--platform")
+    parser.add_argument("--function")
+    parser.add_argument("--start-date", type=int)
+    parser.add_argument("--end-date", type=int)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(ReportCache(args.cache_path).get_stats(), indent=4))
+    else:
+        print(f"Invalidated {invalidate(args.cache_path, args.platform, args.function, args.start_date, args.end_date)} entries.")
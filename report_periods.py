@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Buckets Stripe customers and charges into any number of reporting periods at once. The objects of the whole date range are fetched
+# once by the caller (see reporting_functions.main_create_period_trend_report), then a membership matrix of objects x periods assigns
+# every object to every period it falls in, which also handles overlapping periods such as trailing 12 months.
+# Period bounds follow the report functions: an object belongs to a period when start_epoch < created < end_epoch.
+
+period_types = ("weekly", "biweekly", "monthly", "trailing_12_months")
+
+client_metric_columns = ["new_clients", "duplicate_accounts"]
+charge_metric_columns = ["charge_count", "successful_count", "failed_count", "total_attempted", "total_collected", "failure_rate"]
+
+
+def convert_date_to_epoch(date_value: datetime) -> int:
+    """Converts a date to epoch seconds the same way reporting_functions.convert_datetime_to_epoch_unix does (local midnight).
+
+    Args:
+        date_value (datetime): date.
+
+    Returns:
+        int: epoch seconds.
+    """
+    return int(date_value.timestamp())
+
+
+def build_periods(end_date: int, period_type: str = "biweekly", period_count: int = 2) -> pd.DataFrame:
+    """Builds period_count consecutive periods ending on end_date, oldest first.
+
+    Args:
+        end_date (int): YYYYMMDD end of the latest period.
+        period_type (str, optional): weekly, biweekly, monthly or trailing_12_months. Monthly periods are one calendar month long, trailing
+            12 month periods are a year long and step back one month at a time. Defaults to "biweekly".
+        period_count (int, optional): number of periods. Defaults to 2, the current and the previous period.
+
+    Raises:
+        ValueError: if the period type is not one of period_types.
+
+    Returns:
+        pd.DataFrame: label, start_date, end_date (YYYYMMDD ints), start_epoch and end_epoch, one row per period.
+    """
+    if period_type not in period_types:
+        raise ValueError(f"{period_type} is not a period type, use one of {period_types}.")
+
+    end_date_dt = datetime.strptime(str(end_date), "%Y%m%d")
+    periods = []
+    for offset in range(period_count - 1, -1, -1):
+        if period_type == "weekly":
+            period_end = end_date_dt - timedelta(days=7 * offset)
+            period_start = period_end - timedelta(days=7)
+        elif period_type == "biweekly":
+            period_end = end_date_dt - timedelta(days=14 * offset)
+            period_start = period_end - timedelta(days=14)
+        elif period_type == "monthly":
+            period_end = (pd.Timestamp(end_date_dt) - pd.DateOffset(months=offset)).to_pydatetime()
+            period_start = (pd.Timestamp(period_end) - pd.DateOffset(months=1)).to_pydatetime()
+        else:
+            period_end = (pd.Timestamp(end_date_dt) - pd.DateOffset(months=offset)).to_pydatetime()
+            period_start = (pd.Timestamp(period_end) - pd.DateOffset(months=12)).to_pydatetime()
+        periods.append({
+            "label": period_start.strftime("%Y%m%d") + "_to_" + period_end.strftime("%Y%m%d"),
+            "start_date": int(period_start.strftime("%Y%m%d")),
+            "end_date": int(period_end.strftime("%Y%m%d")),
+            "start_epoch": convert_date_to_epoch(period_start),
+            "end_epoch": convert_date_to_epoch(period_end),
+        })
+    return pd.DataFrame(periods)
+
+
+def build_period_membership(created_epochs: np.ndarray, periods: pd.DataFrame) -> np.ndarray:
+    """Returns which objects fall in which periods.
+
+    Args:
+        created_epochs (np.ndarray): created time of each object.
+        periods (pd.DataFrame): output of build_periods.
+
+    Returns:
+        np.ndarray: boolean matrix of shape (objects, periods).
+    """
+    created_epochs = np.asarray(created_epochs, dtype=np.int64)[:, None]
+    return (created_epochs > periods["start_epoch"].to_numpy()[None, :]) & (created_epochs < periods["end_epoch"].to_numpy()[None, :])
+
+
+def summarize_client_periods(customers: pd.DataFrame, periods: pd.DataFrame) -> pd.DataFrame:
+    """Counts new clients per period with duplicates removed by email within each period, like
+    reporting_functions.deduplicate_clients_by_email: the first account in Stripe order (newest first) is kept.
+
+    Args:
+        customers (pd.DataFrame): created and email_key (normalized email) in Stripe order.
+        periods (pd.DataFrame): output of build_periods.
+
+    Returns:
+        pd.DataFrame: new_clients and duplicate_accounts per period.
+    """
+    membership = build_period_membership(customers["created"].to_numpy(), periods)
+    email_keys = customers["email_key"].reset_index(drop=True)
+    new_clients = []
+    duplicate_accounts = []
+    for period_index in range(len(periods.index)):
+        period_email_keys = email_keys[membership[:, period_index]]
+        unique_count = int((~period_email_keys.duplicated()).sum())
+        new_clients.append(unique_count)
+        duplicate_accounts.append(len(period_email_keys.index) - unique_count)
+    return pd.DataFrame({"new_clients": new_clients, "duplicate_accounts": duplicate_accounts}, index=periods.index)
+
+
+def summarize_charge_periods(charges: pd.DataFrame, periods: pd.DataFrame) -> pd.DataFrame:
+    """Aggregates charges per period with one matrix product per metric.
+
+    Args:
+        charges (pd.DataFrame): created, status, amount and amount_captured (cents) of each charge in Stripe order.
+        periods (pd.DataFrame): output of build_periods.
+
+    Returns:
+        pd.DataFrame: charge_count, successful_count, failed_count, total_attempted, total_collected (dollars) and failure_rate per period.
+    """
+    membership = build_period_membership(charges["created"].to_numpy(), periods).astype(np.int64)
+    is_successful = (charges["status"] == "succeeded").to_numpy(dtype=np.int64)
+    is_failed = (charges["status"] == "failed").to_numpy(dtype=np.int64)
+    amounts = charges["amount"].fillna(0).to_numpy(dtype=np.float64)
+    # Only succeeded charges count as collected, like reporting_functions.group_charges_by_customer.
+    captured_amounts = charges["amount_captured"].fillna(0).to_numpy(dtype=np.float64) * is_successful
+
+    summary = pd.DataFrame({
+        "charge_count": membership.sum(axis=0),
+        "successful_count": membership.T @ is_successful,
+        "failed_count": membership.T @ is_failed,
+        "total_attempted": (membership.T @ amounts) / 100,
+        "total_collected": (membership.T @ captured_amounts) / 100,
+    }, index=periods.index)
+    summary["failure_rate"] = (summary["failed_count"] / summary["charge_count"].replace(0, np.nan)).fillna(0).round(2)
+    return summary
+
+
+def add_period_deltas(summary: pd.DataFrame, metric_columns: list) -> pd.DataFrame:
+    """Adds the change from the previous period for each metric, as an amount (<metric>_change) and a fraction (<metric>_change_pct).
+
+    Args:
+        summary (pd.DataFrame): one row per period, oldest first.
+        metric_columns (list): columns to compare.
+
+    Returns:
+        pd.DataFrame: summary with the change columns.
+    """
+    changes = summary[metric_columns].diff().add_suffix("_change")
+    previous_values = summary[metric_columns].shift().replace(0, np.nan)
+    change_fractions = (summary[metric_columns].diff() / previous_values).round(4).add_suffix("_change_pct")
+    return pd.concat([summary, changes, change_fractions], axis=1)
+
+
+def build_period_report(customers: pd.DataFrame, charges: pd.DataFrame, periods: pd.DataFrame) -> pd.DataFrame:
+    """Builds the multi-period report: client and charge metrics per period with the period-over-period changes.
+
+    Args:
+        customers (pd.DataFrame): see summarize_client_periods.
+        charges (pd.DataFrame): see summarize_charge_periods.
+        periods (pd.DataFrame): output of build_periods.
+
+    Returns:
+        pd.DataFrame: one row per period, oldest first.
+    """
+    summary = pd.concat([
+        periods[["label", "start_date", "end_date"]],
+        summarize_client_periods(customers, periods),
+        summarize_charge_periods(charges, periods),
+    ], axis=1)
+    return add_period_deltas(summary, client_metric_columns + charge_metric_columns)
@@ -0,0 +1,205 @@
+import os
+import csv
+import numbers
+import logging
+
+import xlsxwriter
+
+from pipeline_metrics import increment, span, get_path_size
+
+
+# Writes report sheets row by row to .xlsx, .csv or .parquet without building DataFrames. Rows can come from a generator, so a yearly
+# export is never held in memory: xlsxwriter runs in constant_memory mode (each row is flushed once the next one starts), CSV rows go
+# straight to the file and Parquet rows are written in fixed size batches. Totals are kept as running counts and sums while streaming.
+
+output_formats = ("xlsx", "csv", "parquet")
+
+# Rows buffered per Parquet row group.
+parquet_batch_size = 10000
+
+
+def create_report_sheet(name: str, columns: list, rows, totals: str = None, numeric_columns: list = ()) -> dict:
+    """Describes one sheet of a report.
+
+    Args:
+        name (str): sheet name, also used in the .csv and .parquet file names. Excel limits it to 31 characters.
+        columns (list): column names.
+        rows (iterable): lists or tuples in column order, may be a generator.
+        totals (str, optional): "count" adds a row counting the values of every column, "sum" adds a row summing the numeric columns.
+            None adds no totals row.
+        numeric_columns (list, optional): columns holding numbers. They are summed for "sum" totals and typed as float64 in Parquet, every
+            other column is written as text.
+
+    Returns:
+        dict: sheet description for write_report.
+    """
+    return {"name": name, "columns": list(columns), "rows": rows, "totals": totals, "numeric_columns": list(numeric_columns)}
+
+
+class RunningTotals:
+    def __init__(self, sheet: dict):
+        """Counts and sums a sheet's columns while its rows stream past.
+
+        Args:
+            sheet (dict): see create_report_sheet.
+        """
+        self.sheet = sheet
+        self.numeric_indexes = [sheet["columns"].index(column_name) for column_name in sheet["numeric_columns"]]
+        self.counts = [0] * len(sheet["columns"])
+        self.sums = [0] * len(sheet["columns"])
+
+    def add(self, row) -> None:
+        """Adds one row to the totals."""
+        for column_index, value in enumerate(row):
+            if value is not None and value != "":
+                self.counts[column_index] += 1
+        for column_index in self.numeric_indexes:
+            value = row[column_index]
+            if isinstance(value, numbers.Number) and not isinstance(value, bool):
+                self.sums[column_index] += value
+
+    def get_totals_row(self) -> tuple:
+        """Returns the totals label and values, or None when the sheet has no totals.
+
+        Returns:
+            tuple: ("count_totals" or "sum_totals", list of values) or None.
+        """
+        if self.sheet["totals"] == "count":
+            return "count_totals", list(self.counts)
+        if self.sheet["totals"] == "sum":
+            return "sum_totals", [round(self.sums[column_index], 2) if column_index in self.numeric_indexes else None
+                                  for column_index in range(len(self.sheet["columns"]))]
+        return None
+
+
+def write_xlsx_report(sheets: list, file_path: str) -> None:
+    """Writes every sheet to one workbook in constant_memory mode. Each sheet starts with the row number column, like DataFrame.to_excel,
+    and ends with its totals row.
+
+    Args:
+        sheets (list): sheets from create_report_sheet.
+        file_path (str): path of the .xlsx file.
+    """
+    with xlsxwriter.Workbook(file_path, {"constant_memory": True}) as workbook:
+        header_format = workbook.add_format({"bold": True})
+        for sheet in sheets:
+            worksheet = workbook.add_worksheet(sheet["name"])
+            worksheet.write_row(0, 1, sheet["columns"], header_format)
+            running_totals = RunningTotals(sheet)
+            row_number = 0
+            for row_number, row in enumerate(sheet["rows"]):
+                running_totals.add(row)
+                worksheet.write_number(row_number + 1, 0, row_number)
+                worksheet.write_row(row_number + 1, 1, row)
+            totals_row = running_totals.get_totals_row()
+            if totals_row:
+                label, values = totals_row
+                worksheet.write_string(row_number + 2, 0, label, header_format)
+                worksheet.write_row(row_number + 2, 1, values)
+
+
+def write_csv_report(sheets: list, file_path_base: str) -> list:
+    """Writes each sheet to its own .csv file, totals row last.
+
+    Args:
+        sheets (list): sheets from create_report_sheet.
+        file_path_base (str): path without extension, the sheet name is appended.
+
+    Returns:
+        list: paths of the written files.
+    """
+    file_paths = []
+    for sheet in sheets:
+        file_path = f"{file_path_base}_{sheet['name']}.csv"
+        running_totals = RunningTotals(sheet)
+        with open(file_path, "w", newline="") as write_file:
+            writer = csv.writer(write_file)
+            writer.writerow([""] + sheet["columns"])
+            for row_number, row in enumerate(sheet["rows"]):
+                running_totals.add(row)
+                writer.writerow([row_number] + list(row))
+            totals_row = running_totals.get_totals_row()
+            if totals_row:
+                writer.writerow([totals_row[0]] + totals_row[1])
+        file_paths.append(file_path)
+    return file_paths
+
+
+def write_parquet_report(sheets: list, file_path_base: str) -> list:
+    """Writes each sheet to its own .parquet file in batches of parquet_batch_size rows. Numeric columns are float64 and every other column
+    is text. Totals are not stored, Parquet readers compute them on the typed columns.
+
+    Args:
+        sheets (list): sheets from create_report_sheet.
+        file_path_base (str): path without extension, the sheet name is appended.
+
+    Returns:
+        list: paths of the written files.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    file_paths = []
+    for sheet in sheets:
+        file_path = f"{file_path_base}_{sheet['name']}.parquet"
+        schema = pa.schema([(column_name, pa.float64() if column_name in sheet["numeric_columns"] else pa.string())
+                            for column_name in sheet["columns"]])
+        numeric_indexes = {sheet["columns"].index(column_name) for column_name in sheet["numeric_columns"]}
+
+        def write_batch(writer, batch):
+            columns = list(zip(*batch)) if batch else [[] for column_name in sheet["columns"]]
+            arrays = [pa.array([None if value is None else (value if column_index in numeric_indexes else str(value))
+                                for value in column], type=schema.field(column_index).type)
+                      for column_index, column in enumerate(columns)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+        with pq.ParquetWriter(file_path, schema) as writer:
+            batch = []
+            for row in sheet["rows"]:
+                batch.append(row)
+                if len(batch) >= parquet_batch_size:
+                    write_batch(writer, batch)
+                    batch = []
+            write_batch(writer, batch)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def count_report_rows(rows):
+    """Passes the rows through, counting them in the report_rows_written metric once the sheet is written."""
+    row_count = 0
+    for row in rows:
+        row_count += 1
+        yield row
+    increment("report_rows_written", row_count)
+
+
+def write_report(sheets: list, file_path_base: str, output_format: str = "xlsx") -> list:
+    """Writes the report in the requested format.
+
+    Args:
+        sheets (list): sheets from create_report_sheet.
+        file_path_base (str): path without extension, ex. 20240101_to_20240115_kahunas_weekly_report
+        output_format (str, optional): xlsx for one workbook with a sheet each, csv or parquet for a file per sheet. Defaults to "xlsx".
+
+    Raises:
+        ValueError: if the output format is not one of output_formats.
+
+    Returns:
+        list: paths of the written files.
+    """
+    if output_format not in output_formats:
+        raise ValueError(f"{output_format} is not a report output format, use one of {output_formats}.")
+    sheets = [dict(sheet, rows=count_report_rows(sheet["rows"])) for sheet in sheets]
+    with span(f"write_report.{output_format}"):
+        if output_format == "xlsx":
+            file_paths = [file_path_base + ".xlsx"]
+            write_xlsx_report(sheets, file_paths[0])
+        elif output_format == "csv":
+            file_paths = write_csv_report(sheets, file_path_base)
+        else:
+            file_paths = write_parquet_report(sheets, file_path_base)
+    increment("report_files_written", len(file_paths))
+    increment("report_output_bytes", sum(get_path_size(file_path) for file_path in file_paths))
+    logging.info(f"Report written to {', '.join(os.path.basename(file_path) for file_path in file_paths)}.")
+    return file_paths
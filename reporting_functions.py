@@ -1,48 +1,42 @@
 import stripe
 import pandas as pd
 from datetime import datetime, timedelta
-import json
 from pprint import pprint
 import os
 import logging
 import re
+import threading
 
 from dotenv import load_dotenv
 
-# Import .ENV details
-
-load_dotenv()
-
-# Set to either "kahunas" or "studiobookings"
-selected_platform = os.getenv("PLATFORM")
-logging.info(f"The selected platform is {selected_platform}. Proceeding with reports from {selected_platform}.")
-
-stripe.api_version = os.getenv("STRIPE_API_VERSION")
-
-
-# One of these needs to return True
-is_run_from_json_enabled = os.getenv("RUN_FROM_JSON_ENABLED")
-is_run_from_live_API_enabled = os.getenv("RUN_FROM_LIVE_API_ENABLED")
-
-if is_run_from_json_enabled == True:
-    data_source_selection = "Local JSON"
-elif is_run_from_live_API_enabled == True:
-    data_source_selection = "Live API"
-else:
-    print("Check .env Feature Flag for data source selection.")
-    logging.info("Feature flag for data source (JSON/API) is incorrect. Please check .env file.")
-
-if selected_platform.lower().strip() == "kahunas":
-    stripe.api_key = os.getenv("STRIPE_SECRET_API_KEY_KAHUNAS")
-    platform_name = "KAHUNAS"
-elif selected_platform.lower().strip() == "studiobookings":
-    stripe.api_key = os.getenv("STRIPE_SECRET_API_KEY_STUDIO_BOOKINGS")
-    platform_name = "STUDIO_BOOKINGS"
-else: 
-    platform_name = "Check API Key, contact support."
-
-# Initialize the stripe client. 
-client = stripe.StripeClient(stripe.api_key)
+import stripe_local_store
+from stripe_data_sources import LiveStripeSource, LocalStoreSource, JsonReplaySource
+from stripe_fetch_executor import FetchExecutor
+from stripe_ndjson_export import export_objects_to_ndjson
+import report_periods
+from report_writer import create_report_sheet, write_report
+from report_cache import ReportCache
+from pipeline_metrics import timed
+from platform_context import create_all_platform_contexts, get_current_platform_context, run_in_platform_context
+
+# Configuration
+
+# Everything read from the .env file is set up by configure() on first use instead of at import, so the module can be imported by 
+# tests and long-running workers without loading .env, setting the Stripe key or creating log files. The main functions, 
+# get_data_source and get_platform_name configure it, the values below are None until then. 
+selected_platform = None
+data_source_selection = None
+platform_name = None
+stripe_api_base = None
+local_store_path = None
+report_output_format = None
+flags = None
+
+is_configured = False
+configuration_lock = threading.RLock()
+
+client_report_columns = ["platform", "customer_id", "email", "created"]
+charge_report_columns = ["platform", "charge_id", "status", "charge_date", "customer_id", "receipt_email", "description", "amount_captured"]
 
 # Feature Flags
 
@@ -53,6 +47,8 @@ class FeatureFlags:
         self.get_both_business_reports_enabled = os.getenv('GET_BOTH_BUSINESS_REPORTS_ENABLED', 'False').lower() in ('true', 't', '1')
         self.export_any_all_files_enabled = os.getenv('EXPORT_ANY_ALL_FILES_ENABLED', 'False').lower() in ('true', 't', '1')
         self.logging_enabled = os.getenv('LOGGING_ENABLED', 'False').lower() in ('true', 't', '1')
+        self.local_store_enabled = os.getenv('LOCAL_STORE_ENABLED', 'False').lower() in ('true', 't', '1')
+        self.report_cache_enabled = os.getenv('REPORT_CACHE_ENABLED', 'False').lower() in ('true', 't', '1')
             
     def is_get_both_business_reports_enabled(self):
         return self.get_both_business_reports_enabled
@@ -63,31 +59,186 @@ class FeatureFlags:
     def is_logging_enabled(self):
         return self.logging_enabled
 
-if __name__ == "__main__":
-    flags = FeatureFlags()
+    def is_local_store_enabled(self):
+        return self.local_store_enabled
 
-    if flags.is_logging_enabled():
+    def is_report_cache_enabled(self):
+        return self.report_cache_enabled
+
+def configure(force: bool = False) -> None:
+    """Loads the .env file and sets up the platform, the Stripe API settings, the feature flags and the file loggers. Runs once, later 
+        calls return straight away. 
+
+    Args:
+        force (bool, optional): read the environment again, ex. after changing it in a long-running worker. Defaults to False. 
+    """
+    global selected_platform, data_source_selection, platform_name, stripe_api_base, local_store_path, report_output_format, flags
+    global is_configured, data_source
+
+    with configuration_lock:
+        if is_configured and not force:
+            return
+
+        # Import .ENV details
+        load_dotenv()
+
+        # Set to either "kahunas" or "studiobookings"
+        selected_platform = os.getenv("PLATFORM")
+        logging.info(f"The selected platform is {selected_platform}. Proceeding with reports from {selected_platform}.")
+
+        stripe.api_version = os.getenv("STRIPE_API_VERSION")
+
+        # One of these needs to return True
+        is_run_from_json_enabled = os.getenv("RUN_FROM_JSON_ENABLED", 'False').lower() in ('true', 't', '1')
+        is_run_from_live_API_enabled = os.getenv("RUN_FROM_LIVE_API_ENABLED", 'False').lower() in ('true', 't', '1')
+
+        if is_run_from_json_enabled == True:
+            data_source_selection = "Local JSON"
+        elif is_run_from_live_API_enabled == True:
+            data_source_selection = "Live API"
+        else:
+            print("Check .env Feature Flag for data source selection.")
+            logging.info("Feature flag for data source (JSON/API) is incorrect. Please check .env file. Defaulting to the live API.")
+            data_source_selection = "Live API"
+
+        if (selected_platform or "").lower().strip() == "kahunas":
+            stripe.api_key = os.getenv("STRIPE_SECRET_API_KEY_KAHUNAS")
+            platform_name = "KAHUNAS"
+        elif (selected_platform or "").lower().strip() == "studiobookings":
+            stripe.api_key = os.getenv("STRIPE_SECRET_API_KEY_STUDIO_BOOKINGS")
+            platform_name = "STUDIO_BOOKINGS"
+        else: 
+            platform_name = "Check API Key, contact support."
+
+        # Point the API at another host, ex. the local fake_stripe_server used for benchmarks. 
+        stripe_api_base = os.getenv("STRIPE_API_BASE")
+        if stripe_api_base:
+            stripe.api_base = stripe_api_base
+
+        # Local store of Stripe objects, kept separately for each platform since the API keys point at different accounts.
+        local_store_path = os.getenv("STRIPE_LOCAL_STORE_PATH", f"{platform_name.lower()}_stripe_local_store.db")
+
+        # Format the main functions export reports in: xlsx, csv or parquet, see report_writer.
+        report_output_format = os.getenv("REPORT_OUTPUT_FORMAT", "xlsx").lower()
+
+        flags = FeatureFlags()
+        if flags.is_logging_enabled():
+            setup_file_loggers()
+
+        # A source created with the previous settings would keep reading from the previous platform. 
+        data_source = None
+        is_configured = True
+
+def get_flags() -> FeatureFlags:
+    """Returns the feature flags, configuring the module on first use. 
+
+    Returns:
+        FeatureFlags: flags read from the environment. 
+    """
+    configure()
+    return flags
+
+def print_feature_flags() -> None:
+    """Prints which feature flags are enabled."""
+    if get_flags().is_logging_enabled():
         print("Logging is enabled")
     else:
         print("Logging is disabled")
 
-    if flags.is_get_both_business_reports_enabled():
+    if get_flags().is_get_both_business_reports_enabled():
         print("Report downloading for Kahunas and StudioBookings is enabled.")
     else:
         print("Reporting downloading for Kahunas and StudioBookings is disabled.")
 
-    if flags.is_export_any_all_files_enabled():
+    if get_flags().is_export_any_all_files_enabled():
         print("Exporting of files of any type within any function is enabled.")
     else:
         print("Exporting of files of any type within any function is disabled.")
 
+    if get_flags().is_local_store_enabled():
+        print("Reports are read from the local Stripe store. Run main_sync_local_store to bring it up to date.")
+    else:
+        print("Reports are read from the live Stripe API.")
+
+
+# Report Cache
+
+# Results of the return_* functions, keyed by platform, data source and API version as well as the period, so results read from JSON
+# dumps or a stale local store are never served to live runs. Only live results for closed periods are kept for good, the store may not
+# be fully synced and the dumps may be incomplete. See report_cache for how closed periods, TTL and eviction are handled.
+report_cache = ReportCache(get_cache_context=lambda: (get_platform_name(), get_data_source().name, get_stripe_api_version()),
+                           enabled=lambda: get_flags().is_report_cache_enabled(), closed_data_sources=(LiveStripeSource.name,))
+
+
+# Platform Context
+
+def get_platform_name() -> str:
+    """Returns the name of the platform the report functions are reporting on: the current platform context when the report runs for 
+        several platforms (see platform_context), else the platform selected with PLATFORM. 
+
+    Returns:
+        str: ex. KAHUNAS
+    """
+    platform_context = get_current_platform_context()
+    if platform_context:
+        return platform_context.name
+    configure()
+    return platform_name
+
+
+def get_stripe_api_version() -> str:
+    """Returns the Stripe API version the report functions request: the current platform context's client version when the report runs
+        for several platforms, else STRIPE_API_VERSION. 
+
+    Returns:
+        str: ex. 2024-04-10
+    """
+    platform_context = get_current_platform_context()
+    if platform_context:
+        return platform_context.stripe_version
+    configure()
+    return stripe.api_version
+
+
+# Data Source
+
+data_source = None
+data_source_lock = threading.Lock()
+
+def get_data_source():
+    """Returns the data source the report functions read Stripe objects from, created on first use. 
+        Local JSON replays the dumps written by gather_stripe_reports without network calls. Live API reads from the local store instead
+        when LOCAL_STORE_ENABLED is set. Inside a platform context the data source of that platform is returned instead. 
+
+    Returns:
+        LiveStripeSource, LocalStoreSource or JsonReplaySource
+    """
+    global data_source
+    platform_context = get_current_platform_context()
+    if platform_context:
+        return platform_context.get_data_source()
+    configure()
+    # Report queries run concurrently, the lock keeps them from each creating a source. 
+    with data_source_lock:
+        if data_source is None:
+            if data_source_selection == "Local JSON":
+                data_source = JsonReplaySource()
+            elif get_flags().is_local_store_enabled():
+                data_source = LocalStoreSource(local_store_path)
+            else:
+                data_source = LiveStripeSource()
+            logger.info(f"Stripe data is read from the {data_source.name} data source.")
+    return data_source
+
 
 ## Main Functions ## 
 # Export Weekly Report Information to XLSX File
 
+@timed()
 def main_create_weekly_xlsx_report(start_date: int, end_date: int) -> None:
     """Creates a xlsx report showing new clients added and successful and failed charges for period provided. Reports out the previous period's numbers in addition. 
-        Created to show 14 day periods at a time. 
+        Created to show 14 day periods at a time. With GET_BOTH_BUSINESS_REPORTS_ENABLED both platforms are reported on concurrently
+        and merged into one report, every row tagged with its platform. 
     Args:
         start_date (int): YYYYMMDD
         end_date (int): YYYYMMDD
@@ -95,7 +246,7 @@ def main_create_weekly_xlsx_report(start_date: int, end_date: int) -> None:
     Returns:
         None
     """
-
+    configure()
     logger.debug("Creating the weekly XLSX report function has started.")
 
     # Convert start and end date to datetime objects. 
@@ -119,89 +270,213 @@ def main_create_weekly_xlsx_report(start_date: int, end_date: int) -> None:
     previous_end_date_str = previous_end_date.strftime("%Y%m%d")
 
 
-    # Run functions to get data. 
-    current_period_new_clients = return_list_of_clients(start_date, end_date)
-    previous_period_new_clients = return_list_of_clients(previous_start_date_str, previous_end_date_str)
-
-    current_period_new_charges = return_list_of_charges(start_date, end_date)
-    previous_period_new_charges = return_list_of_charges(previous_start_date_str, previous_end_date_str)
-
-    # Create clients DataFrames
-    df1 = pd.DataFrame(current_period_new_clients)
-    df1.loc["count_totals"] = df1.count()
-    df2 = pd.DataFrame(previous_period_new_clients)
-    df2.loc["count_totals"] = df2.count()
-    df3 = pd.DataFrame(current_period_new_charges)
-
-    try:
-        df3.loc["sum_totals"] = df3.sum()
-    except TypeError as e:
-        logger.debug(f"Error occurred with summing totals of df3. Data columns are not totaled if error occurs.  {e}")
-    
-    df4 = pd.DataFrame(previous_period_new_charges)
-    try:
-        df4.loc["sum_totals"] = df4.sum()
-    except TypeError as e:
-        logger.debug(f"Error occurred with summing totals of df4. Data columns are not totaled if error occurs.  {e}")    
+    if get_flags().is_get_both_business_reports_enabled():
+        # Each platform has its own StripeClient, data source and rate limiters, so both are fetched at the same time and the combined
+        # report takes about as long as the slower platform. 
+        platform_contexts = create_all_platform_contexts(data_source_selection=data_source_selection, 
+                                                         local_store_enabled=get_flags().is_local_store_enabled(), api_base=stripe_api_base)
+        if not platform_contexts:
+            logger.info("No platform has an API key configured, the combined weekly report was not created.")
+            return
+        platform_report_data = FetchExecutor(max_workers=len(platform_contexts)).run({
+            platform_context.name: (run_in_platform_context, (platform_context, gather_weekly_report_data, start_date, end_date, 
+                                                              previous_start_date_str, previous_end_date_str))
+            for platform_context in platform_contexts
+        })
+        report_platform_name = "ALL_PLATFORMS"
+    else:
+        platform_report_data = {
+            platform_name: gather_weekly_report_data(start_date, end_date, previous_start_date_str, previous_end_date_str),
+        }
+        report_platform_name = platform_name
 
     cur_date_for_file_name = str(start_date) + '_to_' + str(end_date)
     prev_date_for_file_name = previous_start_date_str + '_to_' + previous_end_date_str
 
-    if flags.is_export_any_all_files_enabled():
-        with pd.ExcelWriter((cur_date_for_file_name+'_'+platform_name+'_'+'weekly_report'+'.xlsx'), engine='xlsxwriter') as writer:
-            df1.to_excel(writer, 
-                        sheet_name=cur_date_for_file_name + 'ccl',
-                        )
-            df2.to_excel(writer,
-                        sheet_name=prev_date_for_file_name + 'pcl',
-                        )
-            df3.to_excel(writer,
-                        sheet_name=cur_date_for_file_name + 'cch',
-                        )
-            df4.to_excel(writer,
-                        sheet_name=prev_date_for_file_name + 'pch',
-                        )
+    def platform_rows(data_name):
+        # Client rows start with their platform already, charge rows are tagged with it here. 
+        for report_platform, report_data in platform_report_data.items():
+            for row in report_data[data_name]:
+                yield [report_platform] + list(row.values()) if isinstance(row, dict) else row
+
+    if get_flags().is_export_any_all_files_enabled():
+        # Rows are streamed to the output and totals are computed on the typed columns, see report_writer. 
+        write_report([
+            create_report_sheet(cur_date_for_file_name + 'ccl', client_report_columns, platform_rows("current_clients"), totals="count"),
+            create_report_sheet(prev_date_for_file_name + 'pcl', client_report_columns, platform_rows("previous_clients"), totals="count"),
+            create_report_sheet(cur_date_for_file_name + 'cch', charge_report_columns, platform_rows("current_charges"), 
+                                totals="sum", numeric_columns=["amount_captured"]),
+            create_report_sheet(prev_date_for_file_name + 'pch', charge_report_columns, platform_rows("previous_charges"), 
+                                totals="sum", numeric_columns=["amount_captured"]),
+            create_report_sheet(cur_date_for_file_name + 'cdp', client_report_columns, platform_rows("current_duplicates")),
+        ], cur_date_for_file_name+'_'+report_platform_name+'_'+'weekly_report', report_output_format)
     else:
         logger.info("Exporting of files of any type within any functions is disabled. Check feature flag.")
 
-# Download all stripe reports to JSON format. 
+@timed()
+def gather_weekly_report_data(start_date: int, end_date: int, previous_start_date: int, previous_end_date: int) -> dict:
+    """Fetches the clients and charges of the current and previous period for the weekly report, from the current platform. The four 
+        queries are independent so they are fetched concurrently. 
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+        previous_start_date (int): YYYYMMDD
+        previous_end_date (int): YYYYMMDD
 
-def gather_stripe_reports(start_date: int, end_date: int) -> json:
-    """Creates local JSON files for a list of customers, payment intents, and events that occurred within the provided date ranges, inclusive. 
+    Returns:
+        dict: current_clients, current_duplicates, previous_clients, current_charges and previous_charges. 
+    """
+    report_data = FetchExecutor().run({
+        "current_clients": (return_list_of_clients_and_duplicates, (start_date, end_date)),
+        "previous_clients": (return_list_of_clients, (previous_start_date, previous_end_date)),
+        "current_charges": (return_list_of_charges, (start_date, end_date)),
+        "previous_charges": (return_list_of_charges, (previous_start_date, previous_end_date)),
+    })
+    report_data["current_clients"], report_data["current_duplicates"] = report_data["current_clients"]
+    return report_data
+
+# Export a trend report over any number of periods to XLSX File
+
+@timed()
+def main_create_period_trend_report(end_date: int, period_type: str = "biweekly", period_count: int = 12) -> pd.DataFrame:
+    """Creates a report of new clients and charges over period_count periods ending on end_date, with the change from each period to the 
+        next. The customers and charges of the whole range are fetched once and bucketed into the periods, so a 12 period report costs 
+        about the same Stripe requests as a single period. 
+    Args:
+        end_date (int): YYYYMMDD end of the latest period. 
+        period_type (str, optional): weekly, biweekly, monthly or trailing_12_months. Defaults to "biweekly". 
+        period_count (int, optional): number of periods. Defaults to 12. 
+
+    Returns:
+        pd.DataFrame: one row per period, oldest first, see report_periods.build_period_report. 
+    """
+    configure()
+    logger.debug(f"Creating the {period_count} period {period_type} trend report ending {end_date} has started.")
+    periods = report_periods.build_periods(end_date, period_type, period_count)
+    union_start_epoch = int(periods["start_epoch"].min())
+    union_end_epoch = int(periods["end_epoch"].max())
+
+    report_data = FetchExecutor().run({
+        "customers": (return_objects_created_between, ("customers", union_start_epoch, union_end_epoch)),
+        "charges": (return_objects_created_between, ("charges", union_start_epoch, union_end_epoch)),
+    })
+    customers = pd.DataFrame(
+        [{"created": customer.get("created"), "email_key": normalize_email(customer.get("email"))} for customer in report_data["customers"]],
+        columns=["created", "email_key"],
+    )
+    charges = pd.DataFrame(
+        [{"created": charge.get("created"), "status": charge.get("status"), "amount": charge.get("amount"), 
+          "amount_captured": charge.get("amount_captured")} for charge in report_data["charges"]],
+        columns=["created", "status", "amount", "amount_captured"],
+    )
+    period_report = report_periods.build_period_report(customers, charges, periods)
+
+    if get_flags().is_export_any_all_files_enabled():
+        file_name = str(end_date) + '_' + str(period_count) + '_' + period_type + '_' + get_platform_name() + '_' + 'trend_report'
+        report_values = period_report.astype(object).where(period_report.notna(), None)
+        write_report([
+            create_report_sheet('trend', list(period_report.columns), report_values.itertuples(index=False, name=None), 
+                                numeric_columns=list(period_report.columns[1:])),
+        ], file_name, report_output_format)
+    else:
+        logger.info("Exporting of files of any type within any functions is disabled. Check feature flag.")
+    return period_report
+
+@timed()
+def return_objects_created_between(object_type: str, start_epoch: int, end_epoch: int) -> list:
+    """Returns every object of the type created strictly between the two epoch times. 
 
     Args:
-        start_date (int): YYYYMMDD
-        end_date (int): YYYYMMDD, must be greater than the start date.  
+        object_type (str): customers, charges, payment_intents or subscriptions. 
+        start_epoch (int): exclusive lower bound on created. 
+        end_epoch (int): exclusive upper bound on created. 
 
     Returns:
-        json: JSON file to cwd. 
+        list: Stripe objects in Stripe order (newest first). 
     """
+    return list(get_data_source().search_objects(object_type, start_epoch, end_epoch))
 
-    # Get a list of all customer accounts. 
-    customer_list = stripe.Customer.list(limit=100)
-    full_customer_list = []
-    
-    # The below iterates through all the pages within the API to get all accounts. 
-    for customer in customer_list.auto_paging_iter():
-        full_customer_list.append(customer)
-    with open(f"{start_date}-{end_date}_customer_list.json", "w") as write_file:
-        json.dump(full_customer_list, write_file)
+# Export every charge of a period, streamed so long periods fit in a fixed amount of memory
 
+@timed()
+def main_export_charges_report(start_date: int, end_date: int, output_format: str = None) -> list:
+    """Exports the charges that occurred between the provided dates. The charges are streamed from the search into the output file 
+        without being collected in a list first, so a yearly export uses the same memory as a weekly one. 
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+        output_format (str, optional): xlsx, csv or parquet. Defaults to REPORT_OUTPUT_FORMAT or xlsx. 
 
-    # Get a list of the payment intents. 
-    payment_intents = stripe.PaymentIntent.list()
-    with open(f"{start_date}-{end_date}_payment_intents_list.json", "w") as write_file:
-        json.dump(payment_intents, write_file)
+    Returns:
+        list: paths of the written files. 
+    """
+    configure()
+    date_for_file_name = str(start_date) + '_to_' + str(end_date)
+    return write_report([
+        create_report_sheet('charges', charge_report_columns, ([get_platform_name()] + list(charge.values()) for charge in iterate_charges(start_date, end_date)), 
+                            totals="sum", numeric_columns=["amount_captured"]),
+    ], date_for_file_name+'_'+get_platform_name()+'_'+'charges_report', output_format or report_output_format)
+
+# Download all stripe reports to NDJSON format. 
+
+@timed()
+def gather_stripe_reports(start_date: int, end_date: int) -> dict:
+    """Exports the customers, charges, payment intents, subscriptions and events created within the provided date range, inclusive, to
+    {start_date}-{end_date}_<type>_list.ndjson.gz files in cwd. Objects are written as they arrive, one JSON object per line, following
+    every page. Re-running after an interruption resumes after the last written object. 
+        The exports can be replayed by the reports with RUN_FROM_JSON_ENABLED. 
 
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD, must be greater than the start date.  
 
-    # Get a list of the events. 
-    events = stripe.Event.list(limit = 100)
-    with open(f"{start_date}-{end_date}_events_list.json", "w") as write_file:
-        json.dump(events, write_file)
+    Returns:
+        dict: number of objects written per export during this run. 
+    """
+    configure()
+    conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
+    # The end date is inclusive, so everything before the following midnight is exported. 
+    conv_end_date = int((datetime.strptime(str(end_date), "%Y%m%d") + timedelta(days=1)).timestamp())
+    created_range = {"gte": conv_start_date, "lt": conv_end_date}
+
+    export_tasks = {}
+    for export_name, resource, list_params in (
+        ("customer_list", stripe.Customer, {}),
+        ("charges_list", stripe.Charge, {}),
+        ("payment_intents_list", stripe.PaymentIntent, {}),
+        # Subscriptions list only returns active ones by default. 
+        ("subscriptions_list", stripe.Subscription, {"status": "all"}),
+        ("events_list", stripe.Event, {}),
+    ):
+        file_path = f"{start_date}-{end_date}_{export_name}.ndjson.gz"
+        export_tasks[export_name] = (export_objects_to_ndjson, (resource, file_path), dict(created=created_range, **list_params))
+
+    # The exports are independent and are downloaded concurrently. 
+    export_counts = FetchExecutor().run(export_tasks)
+    logger.info(f"Stripe exports for {start_date}-{end_date} written: {export_counts}")
+    return export_counts
+
+
+# Keep the local Stripe store current.
+
+@timed()
+def main_sync_local_store() -> dict:
+    """Fetches the Stripe objects created or updated since the last sync into the local store. Run before generating reports with
+    LOCAL_STORE_ENABLED set. The first run downloads the full account history.
+
+    Returns:
+        dict: count of objects written per table. 
+    """
+    configure()
+    sync_counts = stripe_local_store.sync_local_store(local_store_path)
+    logger.info(f"Local store at {local_store_path} has been synced: {sync_counts}")
+    return sync_counts
     
 
 # Return information from Stripe via Search
 
+@timed()
+@report_cache.cached
 def return_list_of_customer_ids(start_date: int = 20200101, end_date: int = 20241230) -> list:
     """Returns a list of customer IDs only. 
 
@@ -215,17 +490,18 @@ def return_list_of_customer_ids(start_date: int = 20200101, end_date: int = 2024
     # Date range is left wide open to create a list of all customer ID's. Range can be narrowed to a recent window for greater specificity. 
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
-    date_range_query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date))
-    customer_id_results= stripe.Customer.search(query=date_range_query)
+    customer_id_results = get_data_source().search_objects("customers", conv_start_date, conv_end_date)
 
     customer_id_list = []
 
-    for customer in customer_id_results.auto_paging_iter():
+    for customer in customer_id_results:
         customer_id = customer.get("id")
         customer_id_list.append(customer_id)
 
     return customer_id_list
 
+@timed()
+@report_cache.cached
 def return_list_of_customer_emails(start_date: int = 20200101, end_date: int = 20241230) -> list:
     """Returns a list of customer emails only. 
 
@@ -240,21 +516,20 @@ def return_list_of_customer_emails(start_date: int = 20200101, end_date: int = 2
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
     
-    # Creates a query to pass to stripe.
-    date_range_query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date))
-    logging.debug(f"The query passed to stripe for customer email request is: {date_range_query}.")
+    logging.debug(f"Customer emails are requested for customers created between {conv_start_date} and {conv_end_date}.")
 
-    customer_email_results= stripe.Customer.search(query=date_range_query)
+    customer_email_results = get_data_source().search_objects("customers", conv_start_date, conv_end_date)
 
     customer_email_list = []
 
-    for customer in customer_email_results.auto_paging_iter():
+    for customer in customer_email_results:
         customer_email = customer.get("email")
         customer_email_list.append(customer_email)
 
     return customer_email_list
 
-def get_customer_email_data(start_date=20200101, end_date=20241230, email_list=None) -> list:
+@timed()
+def get_customer_email_data(start_date=20200101, end_date=20241230, email_list=None, bulk_resolve=True) -> list:
     """Performs a query on the specific email list requested. A custom list can be provided, else a list of emails captured between the provided dates will be fetched using the return_list_of_customer_emails function. 
         Custom date range should be provided if defaulting to calling upon teh return_list_of_customer_emails function.
 
@@ -262,6 +537,8 @@ def get_customer_email_data(start_date=20200101, end_date=20241230, email_list=N
         start_date (int, optional): YYYYMMDD
         end_date (int, optional): YYYYMMDD
         email_list (list, optional): list
+        bulk_resolve (bool, optional): resolve every email against one in-memory index built from a single customer list sweep (or the local store)
+            instead of one Stripe search per email. Defaults to True.
 
     Returns:
         list: _description_
@@ -272,10 +549,15 @@ def get_customer_email_data(start_date=20200101, end_date=20241230, email_list=N
     elif email_list != None:
         email_list = email_list
 
+    if bulk_resolve:
+        customer_email_index = return_customer_email_index()
+
     customer_details_list = []
     for customer_email in email_list:
-        query = ("email:" + "'" + customer_email + "'")
-        search_result = stripe.Customer.search(query=query)
+        if bulk_resolve:
+            search_result = customer_email_index.get(normalize_email(customer_email), [])
+        else:
+            search_result = get_data_source().search_customers_by_email(customer_email)
         indv_details = []
         for data in search_result:
             customer_id = data.get("id")
@@ -287,6 +569,33 @@ def get_customer_email_data(start_date=20200101, end_date=20241230, email_list=N
             customer_details_list.append(indv_details)   
     return customer_details_list
 
+@timed()
+def return_customer_email_index() -> dict:
+    """Returns an index of every customer keyed by normalized email. Built from one paginated sweep of the customer list, or from the
+    local store when it is enabled. 
+
+    Returns:
+        dict: {normalized email: [customer, ...]}, customers sharing an email are kept in the order Stripe returned them (newest first). 
+    """
+    customers = get_data_source().list_objects("customers")
+    return build_customer_email_index(customers)
+
+def build_customer_email_index(customers) -> dict:
+    """Groups customers by normalized email in a single pass. 
+
+    Args:
+        customers (iterable): Stripe customer objects or dictionaries with an "email" key.
+
+    Returns:
+        dict: {normalized email: [customer, ...]}
+    """
+    customer_email_index = {}
+    for customer in customers:
+        customer_email_index.setdefault(normalize_email(customer.get("email")), []).append(customer)
+    return customer_email_index
+
+@timed()
+@report_cache.cached
 def return_payment_intents(start_date: int, end_date: int) -> list:
     """_summary_ Returns a list of dictionaries. Each dictionary is a payment intent made by a single customer. 
 
@@ -301,13 +610,11 @@ def return_payment_intents(start_date: int, end_date: int) -> list:
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
 
-    date_range_query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date))
-    payment_intent_results= stripe.PaymentIntent.search(query=date_range_query)
-    pprint(payment_intent_results, indent=4)
+    payment_intent_results = get_data_source().search_objects("payment_intents", conv_start_date, conv_end_date)
     
     p_intent_dict_list = []
 
-    for event in payment_intent_results["data"]:
+    for event in payment_intent_results:
         created_date = event.get("created")
         if conv_start_date <= created_date and conv_end_date >= created_date:
             cust_id = event.get("customer")
@@ -322,7 +629,7 @@ def return_payment_intents(start_date: int, end_date: int) -> list:
             'created' : created_date,
             'created_readable' : created_human_readable,
             'amount_received': convert_cents_to_dollars(amount_received),
-            'platform': platform_name
+            'platform': get_platform_name()
             }
 
             p_intent_dict = {}
@@ -335,19 +642,24 @@ def return_payment_intents(start_date: int, end_date: int) -> list:
     pprint(p_intent_dict_list, indent=4)
     return p_intent_dict_list
 
-def return_total_clients(start_date: int, end_date: int) -> int:
+@timed()
+def return_total_clients(start_date: int, end_date: int, customer_list: list = None) -> int:
     """Returns the quantity of clients created within the specified period. 
 
     Args:
         start_date (int): YYYYMMDD start date of the period. 
         end_date (int): YYYYMMDD end date of the period. 
+        customer_list (list, optional): already deduplicated client list for the period, from return_list_of_clients_and_duplicates. 
+            Fetched when not provided. 
 
     Returns:
         int: quantity of accounts created within the period. Duplicates removed. Checks for duplicates by email address. 
     """
-    customer_list = return_list_of_clients(start_date, end_date)
+    if customer_list is None:
+        customer_list = return_list_of_clients(start_date, end_date)
     return (len(customer_list))
 
+@timed()
 def return_list_of_clients(start_date: int, end_date: int) -> list:
     """Returns a list of clients created within the specified period with date created, customer id, and a platform_name identification.. 
 
@@ -358,34 +670,63 @@ def return_list_of_clients(start_date: int, end_date: int) -> list:
     Returns:
         list: list of accounts created within the period. Duplicates removed. Checks for duplicates by email address. 
     """
-    
+    customer_list, duplicate_accounts = return_list_of_clients_and_duplicates(start_date, end_date)
+    return customer_list
+
+@timed()
+@report_cache.cached
+def return_list_of_clients_and_duplicates(start_date: int, end_date: int) -> tuple:
+    """Returns the deduplicated client list for the period together with the accounts that were removed as duplicates. 
+
+    Args:
+        start_date (int): YYYYMMDD start date of the period. 
+        end_date (int): YYYYMMDD end date of the period. 
+
+    Returns:
+        tuple: (customer_list, duplicate_accounts), see deduplicate_clients_by_email. 
+    """
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
 
-    date_range_query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date))
-    customer_search_results = stripe.Customer.search(query=date_range_query)
+    customer_search_results = get_data_source().search_objects("customers", conv_start_date, conv_end_date)
 
+    return deduplicate_clients_by_email(customer_search_results)
+
+def deduplicate_clients_by_email(customers) -> tuple:
+    """Removes customer accounts sharing an email address in a single pass. The first account seen for an email is kept, Stripe returns
+    the newest first. 
+
+    Args:
+        customers (iterable): Stripe customer objects or dictionaries. 
+
+    Returns:
+        tuple: (customer_list, duplicate_accounts). Both are lists of [platform_name, customer_id, email, created_date]. duplicate_accounts
+            holds the accounts that were dropped because their normalized email was already kept. 
+    """
     customer_list = []
-    unique_email_list = []
     duplicate_accounts = []
+    unique_emails = set()
+    customer_platform_name = get_platform_name()
 
-    for customer in customer_search_results.auto_paging_iter():
-        customer_id = customer.get("id")
+    for customer in customers:
         customer_email = customer.get("email")
-        created_date = convert_epoch_unix_to_human_readable(customer.get("created"))
-        customer_info = []
-        if customer_email not in unique_email_list:
-            unique_email_list.append(customer_email)
-            customer_info.append(platform_name)
-            customer_info.append(customer_id)
-            customer_info.append(customer_email)
-            customer_info.append(created_date)
+        customer_info = [
+            customer_platform_name,
+            customer.get("id"),
+            customer_email,
+            convert_epoch_unix_to_human_readable(customer.get("created")),
+        ]
+        normalized_email = normalize_email(customer_email)
+        if normalized_email in unique_emails:
+            duplicate_accounts.append(customer_info)
+        else:
+            unique_emails.add(normalized_email)
             customer_list.append(customer_info)
-        if customer_email in unique_email_list:
-            duplicate_accounts.append(customer_email)
-    return customer_list
+    return customer_list, duplicate_accounts
 
-def return_list_of_charges_by_customer(start_date: int, end_date: int, customer_id: str) -> list:
+@timed()
+@report_cache.cached
+def return_list_of_charges_by_customer(start_date: int, end_date: int, customer_id: str = None) -> list:
     """Returns a list of one or multiple dictionaries dependent on whether a customer_id is supplied. If a customer_id is not supplied, the function will capture
     all charge events within the specified start/end date windows. If a customer_id is supplied, it will return the charge events for that customer. 
 
@@ -400,106 +741,100 @@ def return_list_of_charges_by_customer(start_date: int, end_date: int, customer_
         {   'customer_email: 'john.doe@gmail.com',
             'customer_id': 'cus_123abc',
             'successful_charges': [ (charge_id, timestamp, attempted_amount, collected_amount)],
-            'failed_charges': [same as above, if any. If no failures, this k/v paire does not exist.]}
+            'failed_charges': [same as above, if any. If no failures, this k/v paire does not exist.],
+            'charge_count': 3, 'successful_count': 2, 'failed_count': 1, 'failure_rate': 0.33,
+            'total_attempted': 150.0, 'total_collected': 100.0}
     """
 
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
 
-    customer_charges_list = []
-    customer_id_list = []
+    charges_search_results = get_data_source().search_objects("charges", conv_start_date, conv_end_date, customer_id=customer_id)
 
-    if not customer_id:
-        query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date)) 
-        charges_search_results= stripe.Charge.search(query=query, limit=100)
-
-        # Creates a list to iterate through. 
-        for charge_event in charges_search_results["data"]:
-            customer_id = charge_event.get("customer")
-            if customer_id not in customer_id_list:
-                customer_id_list.append(customer_id)
-
-
-        # Iterates through the customer ID list and takes that customer ID to look for instances in the query where charge events match the customer ID. 
-        for cust_id in customer_id_list: 
-            list_of_successful_tuples = []
-            list_of_failed_tuples = []
-            customer_charges = {}
-            for charge_event in charges_search_results["data"]:
-                if cust_id == charge_event.get("customer"):
-                    customer_charges["customer_id"] = charge_event.get("customer")
-                    customer_charges["customer_email"] = charge_event.get("receipt_email")
-                    if charge_event.get("status"):
-                        if charge_event.get("status") == "succeeded":
-                            success_tuple_of_charge = (
-                                    charge_event.get("id"),
-                                    convert_epoch_unix_to_human_readable(charge_event.get("created")),
-                                    convert_cents_to_dollars(charge_event.get("amount")),
-                                    convert_cents_to_dollars(charge_event.get("amount_captured"))
-                                )
-                            list_of_successful_tuples.append(success_tuple_of_charge)
-                            customer_charges["successful_charges"] = list_of_successful_tuples
-                        if charge_event.get("status") == "failed":
-                            fail_tuple_of_charge = (
-                                charge_event.get("id"),
-                                convert_epoch_unix_to_human_readable(charge_event.get("created")),
-                                convert_cents_to_dollars(charge_event.get("amount")),
-                                convert_cents_to_dollars(charge_event.get("amount_captured"))
-                            )
-                            list_of_failed_tuples.append(fail_tuple_of_charge)
-                            customer_charges["failed_charges"] = list_of_failed_tuples
-            customer_charges_list.append(customer_charges)
-        return customer_charges_list
+    customer_charges_list = group_charges_by_customer(charges_search_results)
 
+    # A single customer always reports both charge lists, even when one of them is empty. 
+    if customer_id:
+        if not customer_charges_list:
+            return [{"customer_id": customer_id}]
+        customer_charges_list[0].setdefault("successful_charges", [])
+        customer_charges_list[0].setdefault("failed_charges", [])
+    return customer_charges_list
 
-    else:
-        query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date) + " AND " + "customer:" + "'" + customer_id + "'")
-        charges_search_results= stripe.Charge.search(query=query)
-        customer_charges["customer_id"] = customer_id
-        customer_charges["customer_email"] = charges_search_results["data"][0].get("receipt_email")
-        customer_charges = {}
-        list_of_successful_tuples = []
-        list_of_failed_tuples = []
-        for charge in charges_search_results["data"]:
-            if charge.get("status") == "succeeded":
-                tuple_of_charges = (
-                    charge.get("id"),
-                    convert_epoch_unix_to_human_readable(charge.get("created")),
-                    convert_cents_to_dollars(charge.get("amount")),
-                    convert_cents_to_dollars(charge.get("amount_captured"))
-                )
-                list_of_successful_tuples.append(tuple_of_charges)
-            customer_charges["successful_charges"] = list_of_successful_tuples
-
-            if charge.get("status") == "failed":
-                tuple_of_charges = (
-                    charge.get("id"),
-                    convert_epoch_unix_to_human_readable(charge.get("created")),
-                    convert_cents_to_dollars(charge.get("amount")),
-                    convert_cents_to_dollars(charge.get("amount_captured"))
-                )
-                list_of_failed_tuples.append(tuple_of_charges)
-            customer_charges["failed_charges"] = list_of_failed_tuples
-        customer_charges_list.append(customer_charges)
-        return customer_charges_list
+def group_charges_by_customer(charge_events) -> list:
+    """Groups charge events by customer in a single pass over the charges, so it can consume a streamed search without holding it in memory. 
+    Per-customer counts, totals and failure rate are kept alongside the charge tuples. 
+
+    Args:
+        charge_events (iterable): Stripe charge objects or dictionaries. 
+
+    Returns:
+        list: one dictionary per customer in order of first appearance, see return_list_of_charges_by_customer for the structure. 
+    """
+    grouped_charges = {}
+    for charge_event in charge_events:
+        cust_id = charge_event.get("customer")
+        customer_charges = grouped_charges.get(cust_id)
+        if customer_charges is None:
+            customer_charges = {
+                "customer_id": cust_id,
+                "customer_email": None,
+                "charge_count": 0,
+                "successful_count": 0,
+                "failed_count": 0,
+                "total_attempted": 0.0,
+                "total_collected": 0.0,
+            }
+            grouped_charges[cust_id] = customer_charges
+        customer_charges["customer_email"] = charge_event.get("receipt_email")
+        customer_charges["charge_count"] += 1
+        customer_charges["total_attempted"] += convert_cents_to_dollars(charge_event.get("amount") or 0)
+
+        if charge_event.get("status") == "succeeded":
+            customer_charges.setdefault("successful_charges", []).append(create_charge_tuple(charge_event))
+            customer_charges["successful_count"] += 1
+            customer_charges["total_collected"] += convert_cents_to_dollars(charge_event.get("amount_captured") or 0)
+        elif charge_event.get("status") == "failed":
+            customer_charges.setdefault("failed_charges", []).append(create_charge_tuple(charge_event))
+            customer_charges["failed_count"] += 1
+
+    for customer_charges in grouped_charges.values():
+        customer_charges["failure_rate"] = customer_charges["failed_count"] / customer_charges["charge_count"]
+    return list(grouped_charges.values())
+
+def create_charge_tuple(charge_event: dict) -> tuple:
+    """Returns the (charge_id, timestamp, attempted_amount, collected_amount) tuple used in the per-customer charge lists. 
+
+    Args:
+        charge_event (dict): Stripe charge object. 
 
+    Returns:
+        tuple: (charge_id, YYYY-MM-DD HH:MM:SS, attempted dollars, collected dollars)
+    """
+    return (
+        charge_event.get("id"),
+        convert_epoch_unix_to_human_readable(charge_event.get("created")),
+        convert_cents_to_dollars(charge_event.get("amount")),
+        convert_cents_to_dollars(charge_event.get("amount_captured"))
+    )
+
+@timed()
+@report_cache.cached
 def return_total_of_charges_list(start_date: int, end_date: int) -> float:
     """Returns a float value of the total charges for a list of customers 
 
     Args:
-        start_date (int): _description_
-        end_date (int): _description_
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
 
     Returns:
-        float: _description_
+        float: total dollars collected from successful charges within the period. 
     """
     payments_list = return_list_of_charges_by_customer(start_date, end_date)
-    total_revenue = 0
-    for charge in payments_list:
-        if type(charge[5]) == float or int:
-            total_revenue += charge[5]
-    return total_revenue
+    return sum(customer_charges["total_collected"] for customer_charges in payments_list)
 
+@timed()
+@report_cache.cached
 def return_list_of_charges(start_date: int, end_date: int) -> list:
     """Retruns of list of charges that occurred between the provided dates. 
 
@@ -510,15 +845,25 @@ def return_list_of_charges(start_date: int, end_date: int) -> list:
     Returns:
         list: list
     """
+    return list(iterate_charges(start_date, end_date))
+
+def iterate_charges(start_date: int, end_date: int):
+    """Yields the charges that occurred between the provided dates one at a time, following every page of the search. Use this instead of
+    return_list_of_charges when aggregating over long periods so the full result set is never held in memory. 
+
+    Args:
+        start_date (int): YYYYMMDD
+        end_date (int): YYYYMMDD
+
+    Yields:
+        dict: charge_id, status, charge_date, customer_id, receipt_email, description, amount_captured
+    """
     conv_start_date = int(convert_datetime_to_epoch_unix(start_date))
     conv_end_date = int(convert_datetime_to_epoch_unix(end_date))
-    list_of_charges = []
-    query = ("created<" + str(conv_end_date) + " AND " + "created>" + str(conv_start_date)) 
-    charges_search_results= stripe.Charge.search(query=query, limit=100)
+    charges_search_results = get_data_source().search_objects("charges", conv_start_date, conv_end_date)
 
-    for charge_event in charges_search_results["data"]:
+    for charge_event in charges_search_results:
         indv_charge_dict = {}
-        charge_event.get("customer")
         indv_charge_dict["charge_id"] = charge_event.get("id")
         indv_charge_dict["status"] = charge_event.get("status")
         indv_charge_dict["charge_date"] = convert_epoch_unix_to_human_readable(charge_event.get("created"))
@@ -526,19 +871,17 @@ def return_list_of_charges(start_date: int, end_date: int) -> list:
         indv_charge_dict["receipt_email"] = charge_event.get("receipt_email")
         indv_charge_dict["description"] = charge_event.get("description")
         indv_charge_dict["amount_captured"] = convert_cents_to_dollars(charge_event.get("amount_captured"))
-        list_of_charges.append(indv_charge_dict)
-
-    return list_of_charges
+        yield indv_charge_dict
 
+@timed()
 def return_list_of_expiring_subscriptions() -> list:
     """Returns a list of subscriptions with their expiration dates.  
 
     Returns:
         list: list
     """
-    subscription_list = stripe.Subscription.list(limit=100)
     expiring_subscriptions = []
-    for i in subscription_list.auto_paging_iter():  
+    for i in get_data_source().list_objects("subscriptions"):  
         indv_sub_details = {}
         indv_sub_details["customer_id"] = i.get("customer")
         indv_sub_details["current_period_start"] = i.get("current_period_start")
@@ -586,6 +929,20 @@ def convert_epoch_unix_to_human_readable(epoch_date: int) -> datetime:
     return datetime.fromtimestamp(epoch_date).strftime('%Y-%m-%d %H:%M:%S')
 
 
+def normalize_email(email: str) -> str:
+    """Normalizes an email address for comparisons. Stripe treats emails as case-insensitive. 
+
+    Args:
+        email (str): email address, may be None. 
+
+    Returns:
+        str: lowercased email without surrounding whitespace, None if no email was provided. 
+    """
+    if email is None:
+        return None
+    return email.strip().lower()
+
+
 # Validation Functions
 
 def is_valid_date(date:int) -> bool:
@@ -628,13 +985,23 @@ def setup_logger(name, log_file, level=logging.DEBUG):
 
     return logger
 
-if flags.is_logging_enabled() == True:
+def setup_file_loggers() -> None:
+    """Adds the log files to the loggers, called by configure when LOGGING_ENABLED is set. Loggers that already write to a file are 
+        left as they are, so configuring again does not duplicate every line. 
+    """
+    if logger.handlers:
+        return
     log_dir = os.getenv("LOGGING_DIR")
-    logger = setup_logger("logger", f"{log_dir}logging.log", logging.DEBUG)
+    setup_logger("logger", f"{log_dir}logging.log", logging.DEBUG)
     logger.debug("Initial loogging file has been created.")
 
-    file_error_logger = setup_logger("file_error_logger", f"{log_dir}file_error_log_list.log", logging.DEBUG)
+    setup_logger("file_error_logger", f"{log_dir}file_error_log_list.log", logging.DEBUG)
     file_error_logger.debug("File error logger file has been initiated.")
-    
-else:
-    print(f"Logging feature flag turned off. Review the .env file and set to true to enable logging.")
\ No newline at end of file
+
+# Loggers without handlers until logging is configured, so the functions can be called when logging is off. 
+logger = logging.getLogger("logger")
+file_error_logger = logging.getLogger("file_error_logger")
+
+
+if __name__ == "__main__":
+    print_feature_flags()
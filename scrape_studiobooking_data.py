@@ -4,16 +4,33 @@ import os
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 
+from studiobooking_downloader import create_member_report_url, create_session_from_driver, download_member_reports
+from studiobooking_manifest import download_changed_member_reports
+from pipeline_metrics import increment, span, timed
 
-# Import environment varibales for logging in
 
-gym_name = str(os.getenv("SB_GYM_NAME"))
-login_name = os.getenv("SB_USERNAME")
-password = os.getenv("SB_PASSWORD")
-login_url = os.getenv("SB_LOGIN_URL")
-driver = webdriver.Chrome()
+# Scrapes the member credit reports from StudioBookings. Nothing runs at import: the settings are read and Chrome is started when 
+# main_scrape_member_reports is called, so the helpers can be imported without a browser. 
+#   python scrape_studiobooking_data.py --first-member-id 1 --last-member-id 642
 
+def get_scraper_settings() -> dict:
+    """Reads the login and download settings from the environment. 
 
+    Returns:
+        dict: gym_name, login_name, password, login_url, http_downloader_enabled, download_dir and incremental_enabled. 
+    """
+    return {
+        # Import environment varibales for logging in
+        "gym_name": str(os.getenv("SB_GYM_NAME")),
+        "login_name": os.getenv("SB_USERNAME"),
+        "password": os.getenv("SB_PASSWORD"),
+        "login_url": os.getenv("SB_LOGIN_URL"),
+        # Download the reports over HTTP with the login session instead of having Chrome visit every URL.
+        "http_downloader_enabled": os.getenv("SB_HTTP_DOWNLOADER_ENABLED", "False").lower() in ('true', 't', '1'),
+        "download_dir": os.getenv("SB_DOWNLOAD_DIR", "studiobooking_downloads"),
+        # Only record new or changed reports in the manifest and discover new member IDs instead of using a fixed range. Requires the HTTP downloader.
+        "incremental_enabled": os.getenv("SB_INCREMENTAL_ENABLED", "False").lower() in ('true', 't', '1'),
+    }
 
 
 def create_num_list(num1:int, num2:int) -> list:
@@ -36,34 +53,95 @@ def create_num_list(num1:int, num2:int) -> list:
             num1 += 1
         return num_list
 
-# Create the numbered list. 
-num_list = create_num_list(1, 642)
-
-url_list = []
+def create_member_report_urls(gym_name: str, num_list: list) -> list:
+    """Create the URL strings to download each report. 
+        https://studiobookingonline.com/[gym_name]/excelreport/member-creditreport/client_id/[client_id]/excelexport/true
 
+    Args:
+        gym_name (str): gym name used in StudioBookings URLs. 
+        num_list (list): member ID numbers. 
 
-# Create the URL strings to download each report. 
-
-# https://studiobookingonline.com/[gym_name]/excelreport/member-creditreport/client_id/[client_id]/excelexport/true
-
-for i in num_list:
-    url_string="https://studiobookingonline.com/" + gym_name + "/excelreport/member-creditreport/client_id/" + str(i) + "/excelexport/true"
-    url_list.append(url_string)
+    Returns:
+        list: report URL of each member. 
+    """
+    url_list = []
+    for i in num_list:
+        url_string = create_member_report_url(gym_name, i)
+        url_list.append(url_string)
+    return url_list
 
-# Navigate through the login screen. 
-wait = WebDriverWait(driver, 10)
-driver.get(login_url)
-driver.find_element(By.ID, "username").send_keys(login_name)
-driver.find_element(By.ID, "password").send_keys(password)
-driver.find_element(By.ID, "submit").click()
-print("Logged in")
 
+def log_in(driver, settings: dict) -> None:
+    """Navigate through the login screen. 
 
-for url in url_list:
-    # Selenium to go and access each web address. Upon accessing the web address the .csv file will automatically download to Chrome's default download location. 
-    driver.get(url)
-    driver.implicitly_wait(3)
+    Args:
+        driver (webdriver.Chrome): browser to log in with. 
+        settings (dict): see get_scraper_settings. 
+    """
+    wait = WebDriverWait(driver, 10)
+    driver.get(settings["login_url"])
+    driver.find_element(By.ID, "username").send_keys(settings["login_name"])
+    driver.find_element(By.ID, "password").send_keys(settings["password"])
+    driver.find_element(By.ID, "submit").click()
+    print("Logged in")
 
-driver.quit()
 
+@timed()
+def main_scrape_member_reports(first_member_id: int = 1, last_member_id: int = 642) -> None:
+    """Logs in to StudioBookings with Chrome and downloads the credit report of every member in the ID range. 
 
+    Args:
+        first_member_id (int, optional): starting member ID number. Defaults to 1. 
+        last_member_id (int, optional): ending member ID number. Defaults to 642. 
+    """
+    settings = get_scraper_settings()
+
+    # Create the numbered list. 
+    num_list = create_num_list(first_member_id, last_member_id)
+    if not isinstance(num_list, list):
+        num_list = [num_list]
+    url_list = create_member_report_urls(settings["gym_name"], num_list)
+
+    with span("scrape.start_driver"):
+        driver = webdriver.Chrome()
+    try:
+        with span("scrape.log_in"):
+            log_in(driver, settings)
+
+        if settings["http_downloader_enabled"]:
+            # Selenium is only used for the login. The session cookies are handed to a pooled HTTP client that downloads the reports concurrently. 
+            session = create_session_from_driver(driver)
+            driver.quit()
+            driver = None
+            if settings["incremental_enabled"]:
+                # The ID range seeds the first run, later runs also pick up the members found past it. 
+                with span("scrape.download_changed_member_reports"):
+                    changed_files = download_changed_member_reports(session, settings["gym_name"], settings["download_dir"],
+                                                                    default_max_member_id=last_member_id, first_member_id=first_member_id)
+                increment("scrape_reports_changed", len(changed_files))
+                print(f"{len(changed_files)} member reports are new or changed since the last run.")
+            else:
+                with span("scrape.download_member_reports"):
+                    download_member_reports(session, settings["gym_name"], num_list, settings["download_dir"])
+                increment("scrape_reports_requested", len(num_list))
+        else:
+            for url in url_list:
+                # Selenium to go and access each web address. Upon accessing the web address the .csv file will automatically download to Chrome's default download location. 
+                with span("scrape.report_page"):
+                    driver.get(url)
+                    driver.implicitly_wait(3)
+                increment("scrape_reports_requested")
+    finally:
+        if driver is not None:
+            driver.quit()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download the StudioBookings member credit reports.")
+    parser.add_argument("--first-member-id", type=int, default=1)
+    parser.add_argument("--last-member-id", type=int, default=642)
+    args = parser.parse_args()
+
+    main_scrape_member_reports(args.first_member_id, args.last_member_id)
@@ -0,0 +1,254 @@
+import stripe
+import json
+import os
+import glob
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+
+import stripe_local_store
+from stripe_ndjson_export import iterate_ndjson_objects
+from stripe_pagination import iterate_search_results, iterate_list_results
+
+
+# The report functions read Stripe objects through one of the data sources below, selected in the .env file:
+#   LiveStripeSource  - the Stripe API (RUN_FROM_LIVE_API_ENABLED)
+#   LocalStoreSource  - the SQLite store kept by stripe_local_store (LOCAL_STORE_ENABLED)
+#   JsonReplaySource  - the NDJSON exports written by gather_stripe_reports, no network calls (RUN_FROM_JSON_ENABLED)
+# Every source answers the same three questions, so the reports do not need to know where the data came from.
+
+# Stripe resource used for each object type on the live API.
+live_resources = {
+    "customers": stripe.Customer,
+    "charges": stripe.Charge,
+    "payment_intents": stripe.PaymentIntent,
+    "subscriptions": stripe.Subscription,
+}
+
+# StripeClient service used for each object type when a source is given its own client.
+client_services = {
+    "customers": "customers",
+    "charges": "charges",
+    "payment_intents": "payment_intents",
+    "subscriptions": "subscriptions",
+}
+
+# Far enough in the future to cover every object when a source is asked for "everything".
+latest_epoch = 2 ** 31 - 1
+
+
+def remove_unlisted_objects(object_type: str, objects: list) -> list:
+    """Drops the objects Stripe's list endpoint leaves out by default, so the offline sources list what the live API lists. The local
+    store and the dumps keep every subscription, but listing subscriptions without a status only returns the ones not canceled.
+
+    Args:
+        object_type (str): customers, charges, payment_intents or subscriptions.
+        objects (list): stored objects.
+
+    Returns:
+        list: objects the live list endpoint returns.
+    """
+    if object_type != "subscriptions":
+        return objects
+    return [stripe_object for stripe_object in objects if stripe_object.get("status") != "canceled"]
+
+
+class StripeClientResource:
+    def __init__(self, service, name: str):
+        """Gives a StripeClient service the search and list methods of the legacy resource classes, so the pagination helpers work with
+        both. Requests made through it use the client's API key instead of the global stripe.api_key.
+
+        Args:
+            service: StripeClient service, ex. client.customers
+            name (str): name used in log messages.
+        """
+        self.service = service
+        self.__name__ = name
+
+    def search(self, **params):
+        return self.service.search(params=params)
+
+    def list(self, **params):
+        return self.service.list(params=params)
+
+
+class LiveStripeSource:
+    name = "Live API"
+
+    def __init__(self, client: stripe.StripeClient = None):
+        """Reads from the Stripe API.
+
+        Args:
+            client (stripe.StripeClient, optional): client of the platform to read from. Defaults to the legacy resources, which use the
+                global stripe.api_key.
+        """
+        self.client = client
+
+    def get_resource(self, object_type: str):
+        """Returns the resource the requests for the object type are made with."""
+        if self.client is None:
+            return live_resources[object_type]
+        return StripeClientResource(getattr(self.client, client_services[object_type]), object_type)
+
+    def search_objects(self, object_type: str, start_epoch: int, end_epoch: int, customer_id: str = None):
+        """Yields objects created strictly between the two epoch times using Stripe search.
+
+        Args:
+            object_type (str): customers, charges, payment_intents or subscriptions.
+            start_epoch (int): exclusive lower bound on created.
+            end_epoch (int): exclusive upper bound on created.
+            customer_id (str, optional): only return objects belonging to this customer.
+
+        Yields:
+            stripe.StripeObject: one object at a time.
+        """
+        query = ("created<" + str(end_epoch) + " AND " + "created>" + str(start_epoch))
+        if customer_id:
+            query = query + " AND " + "customer:" + "'" + customer_id + "'"
+        return iterate_search_results(self.get_resource(object_type), query)
+
+    def search_customers_by_email(self, email: str):
+        """Yields the customers registered with the email address.
+
+        Args:
+            email (str): email address.
+
+        Yields:
+            stripe.StripeObject: one customer at a time.
+        """
+        query = ("email:" + "'" + email + "'")
+        return iterate_search_results(self.get_resource("customers"), query)
+
+    def list_objects(self, object_type: str):
+        """Yields every object of the type using Stripe's list endpoint. Like Stripe, canceled subscriptions are left out.
+
+        Args:
+            object_type (str): customers, charges, payment_intents or subscriptions.
+
+        Yields:
+            stripe.StripeObject: one object at a time.
+        """
+        return iterate_list_results(self.get_resource(object_type))
+
+
+class LocalStoreSource:
+    name = "Local Store"
+
+    def __init__(self, db_path: str = None):
+        """Reads from the SQLite store kept current by stripe_local_store.sync_local_store.
+
+        Args:
+            db_path (str, optional): path to the SQLite file.
+        """
+        self.db_path = db_path
+
+    def search_objects(self, object_type: str, start_epoch: int, end_epoch: int, customer_id: str = None) -> list:
+        """Same as LiveStripeSource.search_objects, read from the store."""
+        return stripe_local_store.query_objects(object_type, start_epoch, end_epoch, customer_id=customer_id, db_path=self.db_path)
+
+    def search_customers_by_email(self, email: str) -> list:
+        """Same as LiveStripeSource.search_customers_by_email, read from the store."""
+        return stripe_local_store.query_objects("customers", 0, latest_epoch, email=email, db_path=self.db_path)
+
+    def list_objects(self, object_type: str) -> list:
+        """Same as LiveStripeSource.list_objects, read from the store."""
+        return remove_unlisted_objects(object_type, stripe_local_store.query_objects(object_type, 0, latest_epoch, db_path=self.db_path))
+
+
+class JsonReplaySource:
+    name = "Local JSON"
+
+    # File name suffix written by gather_stripe_reports for each object type.
+    dump_file_suffixes = {
+        "customers": "customer_list",
+        "charges": "charges_list",
+        "payment_intents": "payment_intents_list",
+        "subscriptions": "subscriptions_list",
+    }
+
+    def __init__(self, json_dir: str = None):
+        """Serves the report queries from the exports written by gather_stripe_reports (.ndjson.gz, or .json from older runs) without any
+        network calls. Each object type is loaded once on first use and indexed by created date, customer and email.
+
+        Args:
+            json_dir (str, optional): directory holding the dumps. Defaults to STRIPE_JSON_DIR or cwd.
+        """
+        self.json_dir = json_dir or os.getenv("STRIPE_JSON_DIR", ".")
+        self.indexes = {}
+        # Report queries run concurrently, the lock keeps them from each loading and indexing the same dumps.
+        self.index_lock = threading.Lock()
+
+    def load_dump_objects(self, object_type: str) -> list:
+        """Reads every dump file for the object type. When an object appears in several dumps the one from the newest file wins.
+
+        Args:
+            object_type (str): customers, charges, payment_intents or subscriptions.
+
+        Returns:
+            list: Stripe objects as dictionaries.
+        """
+        objects_by_id = {}
+        suffix = self.dump_file_suffixes[object_type]
+        dump_paths = glob.glob(os.path.join(self.json_dir, f"*_{suffix}.json")) + glob.glob(os.path.join(self.json_dir, f"*_{suffix}.ndjson.gz"))
+        # Dump names start with the YYYYMMDD date range so sorting by name processes older dumps first.
+        for file_path in sorted(dump_paths):
+            if file_path.endswith(".ndjson.gz"):
+                dump = iterate_ndjson_objects(file_path)
+            else:
+                with open(file_path) as read_file:
+                    dump = json.load(read_file)
+                # Older dumps stored the first page of a list object rather than a plain list.
+                if isinstance(dump, dict):
+                    dump = dump.get("data", [])
+            for stripe_object in dump:
+                objects_by_id[stripe_object.get("id")] = stripe_object
+        logging.debug(f"Loaded {len(objects_by_id)} {object_type} from JSON dumps in {self.json_dir}.")
+        return list(objects_by_id.values())
+
+    def get_index(self, object_type: str) -> dict:
+        """Builds (once) the index for an object type: objects sorted by created, the sorted created values for bisecting, and lookups by
+        customer and by normalized email.
+
+        Args:
+            object_type (str): customers, charges, payment_intents or subscriptions.
+
+        Returns:
+            dict: index with objects, created, by_customer and by_email keys.
+        """
+        with self.index_lock:
+            if object_type not in self.indexes:
+                objects = sorted(self.load_dump_objects(object_type), key=lambda stripe_object: stripe_object.get("created") or 0)
+                by_customer = {}
+                by_email = {}
+                for stripe_object in objects:
+                    customer = stripe_object.get("id") if object_type == "customers" else stripe_object.get("customer")
+                    by_customer.setdefault(customer, []).append(stripe_object)
+                    email = stripe_object.get("email")
+                    if email:
+                        by_email.setdefault(email.strip().lower(), []).append(stripe_object)
+                self.indexes[object_type] = {
+                    "objects": objects,
+                    "created": [stripe_object.get("created") or 0 for stripe_object in objects],
+                    "by_customer": by_customer,
+                    "by_email": by_email,
+                }
+            return self.indexes[object_type]
+
+    def search_objects(self, object_type: str, start_epoch: int, end_epoch: int, customer_id: str = None) -> list:
+        """Same as LiveStripeSource.search_objects, served from the indexed dumps."""
+        index = self.get_index(object_type)
+        if customer_id:
+            return [stripe_object for stripe_object in reversed(index["by_customer"].get(customer_id, []))
+                    if start_epoch < (stripe_object.get("created") or 0) < end_epoch]
+        # Binary search the sorted created values for the exclusive range, newest first like the API.
+        first = bisect_right(index["created"], start_epoch)
+        last = bisect_left(index["created"], end_epoch)
+        return index["objects"][first:last][::-1]
+
+    def search_customers_by_email(self, email: str) -> list:
+        """Same as LiveStripeSource.search_customers_by_email, served from the indexed dumps."""
+        return list(reversed(self.get_index("customers")["by_email"].get(email.strip().lower(), [])))
+
+    def list_objects(self, object_type: str) -> list:
+        """Same as LiveStripeSource.list_objects, served from the indexed dumps."""
+        return remove_unlisted_objects(object_type, self.get_index(object_type)["objects"][::-1])
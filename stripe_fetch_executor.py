@@ -0,0 +1,123 @@
+import stripe
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import TokenBucket
+from pipeline_metrics import increment
+
+
+# Runs independent Stripe queries concurrently. Every page request made through stripe_pagination takes a token from a shared bucket
+# first, so concurrent queries together stay under Stripe's rate limits, and requests that still get a 429 are retried with backoff.
+
+# Stripe allows 100 read requests per second in live mode (25 in test mode) and 20 search requests per second. The defaults stay under
+# the test mode limits, raise them in the .env file for live keys. They are read when a limiter or executor is created rather than at
+# import, which comes before reporting_functions.configure loads the .env file.
+fetch_setting_defaults = {
+    "STRIPE_READ_RATE_LIMIT": "25",
+    "STRIPE_SEARCH_RATE_LIMIT": "20",
+    "STRIPE_FETCH_WORKERS": "4",
+    "STRIPE_RATE_LIMIT_RETRIES": "5",
+}
+
+
+def get_fetch_setting(name: str) -> float:
+    """Returns a fetch setting from the environment, or its default from fetch_setting_defaults.
+
+    Args:
+        name (str): ex. STRIPE_READ_RATE_LIMIT
+
+    Returns:
+        float: setting value.
+    """
+    return float(os.getenv(name, fetch_setting_defaults[name]))
+
+
+# Stripe rate limits apply per account, so each account gets its own pair of limiters. Reports for several platforms run concurrently
+# each set the account they call, see platform_context.
+rate_limit_account = contextvars.ContextVar("rate_limit_account", default="default")
+
+# Shared between every thread making Stripe requests for the same account in this process.
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(request_kind: str) -> TokenBucket:
+    """Returns the rate limiter of the current account for the request kind, created on first use.
+
+    Args:
+        request_kind (str): "read" or "search".
+
+    Returns:
+        TokenBucket: shared limiter.
+    """
+    limiter_key = (rate_limit_account.get(), request_kind)
+    with rate_limiters_lock:
+        if limiter_key not in rate_limiters:
+            requests_per_second = get_fetch_setting("STRIPE_SEARCH_RATE_LIMIT" if request_kind == "search" else "STRIPE_READ_RATE_LIMIT")
+            rate_limiters[limiter_key] = TokenBucket(requests_per_second)
+        return rate_limiters[limiter_key]
+
+
+def call_with_rate_limit(request_function, request_kind: str = "read", **params):
+    """Calls a Stripe method after taking a token from the matching rate limiter. Retries with exponential backoff and jitter when Stripe
+    responds with a 429.
+
+    Args:
+        request_function (function): bound Stripe method, ex. stripe.Charge.search
+        request_kind (str, optional): "read" or "search", selects the rate limiter. Defaults to "read".
+        **params: parameters passed to the Stripe method.
+
+    Raises:
+        stripe.RateLimitError: when the request is still rate limited after STRIPE_RATE_LIMIT_RETRIES (default 5) retries.
+
+    Returns:
+        Response of the Stripe method.
+    """
+    attempt = 0
+    while True:
+        get_rate_limiter(request_kind).acquire()
+        increment("stripe_api_calls")
+        try:
+            return request_function(**params)
+        except stripe.RateLimitError as e:
+            increment("stripe_rate_limit_errors")
+            if attempt >= get_fetch_setting("STRIPE_RATE_LIMIT_RETRIES"):
+                raise
+            backoff = (0.5 * 2 ** attempt) + random.uniform(0, 0.25)
+            logging.debug(f"Stripe rate limited a {request_kind} request, retrying in {backoff:.2f}s. {e}")
+            time.sleep(backoff)
+            attempt += 1
+
+
+class FetchExecutor:
+    def __init__(self, max_workers: int = None):
+        """Runs independent fetch functions on a thread pool. The rate limiters above are shared by every worker. Each task runs in a
+        copy of the caller's context, so context variables such as the current platform carry over to the workers.
+
+        Args:
+            max_workers (int, optional): number of threads. Defaults to STRIPE_FETCH_WORKERS or 4.
+        """
+        self.max_workers = max_workers or int(get_fetch_setting("STRIPE_FETCH_WORKERS"))
+
+    def run(self, fetch_tasks: dict) -> dict:
+        """Runs every task concurrently and waits for all of them. Wall time is bounded by the slowest task rather than the sum.
+
+        Args:
+            fetch_tasks (dict): {name: (function, args tuple)} or {name: (function, args tuple, kwargs dict)},
+                ex. {"current_clients": (return_list_of_clients, (20240101, 20240115))}
+
+        Raises:
+            Exception: the first exception raised by a task, once every task has finished.
+
+        Returns:
+            dict: {name: return value of the function}
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(contextvars.copy_context().run, task[0], *task[1], **(task[2] if len(task) > 2 else {}))
+                       for name, task in fetch_tasks.items()}
+            return {name: future.result() for name, future in futures.items()}
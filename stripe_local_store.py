@@ -0,0 +1,191 @@
+import stripe
+import sqlite3
+import json
+import os
+import logging
+
+from stripe_pagination import iterate_list_results
+
+
+# Local SQLite copy of the Stripe objects the reports are built from. Historical objects rarely change, so once they are stored
+# only objects created (or updated, via the events feed) since the last sync cursor need to be fetched again.
+
+default_db_path = os.getenv("STRIPE_LOCAL_STORE_PATH", "stripe_local_store.db")
+
+# Maps the table name used in the store to the Stripe resource used to fetch it and the "object" value Stripe returns.
+stored_object_types = {
+    "customers": (stripe.Customer, "customer"),
+    "charges": (stripe.Charge, "charge"),
+    "payment_intents": (stripe.PaymentIntent, "payment_intent"),
+    "subscriptions": (stripe.Subscription, "subscription"),
+}
+
+# Name of the cursor used to track how far through the events feed the store has been updated.
+events_cursor_name = "events"
+
+
+def open_local_store(db_path: str = None) -> sqlite3.Connection:
+    """Opens (and creates if needed) the local store database with one table per stored object type.
+
+    Args:
+        db_path (str, optional): path to the SQLite file. Defaults to STRIPE_LOCAL_STORE_PATH or stripe_local_store.db in cwd.
+
+    Returns:
+        sqlite3.Connection: open connection to the store.
+    """
+    connection = sqlite3.connect(db_path or default_db_path)
+    for table_name in stored_object_types:
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table_name} ("
+            "id TEXT PRIMARY KEY, "
+            "created INTEGER NOT NULL, "
+            "customer TEXT, "
+            "email TEXT, "
+            "data TEXT NOT NULL)"
+        )
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_created_idx ON {table_name} (created)")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_customer_idx ON {table_name} (customer)")
+    connection.execute("CREATE TABLE IF NOT EXISTS sync_cursors (name TEXT PRIMARY KEY, cursor INTEGER NOT NULL)")
+    connection.commit()
+    return connection
+
+
+def get_sync_cursor(connection: sqlite3.Connection, name: str) -> int:
+    """Returns the stored cursor (epoch of the newest synced object) for the given table or feed, 0 if never synced.
+
+    Args:
+        connection (sqlite3.Connection): open store connection.
+        name (str): table name or events_cursor_name.
+
+    Returns:
+        int: epoch time.
+    """
+    row = connection.execute("SELECT cursor FROM sync_cursors WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_sync_cursor(connection: sqlite3.Connection, name: str, cursor: int) -> None:
+    """Stores the cursor for the given table or feed.
+
+    Args:
+        connection (sqlite3.Connection): open store connection.
+        name (str): table name or events_cursor_name.
+        cursor (int): epoch time of the newest synced object.
+    """
+    connection.execute("INSERT OR REPLACE INTO sync_cursors (name, cursor) VALUES (?, ?)", (name, cursor))
+
+
+def upsert_object(connection: sqlite3.Connection, table_name: str, stripe_object: dict) -> None:
+    """Inserts or replaces a single Stripe object in its table.
+
+    Args:
+        connection (sqlite3.Connection): open store connection.
+        table_name (str): one of the stored_object_types keys.
+        stripe_object (dict): Stripe object as returned by the API.
+    """
+    # Customers have no customer field, their own ID is used so lookups by customer work the same on every table.
+    if stripe_object.get("object") == "customer":
+        customer = stripe_object.get("id")
+    else:
+        customer = stripe_object.get("customer")
+    email = stripe_object.get("email") or stripe_object.get("receipt_email")
+    connection.execute(
+        f"INSERT OR REPLACE INTO {table_name} (id, created, customer, email, data) VALUES (?, ?, ?, ?, ?)",
+        (stripe_object.get("id"), stripe_object.get("created"), customer, email, json.dumps(stripe_object)),
+    )
+
+
+def sync_local_store(db_path: str = None) -> dict:
+    """Brings the local store up to date with Stripe. New objects are fetched with a created[gte] filter starting at each table's cursor
+    and objects updated since the last run are refreshed from the events feed. The first run downloads the full history.
+    Stripe must already be configured with an API key.
+
+    Args:
+        db_path (str, optional): path to the SQLite file.
+
+    Returns:
+        dict: count of objects written per table, plus the number of events applied.
+    """
+    connection = open_local_store(db_path)
+    sync_counts = {}
+    try:
+        for table_name, (resource, _) in stored_object_types.items():
+            cursor = get_sync_cursor(connection, table_name)
+            newest_created = cursor
+            object_count = 0
+            # created only has one second resolution, so objects created in the cursor's second after the last sync read it would be
+            # skipped by gt. They are fetched again instead, which the upsert makes safe.
+            list_params = {"created": {"gte": cursor}}
+            # Subscriptions list only returns active ones by default.
+            if table_name == "subscriptions":
+                list_params["status"] = "all"
+            for stripe_object in iterate_list_results(resource, **list_params):
+                upsert_object(connection, table_name, stripe_object)
+                newest_created = max(newest_created, stripe_object.get("created"))
+                object_count += 1
+            set_sync_cursor(connection, table_name, newest_created)
+            connection.commit()
+            sync_counts[table_name] = object_count
+            logging.debug(f"Local store sync wrote {object_count} {table_name}, cursor is now {newest_created}.")
+
+        # Apply updates (refunds, status changes, edited customer details) using the events feed. Stripe only keeps 30 days of events
+        # so the store should be synced at least that often to stay exact.
+        table_by_object_name = {object_name: table_name for table_name, (_, object_name) in stored_object_types.items()}
+        events_cursor = get_sync_cursor(connection, events_cursor_name)
+        newest_event = events_cursor
+        event_count = 0
+        # Stripe lists events newest first. Each one carries a snapshot of its object, so they are applied oldest first for the newest
+        # snapshot to be the one left in the store.
+        events = sorted(iterate_list_results(stripe.Event, created={"gte": events_cursor}),
+                        key=lambda event: (event.get("created"), event.get("id")))
+        for event in events:
+            newest_event = max(newest_event, event.get("created"))
+            event_object = event.get("data", {}).get("object", {})
+            table_name = table_by_object_name.get(event_object.get("object"))
+            if table_name is None:
+                continue
+            if event.get("type", "").endswith(".deleted") and table_name == "customers":
+                connection.execute("DELETE FROM customers WHERE id = ?", (event_object.get("id"),))
+            else:
+                upsert_object(connection, table_name, event_object)
+            event_count += 1
+        set_sync_cursor(connection, events_cursor_name, newest_event)
+        connection.commit()
+        sync_counts[events_cursor_name] = event_count
+    finally:
+        connection.close()
+    return sync_counts
+
+
+def query_objects(table_name: str, start_epoch: int, end_epoch: int, customer_id: str = None, email: str = None, db_path: str = None) -> list:
+    """Returns stored objects created strictly between the two epoch times, newest first, matching the created>/created< search query used
+    against the live API.
+
+    Args:
+        table_name (str): one of the stored_object_types keys.
+        start_epoch (int): exclusive lower bound on created.
+        end_epoch (int): exclusive upper bound on created.
+        customer_id (str, optional): only return objects belonging to this customer.
+        email (str, optional): only return objects with this email (or receipt email), compared case-insensitively.
+        db_path (str, optional): path to the SQLite file.
+
+    Returns:
+        list: list of dictionaries, one per Stripe object.
+    """
+    if table_name not in stored_object_types:
+        raise ValueError(f"{table_name} is not stored locally. Expected one of {list(stored_object_types)}.")
+    query = f"SELECT data FROM {table_name} WHERE created > ? AND created < ?"
+    parameters = [start_epoch, end_epoch]
+    if customer_id:
+        query += " AND customer = ?"
+        parameters.append(customer_id)
+    if email:
+        query += " AND lower(email) = ?"
+        parameters.append(email.strip().lower())
+    query += " ORDER BY created DESC"
+
+    connection = open_local_store(db_path)
+    try:
+        return [json.loads(row[0]) for row in connection.execute(query, parameters)]
+    finally:
+        connection.close()
@@ -0,0 +1,178 @@
+import pandas as pd
+
+
+# Links StudioBookings members to Stripe customers so revenue and attendance can be analysed together. StudioBookings rows only carry
+# account_owner, the member name taken from the report title, so members are matched on normalized email when one is known and otherwise
+# on normalized names. Every pass is a hash join (pandas merge) over the whole member list:
+#   join = join_members_to_customers(members, customers)
+#   fact_table = build_member_fact_table(attendance, join["matches"], charges)
+
+# Match passes in the order they are tried, with the confidence of an unambiguous match. A member matched by one pass is not tried again.
+match_passes = [
+    ("email", "email_key", 1.0),
+    ("full_name", "full_name_key", 0.9),
+    ("first_last_name", "first_last_key", 0.75),
+]
+
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """Normalizes names for matching: accents removed, lowercased, punctuation replaced by spaces and whitespace collapsed.
+
+    Args:
+        names (pd.Series): names, may contain None.
+
+    Returns:
+        pd.Series: normalized names, None where the name is missing or empty.
+    """
+    normalized = (names.astype("string").str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+                  .str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip())
+    return normalized.where(normalized != "").astype(object).where(normalized.notna(), None)
+
+
+def normalize_emails(emails: pd.Series) -> pd.Series:
+    """Vectorized reporting_functions.normalize_email, empty emails become None.
+
+    Args:
+        emails (pd.Series): email addresses, may contain None.
+
+    Returns:
+        pd.Series: lowercased emails without surrounding whitespace.
+    """
+    normalized = emails.astype("string").str.strip().str.lower()
+    return normalized.where(normalized != "").astype(object).where(normalized.notna(), None)
+
+
+def add_match_keys(data: pd.DataFrame, name_column: str, email_column: str = None) -> pd.DataFrame:
+    """Adds the email_key, full_name_key and first_last_key columns used by the join. first_last_key keeps only the first and last word
+    of the name, so "Jane Ann Doe" in Stripe still matches "Jane Doe" in StudioBookings.
+
+    Args:
+        data (pd.DataFrame): members or customers.
+        name_column (str): column holding the name.
+        email_column (str, optional): column holding the email.
+
+    Returns:
+        pd.DataFrame: copy of data with the key columns.
+    """
+    keyed = data.copy()
+    keyed["full_name_key"] = normalize_names(keyed[name_column])
+    name_words = keyed["full_name_key"].str.split()
+    keyed["first_last_key"] = (name_words.str[0] + " " + name_words.str[-1]).where(name_words.str.len() >= 2, keyed["full_name_key"])
+    keyed["email_key"] = normalize_emails(keyed[email_column]) if email_column else None
+    return keyed
+
+
+def build_customer_index(customers: pd.DataFrame, key_column: str) -> pd.DataFrame:
+    """Builds the lookup index of one match key: one row per key with the newest customer holding it and how many customers share it.
+
+    Args:
+        customers (pd.DataFrame): customers with match keys, see add_match_keys.
+        key_column (str): match key column.
+
+    Returns:
+        pd.DataFrame: key, stripe_customer_id, candidate_count.
+    """
+    keyed_customers = customers[customers[key_column].notna()].sort_values("created", ascending=False, kind="stable")
+    grouped = keyed_customers.groupby(key_column, sort=False)
+    return pd.DataFrame({
+        "stripe_customer_id": grouped["id"].first(),
+        "candidate_count": grouped["id"].size(),
+    }).rename_axis(key_column).reset_index()
+
+
+def join_members_to_customers(members: pd.DataFrame, customers: pd.DataFrame) -> dict:
+    """Resolves each StudioBookings member to a Stripe customer ID. When several customers share a key the newest one is used and the
+    confidence is divided by the number of candidates.
+
+    Args:
+        members (pd.DataFrame): account_owner and optionally email, one row per member.
+        customers (pd.DataFrame): Stripe customers with id, name, email and created.
+
+    Returns:
+        dict: {"matches": account_owner, stripe_customer_id, match_method, match_confidence, candidate_count,
+               "unmatched_members": members without a customer, "unmatched_customers": customers without a member}
+    """
+    members = members.drop_duplicates("account_owner")
+    keyed_members = add_match_keys(members, "account_owner", "email" if "email" in members.columns else None)
+    keyed_customers = add_match_keys(customers, "name", "email")
+
+    matches = []
+    remaining_members = keyed_members
+    for match_method, key_column, confidence in match_passes:
+        candidates = remaining_members[remaining_members[key_column].notna()]
+        matched = candidates.merge(build_customer_index(keyed_customers, key_column), on=key_column, how="inner")
+        matched["match_method"] = match_method
+        matched["match_confidence"] = (confidence / matched["candidate_count"]).round(4)
+        matches.append(matched[["account_owner", "stripe_customer_id", "match_method", "match_confidence", "candidate_count"]])
+        remaining_members = remaining_members[~remaining_members["account_owner"].isin(matched["account_owner"])]
+
+    matches = pd.concat(matches, ignore_index=True)
+    return {
+        "matches": matches,
+        "unmatched_members": members[~members["account_owner"].isin(matches["account_owner"])].reset_index(drop=True),
+        "unmatched_customers": customers[~customers["id"].isin(matches["stripe_customer_id"])].reset_index(drop=True),
+    }
+
+
+def build_member_fact_table(attendance: pd.DataFrame, matches: pd.DataFrame, charges: pd.DataFrame) -> pd.DataFrame:
+    """Builds the joined fact table: one row per member and month with the visits from StudioBookings and the revenue from Stripe.
+
+    Args:
+        attendance (pd.DataFrame): attendance rows with account_owner, cleaned_date and balance_used, ex. attendance_store.query_attendance.
+        matches (pd.DataFrame): matches from join_members_to_customers.
+        charges (pd.DataFrame): charges as yielded by reporting_functions.iterate_charges (customer_id, status, charge_date, amount_captured).
+
+    Returns:
+        pd.DataFrame: account_owner, stripe_customer_id, year_month, visit_count, charge_count, revenue, revenue_per_visit, match_method,
+            match_confidence. Unmatched members keep their visits with no revenue.
+    """
+    visits = attendance[pd.to_numeric(attendance["balance_used"], errors="coerce").fillna(0) > 0]
+    visits = visits.assign(year_month=pd.to_datetime(visits["cleaned_date"], errors="coerce").dt.strftime("%Y-%m")).dropna(subset=["year_month"])
+    visit_counts = visits.groupby(["account_owner", "year_month"]).size().rename("visit_count").reset_index()
+    visit_counts = visit_counts.merge(matches[["account_owner", "stripe_customer_id"]], on="account_owner", how="left")
+
+    succeeded_charges = charges[charges["status"] == "succeeded"]
+    succeeded_charges = succeeded_charges.assign(year_month=pd.to_datetime(succeeded_charges["charge_date"]).dt.strftime("%Y-%m"))
+    revenue = (succeeded_charges.groupby(["customer_id", "year_month"])
+               .agg(charge_count=("amount_captured", "size"), revenue=("amount_captured", "sum"))
+               .reset_index().rename(columns={"customer_id": "stripe_customer_id"}))
+    revenue = revenue[revenue["stripe_customer_id"].isin(matches["stripe_customer_id"])]
+    revenue = revenue.merge(matches[["account_owner", "stripe_customer_id"]], on="stripe_customer_id", how="inner")
+
+    fact_table = visit_counts.merge(revenue, on=["account_owner", "stripe_customer_id", "year_month"], how="outer")
+    fact_table[["visit_count", "charge_count"]] = fact_table[["visit_count", "charge_count"]].fillna(0).astype(int)
+    fact_table["revenue"] = fact_table["revenue"].fillna(0.0)
+    fact_table["revenue_per_visit"] = (fact_table["revenue"] / fact_table["visit_count"].where(fact_table["visit_count"] > 0)).round(2)
+    fact_table = fact_table.merge(matches[["account_owner", "match_method", "match_confidence"]], on="account_owner", how="left")
+    return fact_table.sort_values(["account_owner", "year_month"], kind="stable").reset_index(drop=True)
+
+
+def build_member_fact_table_from_stripe(attendance: pd.DataFrame, start_date: int, end_date: int, members: pd.DataFrame = None) -> dict:
+    """Reads the customers and the period's charges through the reporting_functions data source, joins them to the members and builds
+    the fact table.
+
+    Args:
+        attendance (pd.DataFrame): attendance rows, see build_member_fact_table.
+        start_date (int): YYYYMMDD start of the charges.
+        end_date (int): YYYYMMDD end of the charges.
+        members (pd.DataFrame, optional): account_owner and email of each member when emails are known. Defaults to the members in
+            attendance, matched by name only.
+
+    Returns:
+        dict: the join_members_to_customers output plus "fact_table".
+    """
+    import reporting_functions
+
+    if members is None:
+        members = pd.DataFrame({"account_owner": attendance["account_owner"].dropna().unique()})
+    customers = pd.DataFrame(
+        [{"id": customer.get("id"), "name": customer.get("name"), "email": customer.get("email"), "created": customer.get("created")}
+         for customer in reporting_functions.get_data_source().list_objects("customers")],
+        columns=["id", "name", "email", "created"],
+    )
+    charges = pd.DataFrame(reporting_functions.iterate_charges(start_date, end_date),
+                           columns=["charge_id", "status", "charge_date", "customer_id", "receipt_email", "description", "amount_captured"])
+
+    join = join_members_to_customers(members, customers)
+    join["fact_table"] = build_member_fact_table(attendance, join["matches"], charges)
+    return join
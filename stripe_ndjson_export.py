@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+import zlib
+import logging
+
+from stripe_pagination import iterate_list_results
+
+
+# Streams Stripe list results to gzip compressed newline-delimited JSON, one object per line as it arrives. Only the current page is
+# ever in memory, and an interrupted export picks up after the last object that made it to disk.
+
+
+def iterate_ndjson_objects(file_path: str):
+    """Yields the objects stored in a .ndjson.gz file. Stops quietly at a truncated tail left by an interrupted export.
+
+    Args:
+        file_path (str): path to the .ndjson.gz file.
+
+    Yields:
+        dict: one Stripe object per line.
+    """
+    try:
+        with gzip.open(file_path, "rt") as read_file:
+            for line in read_file:
+                # A line without its newline was cut off mid-write.
+                if not line.endswith("\n"):
+                    return
+                yield json.loads(line)
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        logging.debug(f"{file_path} ends with an incomplete write, reading stopped at the last complete object. {e}")
+
+
+def recover_ndjson_file(file_path: str) -> str:
+    """Returns the ID of the last object completely written to an export. If the file was left truncated it is rewritten with only its
+    complete lines, so new objects can be appended to a valid gzip stream.
+
+    Args:
+        file_path (str): path to the .ndjson.gz file.
+
+    Returns:
+        str: ID of the last written object, None if the file does not exist or holds no complete objects.
+    """
+    if not os.path.exists(file_path):
+        return None
+
+    last_written_id = None
+    is_truncated = False
+    try:
+        with gzip.open(file_path, "rt") as read_file:
+            for line in read_file:
+                if not line.endswith("\n"):
+                    is_truncated = True
+                    break
+                last_written_id = json.loads(line).get("id")
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        is_truncated = True
+
+    if is_truncated:
+        recovered_path = file_path + ".recovering"
+        with gzip.open(recovered_path, "wt") as write_file:
+            for stripe_object in iterate_ndjson_objects(file_path):
+                write_file.write(json.dumps(stripe_object) + "\n")
+        os.replace(recovered_path, file_path)
+        logging.debug(f"{file_path} was truncated and has been rewritten with its complete objects.")
+    logging.debug(f"Resuming {file_path} after {last_written_id}.")
+    return last_written_id
+
+
+def export_objects_to_ndjson(resource, file_path: str, **list_params) -> int:
+    """Writes every object returned by a Stripe list call to a .ndjson.gz file, resuming after the last written object when the file
+    already exists. Stripe lists are newest first, so resuming continues with older objects via starting_after.
+
+    Args:
+        resource: Stripe resource class that supports list, ex. stripe.Charge.
+        file_path (str): path to the .ndjson.gz file.
+        **list_params: list filters, ex. created={"gte": 1704085200, "lt": 1706763600}
+
+    Returns:
+        int: number of objects written during this call.
+    """
+    last_written_id = recover_ndjson_file(file_path)
+    object_count = 0
+    with gzip.open(file_path, "at") as write_file:
+        for stripe_object in iterate_list_results(resource, starting_after=last_written_id, **list_params):
+            write_file.write(json.dumps(stripe_object) + "\n")
+            object_count += 1
+    logging.debug(f"Wrote {object_count} {resource.__name__} objects to {file_path}.")
+    return object_count
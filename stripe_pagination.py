@@ -0,0 +1,82 @@
+import logging
+
+from stripe_fetch_executor import call_with_rate_limit
+from pipeline_metrics import increment, span
+
+
+# Every Stripe search/list call goes through the generators below. They follow every page and yield one object at a time, so only a
+# single page (at most `limit` objects) is held in memory no matter how many results the query matches.
+
+default_page_limit = 100
+
+
+def fetch_page(request_function, request_kind: str = "read", **params):
+    """Requests a single page of results. Kept separate so every page request made by the reports goes through one place, which takes
+    a rate limit token and retries on 429s.
+
+    Args:
+        request_function (function): bound Stripe method, ex. stripe.Charge.search or stripe.Customer.list.
+        request_kind (str, optional): "read" or "search". Defaults to "read".
+        **params: parameters passed to the Stripe method. Parameters with a None value are left out.
+
+    Returns:
+        stripe.ListObject or stripe.SearchResultObject: single page of results.
+    """
+    params = {key: value for key, value in params.items() if value is not None}
+    with span(f"stripe.page.{request_kind}"):
+        page = call_with_rate_limit(request_function, request_kind, **params)
+    increment("stripe_pages")
+    increment("stripe_objects", len(page["data"]))
+    last_response = getattr(page, "last_response", None)
+    if last_response is not None:
+        increment("stripe_response_bytes", len(last_response.body.encode()))
+    return page
+
+
+def iterate_search_results(resource, query: str, limit: int = default_page_limit, **params):
+    """Yields every object matching a Stripe search query, following the next_page token until the last page.
+
+    Args:
+        resource: Stripe resource class that supports search, ex. stripe.Charge.
+        query (str): Stripe search query, ex. "created<1719792000 AND created>1718582400"
+        limit (int, optional): page size, 1 to 100. Defaults to 100.
+
+    Yields:
+        stripe.StripeObject: one search result at a time.
+    """
+    page_token = None
+    page_count = 0
+    while True:
+        search_page = fetch_page(resource.search, "search", query=query, limit=limit, page=page_token, **params)
+        page_count += 1
+        for stripe_object in search_page["data"]:
+            yield stripe_object
+        page_token = search_page.get("next_page")
+        if not search_page.get("has_more") or not page_token:
+            logging.debug(f"Search on {resource.__name__} for '{query}' finished after {page_count} page(s).")
+            return
+
+
+def iterate_list_results(resource, limit: int = default_page_limit, **params):
+    """Yields every object returned by a Stripe list call, paging with starting_after until has_more is False.
+
+    Args:
+        resource: Stripe resource class that supports list, ex. stripe.Customer.
+        limit (int, optional): page size, 1 to 100. Defaults to 100.
+        **params: additional list filters, ex. created={"gt": 1718582400}
+
+    Yields:
+        stripe.StripeObject: one object at a time.
+    """
+    starting_after = params.pop("starting_after", None)
+    page_count = 0
+    while True:
+        list_page = fetch_page(resource.list, limit=limit, starting_after=starting_after, **params)
+        page_count += 1
+        page_data = list_page["data"]
+        for stripe_object in page_data:
+            yield stripe_object
+        if not list_page.get("has_more") or not page_data:
+            logging.debug(f"List on {resource.__name__} finished after {page_count} page(s).")
+            return
+        starting_after = page_data[-1].get("id")
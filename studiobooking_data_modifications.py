@@ -4,9 +4,19 @@ import xlrd
 from os import listdir
 import os
 import csv
+import shutil
 import logging
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import re 
 from datetime import datetime
+import time
+from typing import Callable
+
+import studiobooking_manifest
+import pipeline_metrics
+from pipeline_metrics import increment, timed, get_path_size
 
 
 class FeatureFlags:
@@ -18,21 +28,15 @@ class FeatureFlags:
     def is_logging_enabled(self):
         return self.logging_enabled
 
-if __name__ == "__main__":
-    flags = FeatureFlags()
-
-    if flags.is_logging_enabled():
-        print("Logging is enabled")
-    else:
-        print("Logging is disabled")
+flags = FeatureFlags()
 
 # Logging Setup
 
 def setup_logger(name, log_file, level=logging.DEBUG):
-    """To setup as many loggers as needed."""
+    """To setup as many loggers as needed. The log file is only created once the first message is written."""
     # Source: https://stackoverflow.com/questions/11232230/logging-to-two-files-with-different-settings 
 
-    handler = logging.FileHandler(log_file)
+    handler = logging.FileHandler(log_file, delay=True)
     formatter = logging.Formatter(fmt='%(asctime)s :: %(name)s :: %(levelname)-8s :: %(message)s')
     handler.setFormatter(formatter)
 
@@ -43,21 +47,36 @@ def setup_logger(name, log_file, level=logging.DEBUG):
     return logger
 
 if flags.is_logging_enabled() == True:
-
     SB_pandas_modifier_error_logger = setup_logger("SB_pandas_modifier_error_logger", "SB_pandas_modifier_error_logger_list.log", logging.DEBUG)
-    SB_pandas_modifier_error_logger.debug("File error logger file has been initiated for modifying StudioBookings data.")
-    
 else:
-    print(f"Logging feature flag turned off. Review the .env file and set to true to enable logging.")
+    # Logger without handlers so the functions can still be called when logging is off. 
+    SB_pandas_modifier_error_logger = logging.getLogger("SB_pandas_modifier_error_logger")
+
+if __name__ == "__main__":
+    if flags.is_logging_enabled():
+        print("Logging is enabled")
+    else:
+        print("Logging is disabled")
 
 # For each excel file. 
 
 column_header_names = ['blank_rows', 'date', 'class_booked', 'class_date', 'class_time', 'package_name', 'balance', 'balance_used', 'remaining_balance', 'transaction_type', 'modified_by']
 
 
+# first_expected_format accounts for the variability in the non-zero padded date observed. 
+first_expected_format = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s(AM|PM)$')
+
+# second_expected_format does not have the non-zero-padded variability. 
+second_expected_format = re.compile(r'^(\d{2})-(\d{2})-(\d{4}) (\d{2}):(\d{2}):(\d{2})$')
+
+# Normalized dates of every raw date string seen so far, the same dates repeat across members. 
+normalized_date_cache = {}
+
+
 def date_cleanup(date_string:str) -> str:
     """Takes date_string input of DD-MM-YYYY HH:MM:SS or D/M/YY H:MM:SS PM/AM and provides an output in the YYYY-MM-DD format. 
     The purpose of this function is to clean up the dates within the combined excel file. 
+    For a whole column use normalize_date_series, which gives the same results without a call per row. 
     Args:
         date_string (str): date as a string in one of the stated formats:
             [D/M/YY H:MM:SS PM/AM]
@@ -65,18 +84,9 @@ def date_cleanup(date_string:str) -> str:
     Returns:
         str: YYYY-MM-DD
     """
-    # Regex format to check if it is what is expected. 
-
-    # first_expected_format accounts for the variability in the non-zero padded date observed. 
-    first_expected_format = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s(AM|PM)$')
-
-    # second_expected_format does not have the non-zero-padded variability. 
-    second_expected_format = re.compile(r'^(\d{2})-(\d{2})-(\d{4}) (\d{2}):(\d{2}):(\d{2})$')
-    
     try:
-        if first_expected_format.match(date_string):
-            match_first = first_expected_format.match(date_string)
-            
+        match_first = first_expected_format.match(date_string)
+        if match_first:
             # Parse out the provided date_string. 
             day, month, year, hour, minute, second, period = match_first.groups()
             if len(year) == 2:
@@ -110,22 +120,104 @@ def date_cleanup(date_string:str) -> str:
         return None
 
 
-def transform_raw_file(file_path: str, save_path:str) -> csv:
+def parse_date_components(raw_dates: pd.Series) -> pd.Series:
+    """Parses unique raw date strings in both expected formats at once. Mirrors date_cleanup: the date has to exist and the time has to 
+    be a valid 24 hour time, as strptime checks it with %H even for the AM/PM format. 
+
+    Args:
+        raw_dates (pd.Series): unique raw date strings. 
+
+    Returns:
+        pd.Series: YYYY-MM-DD strings indexed by raw date string, None where the value could not be parsed. 
+    """
+    raw_dates = raw_dates.astype(str)
+    first_parts = raw_dates.str.extract(first_expected_format.pattern)
+    second_parts = raw_dates.str.extract(second_expected_format.pattern)
+
+    # Take each component from whichever format matched, the first format wins like in date_cleanup. 
+    first_matched = first_parts[0].notna()
+    day = first_parts[0].where(first_matched, second_parts[0])
+    month = first_parts[1].where(first_matched, second_parts[1])
+    year = first_parts[2].where(first_matched, second_parts[2])
+    year = year.where(year.str.len() != 2, '20' + year)
+    hour = first_parts[3].where(first_matched, second_parts[3])
+    minute = first_parts[4].where(first_matched, second_parts[4])
+    second = first_parts[5].fillna('00').where(first_matched, second_parts[5])
+
+    components = pd.DataFrame({
+        'year': pd.to_numeric(year.where(year.str.len() == 4)),
+        'month': pd.to_numeric(month),
+        'day': pd.to_numeric(day),
+    })
+    valid_time = (pd.to_numeric(hour) <= 23) & (pd.to_numeric(minute) <= 59) & (pd.to_numeric(second) <= 59)
+    parsed = pd.to_datetime(components, errors='coerce')
+    parsed = parsed.where(valid_time)
+
+    normalized = parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None)
+    normalized.index = raw_dates.index
+    return normalized
+
+
+@timed()
+def normalize_date_series(dates: pd.Series) -> pd.Series:
+    """Vectorized date_cleanup. Each distinct raw string is parsed once and remembered across calls, and the values that could not be 
+    parsed are logged together in one message. 
+
+    Args:
+        dates (pd.Series): raw dates in the formats date_cleanup accepts. 
+
+    Returns:
+        pd.Series: YYYY-MM-DD strings, None where the value could not be parsed. 
+    """
+    unique_dates = pd.Series(dates.dropna().unique())
+    uncached_dates = unique_dates[~unique_dates.isin(normalized_date_cache.keys())]
+    if len(uncached_dates) > 0:
+        normalized = parse_date_components(uncached_dates)
+        normalized_date_cache.update(zip(uncached_dates, normalized))
+
+    normalized_dates = dates.map(normalized_date_cache).astype(object)
+    normalized_dates = normalized_dates.where(normalized_dates.notna(), None)
+
+    unparseable_dates = sorted(dates[normalized_dates.isna()].astype(str).unique())
+    if unparseable_dates:
+        SB_pandas_modifier_error_logger.info(f"{len(unparseable_dates)} dates are not in a valid format: {unparseable_dates}")
+    return normalized_dates
+
+
+@timed()
+def read_raw_file(file_path: str) -> pd.DataFrame:
+    """Opens the .xls file once and turns it into a pandas DataFrame with the expected column names. 
+
+    Args:
+        file_path (str): file path for where the .xls file lives. 
+
+    Returns:
+        pd.DataFrame: raw contents of the file. 
+    """
+    workbook = xlrd.open_workbook_xls(file_path, ignore_workbook_corruption=True)
+    SB_pandas_modifier_error_logger.debug(f"Workbook in {file_path} has been successfully opened.")
+    data = pd.read_excel(workbook, names=column_header_names)
+    SB_pandas_modifier_error_logger.debug(f"Workbook in {file_path} has been successfully turned into a dataframe.")
+    return data
+
+
+@timed()
+def transform_raw_file(file_path: str, save_path:str, data: pd.DataFrame = None) -> csv:
     """Modifies .xls file and converts to a cleaner .csv.
 
     Args:
         file_path (str): file path for where the .xls file lives. 
+        save_path (str): folder the .csv is saved to. 
+        data (pd.DataFrame, optional): the file already parsed by read_raw_file, so it is not opened a second time. 
 
     Returns:
         csv: .csv file. 
     """
     file = file_path
 
-    # Open the file and turn it into a pandas Dataframe. 
-    workbook = xlrd.open_workbook_xls(file, ignore_workbook_corruption=True)
-    SB_pandas_modifier_error_logger.debug(f"Workbook in {file} has been successfully opened.")
-    data = pd.read_excel(workbook, names=column_header_names)
-    SB_pandas_modifier_error_logger.debug(f"Workbook in {file} has been successfully turned into a dataframe.")
+    # Open the file and turn it into a pandas Dataframe, unless the caller already has. 
+    if data is None:
+        data = read_raw_file(file)
 
 
     # Drop the blank column, aka column 0, or column A
@@ -154,7 +246,7 @@ def transform_raw_file(file_path: str, save_path:str) -> csv:
     data['account_owner'] = account_name
 
     # Create a cleaned up date column. 
-    data['cleaned_date'] = data['date'].apply(lambda x: date_cleanup(x))
+    data['cleaned_date'] = normalize_date_series(data['date'])
 
 
     # Save to .csv
@@ -172,8 +264,18 @@ def check_for_blank_file(file_path:str) -> bool:
     Returns:
         bool: True if blank, False if it contains anything we want. 
     """
-    workbook = xlrd.open_workbook_xls(file_path, ignore_workbook_corruption=True)
-    data = pd.read_excel(workbook, names=column_header_names)
+    return check_for_blank_data(read_raw_file(file_path))
+
+
+def check_for_blank_data(data: pd.DataFrame) -> bool:
+    """Checks if an already parsed file contains any data. Returns True if the file is blank. 
+
+    Args:
+        data (pd.DataFrame): file parsed by read_raw_file. 
+
+    Returns:
+        bool: True if blank, False if it contains anything we want. 
+    """
     row_count = len(data.index)
 
     # Files with less 7 rows do not have any data for attendance history and are thus considered 'blank'. These files only contain a name. 
@@ -189,60 +291,296 @@ def check_for_blank_file(file_path:str) -> bool:
 
 directory_path = os.getenv("DIR1")
 
+# Number of processes used to transform a directory. 1 keeps the transform serial. 
+default_transform_workers = int(os.getenv("SB_TRANSFORM_WORKERS", "1"))
+
 blank_files = []
 
 
+def transform_single_file(file_path: str, save_path: str, applied_function: Callable = transform_raw_file) -> dict:
+    """Parses one file, checks if it is blank and if not applies the function to it. Runs either in the parent or in a worker process, 
+    so errors are returned to the caller rather than raised. 
+
+    Args:
+        file_path (str): path to the .xls file. 
+        save_path (str): folder the transformed file is saved to. 
+        applied_function (function, optional): called as applied_function(file_path, save_path, data). Has to be a module level function 
+            when used in a process pool. Defaults to transform_raw_file. 
+
+    Returns:
+        dict: file_name, status ("transformed", "blank", "unreadable" or "failed"), parse_seconds, transform_seconds and error. In a 
+            worker process also metrics, the pipeline_metrics snapshot of this file for the parent to merge. 
+    """
+    is_worker = multiprocessing.current_process().name != "MainProcess"
+    if is_worker:
+        pipeline_metrics.metrics.reset()
+    file_name = os.path.basename(file_path)
+    result = {"file_name": file_name, "status": None, "parse_seconds": 0.0, "transform_seconds": 0.0, "error": None}
+    try:
+        increment("raw_file_bytes", os.path.getsize(file_path))
+        parse_started = time.perf_counter()
+        data = read_raw_file(file_path)
+        result["parse_seconds"] = round(time.perf_counter() - parse_started, 4)
+        increment("raw_rows_read", len(data.index))
+
+        if check_for_blank_data(data) == False:
+            transform_started = time.perf_counter()
+            applied_function(file_path, save_path, data)
+            result["transform_seconds"] = round(time.perf_counter() - transform_started, 4)
+            result["status"] = "transformed"
+        else:
+            result["status"] = "blank"
+    except xlrd.biffh.XLRDError as e:
+        result["status"] = "unreadable"
+        result["error"] = str(e)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    increment(f"files_{result['status']}")
+    if is_worker:
+        result["metrics"] = pipeline_metrics.metrics.get_snapshot()
+    return result
+
+
+def initialize_transform_worker(log_queue) -> None:
+    """Sends the worker's log records to the parent through a queue, so only the parent process writes to the log file. 
+
+    Args:
+        log_queue (multiprocessing.Queue): queue read by the parent's QueueListener. 
+    """
+    worker_logger = logging.getLogger("SB_pandas_modifier_error_logger")
+    worker_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+
+def transform_files_in_pool(file_paths: list, save_path: str, applied_function: Callable, max_workers: int) -> list:
+    """Transforms the files across a process pool. Results come back in file_paths order. 
+
+    Args:
+        file_paths (list): paths to the .xls files. 
+        save_path (str): folder the transformed files are saved to. 
+        applied_function (function): module level function, see transform_single_file. 
+        max_workers (int): number of processes. 
+
+    Returns:
+        list: one result per file, see transform_single_file. 
+    """
+    parent_logger = logging.getLogger("SB_pandas_modifier_error_logger")
+    log_queue = multiprocessing.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, *parent_logger.handlers, respect_handler_level=True)
+    log_listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=initialize_transform_worker, initargs=(log_queue,)) as pool:
+            chunk_size = max(1, len(file_paths) // (max_workers * 4))
+            return list(pool.map(transform_single_file, file_paths, [save_path] * len(file_paths), [applied_function] * len(file_paths),
+                                 chunksize=chunk_size))
+    finally:
+        log_listener.stop()
+
+
 # Loop through the files in the specified directory and get their paths. Check if they're blank and if not, transform them with the specified function. 
 
-def transform_file_directory(directory_path: str, applied_function: function) -> None:
+def transform_file_directory(directory_path: str, applied_function: Callable = transform_raw_file, manifest_path: str = None, 
+                             max_workers: int = default_transform_workers, save_path: str = None) -> list:
     """Look at each file within the directory path and get each file's individual path if not blank. Apply a function to each file path. 
-    Exports a .csv file to cwd with a list of the files it has found to be blank. 
+    Each file is opened and parsed once, the parsed DataFrame is used for the blank check and handed to the applied function. 
+    Exports a .csv file to cwd with a list of the files it has found to be blank, and transform_timings.csv with the time spent per file. 
+    With more than one worker the files are spread across a process pool, the results are collected in directory order so the output 
+    matches a serial run. 
 
     Args:
         directory_path (str): directory path
-
-    Returns: None 
+        applied_function (function, optional): called as applied_function(file_path, save_path, data). Defaults to transform_raw_file. 
+        manifest_path (str, optional): path to the studiobooking_manifest JSON file. When provided, files whose contents have not changed since 
+            they were last transformed are skipped, and transformed files are recorded in the manifest. 
+        max_workers (int, optional): number of processes. Defaults to SB_TRANSFORM_WORKERS or 1, which transforms serially. 
+        save_path (str, optional): folder the transformed files are saved to. Defaults to SB_SAVE_PATH or /Users/save_folder/. 
+
+    Returns: 
+        list: one dictionary per file with file_name, status, parse_seconds and transform_seconds. 
     """
+    file_timings = []
+    if manifest_path:
+        manifest = studiobooking_manifest.load_manifest(manifest_path)
+    content_hashes = {}
+    file_paths = []
+
+    # Set your save path here or in .env file.
+    save_path = os.path.abspath(save_path or os.getenv("SB_SAVE_PATH", '/Users/save_folder/'))
+
     for file_name in listdir(directory_path):
         file_path = os.path.join(directory_path, file_name)
-        
-        # Set your save path here or in .env file.
-        save_path = os.path.abspath('/Users/save_folder/')
-        try:
-            if check_for_blank_file(file_path) == False:
-                applied_function(file_path, save_path)
-                SB_pandas_modifier_error_logger.debug(f"The {applied_function} has been applied to {file_path}.")
-            else:
-                blank_files.append(file_name)
-        except xlrd.biffh.XLRDError as e:
+
+        if manifest_path:
+            content_hashes[file_path] = studiobooking_manifest.hash_file(file_path)
+            if not studiobooking_manifest.is_transform_needed(manifest, file_path, content_hashes[file_path]):
+                SB_pandas_modifier_error_logger.debug(f"{file_path} is unchanged since it was last transformed and has been skipped.")
+                if studiobooking_manifest.is_recorded_blank(manifest, file_path):
+                    blank_files.append(file_name)
+                continue
+        file_paths.append(file_path)
+
+    if max_workers > 1 and len(file_paths) > 1:
+        results = transform_files_in_pool(file_paths, save_path, applied_function, max_workers)
+    else:
+        results = [transform_single_file(file_path, save_path, applied_function) for file_path in file_paths]
+
+    # Only the parent writes the blank list, manifest and logs, in directory order. 
+    for file_path, result in zip(file_paths, results):
+        if "metrics" in result:
+            pipeline_metrics.metrics.merge(result.pop("metrics"))
+        file_name = result["file_name"]
+        if result["status"] == "unreadable":
             SB_pandas_modifier_error_logger.debug(f"An error has occurred attempting to open {file_name}.")
             continue
+        if result["status"] == "failed":
+            SB_pandas_modifier_error_logger.error(f"An error has occurred transforming {file_name}, {result['error']}.")
+            continue
+
+        is_blank = result["status"] == "blank"
+        if is_blank:
+            blank_files.append(file_name)
+        else:
+            SB_pandas_modifier_error_logger.debug(f"The {applied_function} has been applied to {file_path}.")
+        if manifest_path:
+            studiobooking_manifest.record_transform(manifest, file_path, content_hashes[file_path], is_blank)
+        file_timings.append({key: result[key] for key in ("file_name", "status", "parse_seconds", "transform_seconds")})
+        SB_pandas_modifier_error_logger.debug(f"{file_name} parsed in {result['parse_seconds']:.3f}s and transformed in {result['transform_seconds']:.3f}s.")
+
+    if manifest_path:
+        studiobooking_manifest.save_manifest(manifest, manifest_path)
     # Save a .csv file with a list of the files that are blank. 
     with open('blank_files_list.csv', 'w', newline='') as myfile:
         writer = csv.writer(myfile)
         for val in blank_files:
             writer.writerow([val])
+
+    # Save the per file timings. 
+    total_parse_seconds = sum(timing["parse_seconds"] for timing in file_timings)
+    total_transform_seconds = sum(timing["transform_seconds"] for timing in file_timings)
+    SB_pandas_modifier_error_logger.info(f"Transformed {len(file_timings)} files in {directory_path}, {total_parse_seconds:.2f}s parsing and {total_transform_seconds:.2f}s transforming.")
+    pd.DataFrame(file_timings, columns=["file_name", "status", "parse_seconds", "transform_seconds"]).to_csv('transform_timings.csv', index=False)
+    return file_timings
  
-def combine_all_modified_csv_file(directory_path:str, save_path:str) -> None:
-    """Combines all of the .csv files within a directory and saves them as a single file.
+# Columns of the 'modified <name>.csv' files written by transform_raw_file. The first column is the row number written as the index. 
+modified_file_column_names = ['Unnamed: 0'] + column_header_names[1:] + ['account_owner', 'cleaned_date']
+
+combined_file_name = 'combined_modified_files.csv'
+combined_dataset_name = 'combined_modified_files_parquet'
+
+
+def iterate_modified_file_chunks(directory_path: str, chunk_size: int, skip_file_names: tuple = ()):
+    """Reads the modified .csv files in a directory a chunk at a time with the modified file schema enforced. Every value is read as a 
+    string so numbers keep the exact text they were written with and empty cells stay empty. 
 
     Args:
         directory_path (str): Path for where the .csv files to be combined are stored. 
-        save_path (str): Path for where the combined file will be saved. 
+        chunk_size (int): rows read at a time. 
+        skip_file_names (tuple, optional): file names to leave out, ex. the combined file itself. 
+
+    Yields:
+        tuple: (file_name, pd.DataFrame chunk with exactly the modified_file_column_names columns)
     """
-    SB_pandas_modifier_error_logger.debug(f"Starting to attempt to combine all modified csv files in {directory_path}.")
-    df_list = []
     for file_name in listdir(directory_path):
         file_path = os.path.join(directory_path, file_name)
+        if not file_name.endswith('.csv') or file_name in skip_file_names or not os.path.isfile(file_path):
+            continue
         try:
-            df = pd.read_csv(file_path)
-            df_list.append(df)
+            for chunk in pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+                unexpected_columns = set(chunk.columns) - set(modified_file_column_names)
+                if unexpected_columns:
+                    SB_pandas_modifier_error_logger.debug(f"{file_path} has unexpected columns {sorted(unexpected_columns)} that are left out.")
+                yield file_name, chunk.reindex(columns=modified_file_column_names, fill_value='')
         except UnicodeDecodeError as e:
             SB_pandas_modifier_error_logger.debug(f"An error has occured with {file_path} and presenting error {e}.")
         except Exception as e:
             SB_pandas_modifier_error_logger.debug(f"An error has occurred, {e}.")
-        
-        large_df = pd.concat(df_list, ignore_index=True)
+
+
+@timed()
+def combine_all_modified_csv_file(directory_path:str, save_path:str, output_format: str = 'csv', chunk_size: int = 50000) -> str:
+    """Combines all of the .csv files within a directory and saves them as a single file.
+    Rows are streamed to the output a chunk at a time, so memory stays bounded by one chunk however many member files there are. 
+
+    Args:
+        directory_path (str): Path for where the .csv files to be combined are stored. 
+        save_path (str): Path for where the combined file will be saved. 
+        output_format (str, optional): 'csv' for combined_modified_files.csv, or 'parquet' for a Parquet dataset partitioned by the 
+            year and month of cleaned_date. Defaults to 'csv'. 
+        chunk_size (int, optional): rows read and written at a time. Defaults to 50000. 
+
+    Returns:
+        str: path of the combined file or dataset directory. 
+    """
+    SB_pandas_modifier_error_logger.debug(f"Starting to attempt to combine all modified csv files in {directory_path}.")
     save_path = os.path.abspath(save_path)
-    large_df.to_csv(os.path.join(save_path,'combined_modified_files.csv'), index=False)
+    if output_format == 'parquet':
+        output_path = os.path.join(save_path, combined_dataset_name)
+        row_count = write_combined_parquet_dataset(directory_path, output_path, chunk_size)
+    else:
+        output_path = os.path.join(save_path, combined_file_name)
+        row_count = write_combined_csv_file(directory_path, output_path, chunk_size)
+    increment("combined_rows", row_count)
+    increment("combined_output_bytes", get_path_size(output_path))
+    SB_pandas_modifier_error_logger.info(f"Combined {row_count} rows from {directory_path} into {output_path}.")
+    return output_path
+
+
+def write_combined_csv_file(directory_path: str, output_path: str, chunk_size: int) -> int:
+    """Appends every chunk to the combined .csv. Written under a temporary name and renamed once complete. 
+
+    Args:
+        directory_path (str): Path for where the .csv files to be combined are stored. 
+        output_path (str): path of the combined .csv. 
+        chunk_size (int): rows read and written at a time. 
+
+    Returns:
+        int: number of rows written. 
+    """
+    partial_path = output_path + '.part'
+    row_count = 0
+    with open(partial_path, 'w', newline='') as write_file:
+        pd.DataFrame(columns=modified_file_column_names).to_csv(write_file, index=False)
+        for file_name, chunk in iterate_modified_file_chunks(directory_path, chunk_size, skip_file_names=(os.path.basename(output_path),)):
+            chunk.to_csv(write_file, index=False, header=False)
+            row_count += len(chunk.index)
+    os.replace(partial_path, output_path)
+    return row_count
+
+
+def write_combined_parquet_dataset(directory_path: str, output_path: str, chunk_size: int) -> int:
+    """Writes every chunk to a Parquet dataset partitioned by year_month (YYYY-MM of cleaned_date, 'unknown' when it is empty). All columns 
+    are strings, see attendance_store for typed columns. The dataset is built next to output_path and swapped in once complete. 
+
+    Args:
+        directory_path (str): Path for where the .csv files to be combined are stored. 
+        output_path (str): directory of the dataset. 
+        chunk_size (int): rows read and written at a time. 
+
+    Returns:
+        int: number of rows written. 
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column_name, pa.string()) for column_name in modified_file_column_names + ['year_month']])
+    partial_path = output_path + '.part'
+    if os.path.exists(partial_path):
+        shutil.rmtree(partial_path)
+
+    row_count = 0
+    for chunk_number, (file_name, chunk) in enumerate(iterate_modified_file_chunks(directory_path, chunk_size, skip_file_names=(combined_file_name,))):
+        chunk['year_month'] = chunk['cleaned_date'].str.slice(0, 7).replace('', 'unknown')
+        pq.write_to_dataset(
+            pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+            partial_path,
+            partition_cols=['year_month'],
+            basename_template=f"part-{chunk_number}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        row_count += len(chunk.index)
 
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    if row_count > 0:
+        os.replace(partial_path, output_path)
+    return row_count
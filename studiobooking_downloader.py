@@ -0,0 +1,145 @@
+import os
+import re
+import logging
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limiter import TokenBucket
+from pipeline_metrics import increment, span
+
+
+# Downloads the member credit reports over plain HTTP using the session cookies of a logged in Selenium driver. Selenium is only needed
+# for the login, the reports themselves are fetched concurrently by a pooled requests session with retries and a per-host rate limit,
+# and written straight to a target directory instead of Chrome's download folder. fake_studiobooking_server serves placeholder reports
+# locally to try it without the real site.
+
+default_base_url = os.getenv("SB_BASE_URL", "https://studiobookingonline.com")
+default_download_workers = int(os.getenv("SB_DOWNLOAD_WORKERS", "8"))
+default_requests_per_second = float(os.getenv("SB_REQUESTS_PER_SECOND", "10"))
+
+
+def create_member_report_url(gym_name: str, member_id: int, base_url: str = default_base_url) -> str:
+    """Returns the excel export URL of a member's credit report.
+
+    Args:
+        gym_name (str): gym name as it appears in the StudioBookings URL.
+        member_id (int): member ID.
+        base_url (str, optional): StudioBookings host, can point at a local fixture server. Defaults to https://studiobookingonline.com
+
+    Returns:
+        str: https://studiobookingonline.com/[gym_name]/excelreport/member-creditreport/client_id/[client_id]/excelexport/true
+    """
+    return base_url + "/" + gym_name + "/excelreport/member-creditreport/client_id/" + str(member_id) + "/excelexport/true"
+
+
+def create_session_from_driver(driver, pool_size: int = default_download_workers, max_retries: int = 3) -> requests.Session:
+    """Creates a requests session carrying the cookies and user agent of a logged in Selenium driver. Connections are pooled and failed
+    requests (connection errors, 429 and 5xx) are retried with backoff.
+
+    Args:
+        driver (webdriver.Chrome): driver that has completed the login.
+        pool_size (int, optional): connections kept open per host, match it to the number of download workers.
+        max_retries (int, optional): retries per request. Defaults to 3.
+
+    Returns:
+        requests.Session: authenticated session.
+    """
+    session = requests.Session()
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent;")
+
+    retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_download_file_name(response: requests.Response, member_id: int) -> str:
+    """Returns the file name the server suggests for a download prefixed with the member ID, or a name built from the member ID when it
+    does not suggest one. The server may suggest the same name for every member, the prefix keeps concurrent downloads from writing the
+    same file.
+
+    Args:
+        response (requests.Response): download response.
+        member_id (int): member ID.
+
+    Returns:
+        str: file name, ex. 42_MemberCreditReport.xls
+    """
+    content_disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r'filename="?([^";]+)"?', content_disposition)
+    if match:
+        return f"{member_id}_{os.path.basename(match.group(1).strip())}"
+    return f"member_creditreport_{member_id}.xls"
+
+
+def download_member_report(session: requests.Session, url: str, member_id: int, target_dir: str, rate_limiters: dict) -> dict:
+    """Downloads one member report into target_dir. The file is written under a temporary name and renamed once complete so an
+    interrupted download never leaves a partial report behind.
+
+    Args:
+        session (requests.Session): authenticated session.
+        url (str): report URL.
+        member_id (int): member ID.
+        target_dir (str): directory to write the report to.
+        rate_limiters (dict): {host: TokenBucket}
+
+    Returns:
+        dict: member_id, url, file_path, bytes, status ("downloaded" or "failed") and error.
+    """
+    rate_limiters[urlparse(url).netloc].acquire()
+    try:
+        with span("studiobooking.report_download"):
+            response = session.get(url, timeout=60)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        increment("studiobooking_downloads_failed")
+        logging.debug(f"Downloading the report for member {member_id} from {url} failed. {e}")
+        return {"member_id": member_id, "url": url, "file_path": None, "bytes": 0, "status": "failed", "error": str(e)}
+
+    file_path = os.path.join(target_dir, get_download_file_name(response, member_id))
+    partial_path = file_path + ".part"
+    with open(partial_path, "wb") as write_file:
+        write_file.write(response.content)
+    os.replace(partial_path, file_path)
+    increment("studiobooking_downloads")
+    increment("studiobooking_download_bytes", len(response.content))
+    return {"member_id": member_id, "url": url, "file_path": file_path, "bytes": len(response.content), "status": "downloaded", "error": None}
+
+
+def download_member_reports(session: requests.Session, gym_name: str, member_ids: list, target_dir: str,
+                            max_workers: int = default_download_workers, requests_per_second: float = default_requests_per_second,
+                            base_url: str = default_base_url) -> list:
+    """Downloads the credit reports for every member ID concurrently with bounded parallelism and a per-host rate limit.
+
+    Args:
+        session (requests.Session): authenticated session, see create_session_from_driver.
+        gym_name (str): gym name as it appears in the StudioBookings URL.
+        member_ids (list): member IDs to download.
+        target_dir (str): directory to write the reports to, created if missing.
+        max_workers (int, optional): concurrent downloads. Defaults to SB_DOWNLOAD_WORKERS or 8.
+        requests_per_second (float, optional): request rate allowed per host. Defaults to SB_REQUESTS_PER_SECOND or 10.
+        base_url (str, optional): StudioBookings host. Defaults to https://studiobookingonline.com
+
+    Returns:
+        list: one result dictionary per member, in member_ids order, see download_member_report.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    urls = [create_member_report_url(gym_name, member_id, base_url) for member_id in member_ids]
+    rate_limiters = {host: TokenBucket(requests_per_second) for host in {urlparse(url).netloc for url in urls}}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(
+            lambda url_and_id: download_member_report(session, url_and_id[0], url_and_id[1], target_dir, rate_limiters),
+            zip(urls, member_ids),
+        ))
+
+    failed_count = sum(1 for result in results if result["status"] == "failed")
+    logging.info(f"Downloaded {len(results) - failed_count} of {len(results)} member reports to {target_dir}, {failed_count} failed.")
+    return results
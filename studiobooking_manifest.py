@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+import xlrd
+
+from studiobooking_downloader import download_member_reports
+
+
+# Manifest of what has been downloaded and transformed, so a refresh only does work for members whose report actually changed.
+# {
+#   "members": {"<member_id>": {"downloaded_at": ..., "content_hash": ..., "row_count": ..., "file_name": ...}},
+#   "transformed": {"<file_name>": {"content_hash": <hash of the file when it was last transformed>, "is_blank": ...}}
+# }
+
+default_manifest_path = os.getenv("SB_MANIFEST_PATH", "studiobooking_manifest.json")
+# Upper bound on the batches discover_new_member_reports probes in one run, in case the site answers unknown member IDs with reports.
+default_max_probe_batches = int(os.getenv("SB_MAX_PROBE_BATCHES", "20"))
+# Reports with fewer rows only hold a name and no attendance, the same rule as check_for_blank_data in studiobooking_data_modifications.
+blank_report_row_count = 7
+
+
+def load_manifest(manifest_path: str = default_manifest_path) -> dict:
+    """Loads the manifest, or returns an empty one if it does not exist yet.
+
+    Args:
+        manifest_path (str, optional): path to the manifest JSON file.
+
+    Returns:
+        dict: manifest with members and transformed keys.
+    """
+    if not os.path.exists(manifest_path):
+        return {"members": {}, "transformed": {}}
+    with open(manifest_path) as read_file:
+        manifest = json.load(read_file)
+    manifest.setdefault("members", {})
+    manifest.setdefault("transformed", {})
+    return manifest
+
+
+def save_manifest(manifest: dict, manifest_path: str = default_manifest_path) -> None:
+    """Writes the manifest atomically so an interrupted run never leaves a half written file.
+
+    Args:
+        manifest (dict): manifest to save.
+        manifest_path (str, optional): path to the manifest JSON file.
+    """
+    partial_path = manifest_path + ".part"
+    with open(partial_path, "w") as write_file:
+        json.dump(manifest, write_file, indent=2, sort_keys=True)
+    os.replace(partial_path, manifest_path)
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the SHA-256 of a file's contents.
+
+    Args:
+        file_path (str): path to the file.
+
+    Returns:
+        str: hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as read_file:
+        for block in iter(lambda: read_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_report_rows(file_path: str) -> int:
+    """Returns the number of rows in the first sheet of a downloaded report, without building a DataFrame.
+
+    Args:
+        file_path (str): path to the .xls file.
+
+    Returns:
+        int: row count, None if the file is not a readable workbook (ex. an error page for a member ID that does not exist).
+    """
+    try:
+        workbook = xlrd.open_workbook_xls(file_path, ignore_workbook_corruption=True, on_demand=True)
+        row_count = workbook.sheet_by_index(0).nrows
+        workbook.release_resources()
+        return row_count
+    except xlrd.biffh.XLRDError as e:
+        logging.debug(f"{file_path} is not a readable workbook. {e}")
+        return None
+
+
+def record_download(manifest: dict, download_result: dict) -> bool:
+    """Records a downloaded report in the manifest.
+
+    Args:
+        manifest (dict): manifest to update.
+        download_result (dict): result from studiobooking_downloader.download_member_report.
+
+    Returns:
+        bool: True if the report is new or its contents changed since the previous download.
+    """
+    content_hash = hash_file(download_result["file_path"])
+    member_key = str(download_result["member_id"])
+    previous_entry = manifest["members"].get(member_key, {})
+    manifest["members"][member_key] = {
+        "downloaded_at": datetime.now().isoformat(timespec="seconds"),
+        "content_hash": content_hash,
+        "row_count": count_report_rows(download_result["file_path"]),
+        "file_name": os.path.basename(download_result["file_path"]),
+    }
+    return previous_entry.get("content_hash") != content_hash
+
+
+def get_known_max_member_id(manifest: dict, default_max_member_id: int = 0) -> int:
+    """Returns the highest member ID recorded in the manifest.
+
+    Args:
+        manifest (dict): manifest.
+        default_max_member_id (int, optional): used when the manifest is empty. Defaults to 0.
+
+    Returns:
+        int: highest known member ID.
+    """
+    return max([int(member_id) for member_id in manifest["members"]] + [default_max_member_id])
+
+
+def is_existing_member_report(download_result: dict) -> bool:
+    """Returns True when a download is a real member report. Member IDs past the newest member fail or return a page that is not a
+    workbook.
+
+    Args:
+        download_result (dict): result from studiobooking_downloader.download_member_report.
+
+    Returns:
+        bool: True for a readable report.
+    """
+    if download_result["status"] != "downloaded":
+        return False
+    if count_report_rows(download_result["file_path"]) is None:
+        os.remove(download_result["file_path"])
+        return False
+    return True
+
+
+def discover_new_member_reports(session, gym_name: str, target_dir: str, first_member_id: int, probe_limit: int = 10,
+                                max_probe_batches: int = default_max_probe_batches) -> list:
+    """Downloads the reports of member IDs past the known maximum, a batch of probe_limit IDs at a time, until a whole batch holds no
+    member with attendance. Member IDs are sequential so the first such batch marks the end. Blank reports only count as members in a
+    batch that also holds a report with attendance, since the site may answer unknown IDs with a blank report.
+
+    Args:
+        session (requests.Session): authenticated session.
+        gym_name (str): gym name as it appears in the StudioBookings URL.
+        target_dir (str): directory to write the reports to.
+        first_member_id (int): first member ID to probe, one past the known maximum.
+        probe_limit (int, optional): IDs probed per batch. Defaults to 10.
+        max_probe_batches (int, optional): batches probed at most. Defaults to SB_MAX_PROBE_BATCHES or 20.
+
+    Returns:
+        list: download results of the newly found members.
+    """
+    new_member_results = []
+    batch_start = first_member_id
+    for _ in range(max_probe_batches):
+        batch_results = download_member_reports(session, gym_name, list(range(batch_start, batch_start + probe_limit)), target_dir)
+        found_results = [result for result in batch_results if is_existing_member_report(result)]
+        if not any(count_report_rows(result["file_path"]) >= blank_report_row_count for result in found_results):
+            # Only blank reports left, they are not recorded so the known maximum does not creep forward on every run.
+            for result in found_results:
+                os.remove(result["file_path"])
+            break
+        new_member_results.extend(found_results)
+        batch_start += probe_limit
+    else:
+        logging.warning(f"Stopped probing for new members at member ID {batch_start} after {max_probe_batches} batches, raise "
+                        "SB_MAX_PROBE_BATCHES if more members were added since the last run.")
+    logging.info(f"Discovered {len(new_member_results)} new member reports starting at member ID {first_member_id}.")
+    return new_member_results
+
+
+def download_changed_member_reports(session, gym_name: str, target_dir: str, manifest_path: str = default_manifest_path,
+                                    default_max_member_id: int = 0, first_member_id: int = 1) -> list:
+    """Refreshes every known member report, discovers members added since the last run and records them in the manifest.
+
+    Args:
+        session (requests.Session): authenticated session, see studiobooking_downloader.create_session_from_driver.
+        gym_name (str): gym name as it appears in the StudioBookings URL.
+        target_dir (str): directory to write the reports to.
+        manifest_path (str, optional): path to the manifest JSON file.
+        default_max_member_id (int, optional): highest member ID to download when there is no manifest yet. Defaults to 0, which relies on
+            discovery alone, capped at max_probe_batches batches of new IDs.
+        first_member_id (int, optional): lowest member ID to download. Defaults to 1.
+
+    Returns:
+        list: file paths of the reports that are new or changed since the previous run.
+    """
+    manifest = load_manifest(manifest_path)
+    known_max_member_id = get_known_max_member_id(manifest, default_max_member_id)
+
+    download_results = download_member_reports(session, gym_name, list(range(first_member_id, known_max_member_id + 1)), target_dir)
+    download_results = [result for result in download_results if result["status"] == "downloaded"]
+    download_results += discover_new_member_reports(session, gym_name, target_dir, max(known_max_member_id, first_member_id - 1) + 1)
+
+    changed_files = [result["file_path"] for result in download_results if record_download(manifest, result)]
+    save_manifest(manifest, manifest_path)
+    logging.info(f"{len(changed_files)} of {len(download_results)} member reports are new or changed.")
+    return changed_files
+
+
+def is_transform_needed(manifest: dict, file_path: str, content_hash: str) -> bool:
+    """Returns True unless the file was already transformed with exactly these contents.
+
+    Args:
+        manifest (dict): manifest.
+        file_path (str): path to the report.
+        content_hash (str): current hash of the report, see hash_file.
+
+    Returns:
+        bool: True if the report should be transformed.
+    """
+    return manifest["transformed"].get(os.path.basename(file_path), {}).get("content_hash") != content_hash
+
+
+def record_transform(manifest: dict, file_path: str, content_hash: str, is_blank: bool = False) -> None:
+    """Records that the report has been transformed with these contents.
+
+    Args:
+        manifest (dict): manifest to update.
+        file_path (str): path to the report.
+        content_hash (str): hash of the transformed report.
+        is_blank (bool, optional): the report had no attendance rows, so skipped runs can still list it as blank.
+    """
+    manifest["transformed"][os.path.basename(file_path)] = {"content_hash": content_hash, "is_blank": is_blank}
+
+
+def is_recorded_blank(manifest: dict, file_path: str) -> bool:
+    """Returns True if the report was blank when it was last transformed.
+
+    Args:
+        manifest (dict): manifest.
+        file_path (str): path to the report.
+
+    Returns:
+        bool: True if recorded as blank.
+    """
+    return manifest["transformed"].get(os.path.basename(file_path), {}).get("is_blank", False)
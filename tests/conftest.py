@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+import stripe
+
+# The modules live at the top of the repository rather than in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_stripe_server import start_fake_stripe_server  # noqa: E402
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    """Starts a fake Stripe server and points the global stripe configuration at it. Call the returned function with the served data.
+
+    Yields:
+        function: start(data) -> FakeStripeServer
+    """
+    servers = []
+
+    def start(data: dict):
+        server = start_fake_stripe_server(data)
+        servers.append(server)
+        monkeypatch.setattr(stripe, "api_key", "sk_test_fake_stripe_server")
+        monkeypatch.setattr(stripe, "api_base", server.url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,46 @@
+import os
+
+import xlwt
+
+
+# Writes the small StudioBookings member credit reports in this directory, laid out like the site's excel export: a header row, the
+# member's name, five blank rows and the attendance rows. Only needed to change the fixtures, it requires xlwt:
+#   python tests/fixtures/create_studiobooking_reports.py
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "studiobooking_reports")
+
+header = ["", "Date", "Class Booked", "Class Date", "Class Time", "Package Name", "Balance", "Balance Used", "Remaining Balance",
+          "Transaction Type", "Modified By"]
+
+
+def create_attendance_rows(member_number: int, row_count: int) -> list:
+    rows = []
+    for i in range(row_count):
+        day = 1 + (i * 3 + member_number) % 28
+        # Both date formats the transform accepts, and one value it cannot parse.
+        if i % 3 == 0:
+            date = f"{day}/{1 + i % 12}/2024  {1 + i % 12}:{i % 60:02d} PM"
+        elif i % 3 == 1:
+            date = f"{day:02d}-{1 + i % 12:02d}-2023 {i % 24:02d}:15:00"
+        else:
+            date = "not a date" if i == 2 else f"{day}/{1 + i % 12}/24 9:30:00 AM"
+        rows.append(["", date, "Reformer", f"{day:02d}/{1 + i % 12:02d}/2024", "09:30", "10 Class Pack", 10, 1, 9 - i % 10,
+                     "Booking", "Front Desk"])
+    return rows
+
+
+def write_report(file_name: str, member_name: str, attendance_rows: list) -> None:
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet("Sheet1")
+    rows = [header, ["", f"{member_name} Credit Report"] + [""] * 9] + [[""] * 11] * 5 + attendance_rows
+    for row_number, row in enumerate(rows):
+        for column_number, value in enumerate(row):
+            sheet.write(row_number, column_number, value)
+    workbook.save(os.path.join(fixture_dir, file_name))
+
+
+if __name__ == "__main__":
+    os.makedirs(fixture_dir, exist_ok=True)
+    for member_number, member_name in enumerate(["Alex Smith", "Jordan Lee", "Taylor Brown", "Morgan Garcia"], start=1):
+        write_report(f"{member_number}_MemberCreditReport.xls", member_name, create_attendance_rows(member_number, 12 * member_number))
+    write_report("5_MemberCreditReport.xls", "Casey Miller", [])
@@ -0,0 +1,24 @@
+import stripe
+
+import reporting_functions
+import async_stripe_access
+from fake_stripe_server import generate_synthetic_data
+
+
+def test_concurrent_charges_match_the_sequential_report(fake_stripe, monkeypatch):
+    server = fake_stripe(generate_synthetic_data(num_customers=30, num_charges=300, start_date=20240101, end_date=20240131, seed=2))
+    for name, value in {"STRIPE_API_BASE": server.url, "PLATFORM": "kahunas", "STRIPE_SECRET_API_KEY_KAHUNAS": stripe.api_key,
+                        "RUN_FROM_LIVE_API_ENABLED": "true", "RUN_FROM_JSON_ENABLED": "false", "LOCAL_STORE_ENABLED": "false",
+                        "REPORT_CACHE_ENABLED": "false", "LOGGING_ENABLED": "false"}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(stripe, "api_version", stripe.api_version)
+    reporting_functions.configure(force=True)
+
+    customer_ids = reporting_functions.return_list_of_customer_ids(20240101, 20240201)
+    sequential_charges = [customer_charges for customer_id in customer_ids
+                          for customer_charges in reporting_functions.return_list_of_charges_by_customer(20240101, 20240201, customer_id)]
+
+    concurrent_charges = async_stripe_access.return_charges_for_customers(20240101, 20240201, customer_ids, max_concurrency=8)
+
+    assert len(customer_ids) == 30
+    assert concurrent_charges == sequential_charges
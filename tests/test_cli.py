@@ -0,0 +1,24 @@
+import json
+
+import dotenv
+
+import cli
+
+
+def test_metrics_settings_from_dotenv_apply(monkeypatch, tmp_path):
+    for name in ("PIPELINE_METRICS_PATH", "PIPELINE_PROFILE", "PIPELINE_PROFILE_TOP_ENTRIES"):
+        # Set then removed, so the values load_dotenv adds are removed again after the test.
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("PIPELINE_METRICS_PATH=metrics.json\nPIPELINE_PROFILE=tracemalloc\nPIPELINE_PROFILE_TOP_ENTRIES=3\n")
+    # load_dotenv looks for the .env file next to cli.py.
+    monkeypatch.setattr(cli, "load_dotenv", lambda: dotenv.load_dotenv(tmp_path / ".env"))
+
+    cli.main(["flags"])
+
+    with open(tmp_path / "metrics.json") as read_file:
+        summary = json.load(read_file)
+    assert summary["command"] == "flags"
+    assert summary["profile"]["mode"] == "tracemalloc"
+    assert len(summary["profile"]["top_allocations"]) <= 3
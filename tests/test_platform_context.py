@@ -0,0 +1,35 @@
+import pytest
+import stripe
+
+from fake_stripe_server import generate_synthetic_data
+from platform_context import PlatformContext, create_all_platform_contexts
+
+
+def test_platform_client_requests_the_configured_api_version(fake_stripe, monkeypatch):
+    server = fake_stripe(generate_synthetic_data(num_customers=20, num_charges=50, seed=3))
+    monkeypatch.setattr(stripe, "api_version", "2023-10-16")
+
+    context = PlatformContext("kahunas", "sk_test_fake_stripe_server", api_base=server.url)
+    list(context.get_data_source().list_objects("charges"))
+
+    assert context.stripe_version == "2023-10-16"
+    assert list(server.get_stats()["requests_by_api_version"]) == ["2023-10-16"]
+
+
+def test_combined_replay_needs_a_dump_directory_per_platform(monkeypatch, tmp_path):
+    monkeypatch.setenv("STRIPE_SECRET_API_KEY_KAHUNAS", "sk_test_kahunas")
+    monkeypatch.setenv("STRIPE_SECRET_API_KEY_STUDIO_BOOKINGS", "sk_test_studio_bookings")
+    monkeypatch.setenv("STRIPE_JSON_DIR", str(tmp_path))
+    monkeypatch.delenv("STRIPE_JSON_DIR_KAHUNAS", raising=False)
+    monkeypatch.delenv("STRIPE_JSON_DIR_STUDIO_BOOKINGS", raising=False)
+    with pytest.raises(ValueError, match="STRIPE_JSON_DIR_"):
+        create_all_platform_contexts(data_source_selection="Local JSON")
+
+    monkeypatch.setenv("STRIPE_JSON_DIR_KAHUNAS", str(tmp_path))
+    monkeypatch.setenv("STRIPE_JSON_DIR_STUDIO_BOOKINGS", str(tmp_path))
+    with pytest.raises(ValueError, match="share the dump directory"):
+        create_all_platform_contexts(data_source_selection="Local JSON")
+
+    monkeypatch.setenv("STRIPE_JSON_DIR_STUDIO_BOOKINGS", str(tmp_path / "studio_bookings"))
+    contexts = create_all_platform_contexts(data_source_selection="Local JSON")
+    assert [context.json_dir for context in contexts] == [str(tmp_path), str(tmp_path / "studio_bookings")]
@@ -0,0 +1,50 @@
+import sqlite3
+
+from report_cache import ReportCache
+
+
+def test_cache_key_includes_data_source(tmp_path):
+    cache_context = {"data_source": "Local JSON"}
+    cache = ReportCache(str(tmp_path / "cache.db"), get_cache_context=lambda: ("KAHUNAS", cache_context["data_source"], "2024-06-20"))
+    calls = []
+
+    @cache.cached
+    def return_report(start_date, end_date):
+        calls.append(cache_context["data_source"])
+        return cache_context["data_source"]
+
+    # A closed period, its entries are never evicted.
+    assert return_report(20200101, 20200115) == "Local JSON"
+    cache_context["data_source"] = "Live API"
+    assert return_report(20200101, 20200115) == "Live API"
+    assert return_report(20200101, 20200115) == "Live API"
+    assert calls == ["Local JSON", "Live API"]
+
+
+def test_cache_written_without_data_source_is_dropped(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE report_cache (platform TEXT, function_name TEXT, start_date INTEGER, end_date INTEGER, "
+                       "api_version TEXT, arguments TEXT, is_closed INTEGER, created_at REAL, last_used_at REAL, value BLOB)")
+    connection.commit()
+    connection.close()
+
+    cache = ReportCache(db_path, get_cache_context=lambda: ("KAHUNAS", "Live API", ""))
+    assert cache.get(("KAHUNAS", "Live API", "return_report", 20200101, 20200115, "", "[]")) == (False, None)
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_only_live_results_are_closed(tmp_path):
+    cache_context = {"data_source": "Local Store"}
+    cache = ReportCache(str(tmp_path / "cache.db"), get_cache_context=lambda: ("KAHUNAS", cache_context["data_source"], ""),
+                        closed_data_sources=("Live API",))
+
+    @cache.cached
+    def return_report(start_date, end_date):
+        return cache_context["data_source"]
+
+    return_report(20200101, 20200115)
+    assert cache.get_stats()["closed_entries"] == 0
+    cache_context["data_source"] = "Live API"
+    return_report(20200101, 20200115)
+    assert cache.get_stats()["closed_entries"] == 1
@@ -0,0 +1,104 @@
+import pytest
+
+import reporting_functions
+
+
+class ListDataSource:
+    name = "Test"
+
+    def __init__(self, objects: dict):
+        """Serves fixed objects, {object type: list of objects}, and counts the searches."""
+        self.objects = objects
+        self.search_count = 0
+
+    def search_objects(self, object_type, start_epoch, end_epoch, customer_id=None):
+        self.search_count += 1
+        return [stripe_object for stripe_object in self.objects.get(object_type, [])
+                if start_epoch < stripe_object["created"] < end_epoch and customer_id in (None, stripe_object.get("customer"))]
+
+
+@pytest.fixture
+def data_source(monkeypatch):
+    """Replaces the data source and platform of the report functions and turns the report cache off."""
+    def use_objects(objects: dict) -> ListDataSource:
+        source = ListDataSource(objects)
+        monkeypatch.setattr(reporting_functions, "get_data_source", lambda: source)
+        return source
+
+    monkeypatch.setattr(reporting_functions, "get_platform_name", lambda: "KAHUNAS")
+    monkeypatch.setattr(reporting_functions.report_cache, "enabled", False)
+    return use_objects
+
+
+def create_charge(charge_id: str, customer_id: str, status: str, amount: int, created: int = 1718000000) -> dict:
+    return {"id": charge_id, "customer": customer_id, "receipt_email": f"{customer_id}@example.com", "status": status, "amount": amount,
+            "amount_captured": amount if status == "succeeded" else 0, "created": created}
+
+
+def test_group_charges_by_customer():
+    charges = [
+        create_charge("ch_1", "cus_a", "succeeded", 2000),
+        create_charge("ch_2", "cus_b", "failed", 15000),
+        create_charge("ch_3", "cus_a", "failed", 2500),
+        create_charge("ch_4", "cus_a", "succeeded", 2500),
+        create_charge("ch_5", "cus_c", "succeeded", 18000),
+    ]
+
+    grouped_charges = reporting_functions.group_charges_by_customer(charges)
+
+    assert [customer_charges["customer_id"] for customer_charges in grouped_charges] == ["cus_a", "cus_b", "cus_c"]
+    cus_a, cus_b, cus_c = grouped_charges
+    assert (cus_a["charge_count"], cus_a["successful_count"], cus_a["failed_count"]) == (3, 2, 1)
+    assert (cus_a["total_attempted"], cus_a["total_collected"]) == (70.0, 45.0)
+    assert cus_a["failure_rate"] == pytest.approx(1 / 3)
+    assert [charge[0] for charge in cus_a["successful_charges"]] == ["ch_1", "ch_4"]
+    assert cus_a["failed_charges"][0][0] == "ch_3"
+    assert cus_a["customer_email"] == "cus_a@example.com"
+    assert (cus_b["total_attempted"], cus_b["total_collected"], cus_b["failure_rate"]) == (150.0, 0.0, 1.0)
+    assert "successful_charges" not in cus_b
+    assert (cus_c["failure_rate"], "failed_charges" in cus_c) == (0.0, False)
+    assert reporting_functions.group_charges_by_customer([]) == []
+
+
+def test_charges_of_a_customer_without_charges(data_source):
+    data_source({"charges": [create_charge("ch_1", "cus_a", "succeeded", 2000)]})
+
+    assert reporting_functions.return_list_of_charges_by_customer(20240601, 20240615, "cus_none") == [{"customer_id": "cus_none"}]
+    customer_charges = reporting_functions.return_list_of_charges_by_customer(20240601, 20240615, "cus_a")
+    assert customer_charges[0]["failed_charges"] == []
+    assert customer_charges[0]["total_collected"] == 20.0
+
+
+def create_customer(customer_id: str, email: str, created: int = 1718000000) -> dict:
+    return {"id": customer_id, "email": email, "created": created}
+
+
+def test_deduplicate_clients_by_email(monkeypatch):
+    monkeypatch.setattr(reporting_functions, "get_platform_name", lambda: "KAHUNAS")
+    customers = [
+        create_customer("cus_1", "Member@Example.com"),
+        create_customer("cus_2", "  member@example.com "),
+        create_customer("cus_3", "other@example.com"),
+        create_customer("cus_4", "MEMBER@EXAMPLE.COM"),
+        create_customer("cus_5", "third@example.com"),
+    ]
+
+    customer_list, duplicate_accounts = reporting_functions.deduplicate_clients_by_email(customers)
+
+    # The first account of an email is kept, Stripe lists the newest first.
+    assert [customer[1] for customer in customer_list] == ["cus_1", "cus_3", "cus_5"]
+    assert [customer[1] for customer in duplicate_accounts] == ["cus_2", "cus_4"]
+    assert customer_list[0] == ["KAHUNAS", "cus_1", "Member@Example.com",
+                                reporting_functions.convert_epoch_unix_to_human_readable(1718000000)]
+
+
+def test_return_total_clients_reuses_the_client_list(data_source):
+    source = data_source({"customers": [create_customer("cus_1", "a@example.com"), create_customer("cus_2", "A@example.com"),
+                                        create_customer("cus_3", "b@example.com")]})
+
+    customer_list, duplicate_accounts = reporting_functions.return_list_of_clients_and_duplicates(20240601, 20240615)
+    assert source.search_count == 1
+    assert reporting_functions.return_total_clients(20240601, 20240615, customer_list) == 2
+    assert source.search_count == 1
+    assert reporting_functions.return_total_clients(20240601, 20240615) == 2
+    assert source.search_count == 2
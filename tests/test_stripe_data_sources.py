@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+
+import stripe_local_store
+from fake_stripe_server import generate_synthetic_data
+from stripe_ndjson_export import export_objects_to_ndjson
+from stripe_data_sources import LiveStripeSource, LocalStoreSource, JsonReplaySource
+
+
+def test_sources_list_the_same_subscriptions(fake_stripe, tmp_path):
+    data = generate_synthetic_data(num_customers=300, num_charges=50, seed=1)
+    fake_stripe(data)
+    db_path = str(tmp_path / "store.db")
+    stripe_local_store.sync_local_store(db_path)
+    # Dumped with status="all", like gather_stripe_reports.
+    export_objects_to_ndjson(stripe.Subscription, str(tmp_path / "20230101_20241231_subscriptions_list.ndjson.gz"), status="all")
+
+    listed_ids = {}
+    for source in (LiveStripeSource(), LocalStoreSource(db_path), JsonReplaySource(str(tmp_path))):
+        listed_ids[source.name] = sorted(subscription["id"] for subscription in source.list_objects("subscriptions"))
+
+    active_ids = sorted(subscription["id"] for subscription in data["subscriptions"] if subscription["status"] != "canceled")
+    assert listed_ids == {"Live API": active_ids, "Local Store": active_ids, "Local JSON": active_ids}
+
+
+def test_replay_indexes_each_object_type_once(monkeypatch, tmp_path):
+
+    source = JsonReplaySource(str(tmp_path))
+    loads = []
+
+    def load_dump_objects(object_type):
+        loads.append(object_type)
+        time.sleep(0.05)
+        return [{"id": "ch_1", "object": "charge", "created": 1000}]
+
+    monkeypatch.setattr(source, "load_dump_objects", load_dump_objects)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: source.search_objects("charges", 0, 2000), range(4)))
+
+    assert loads == ["charges"]
+    assert all(len(result) == 1 for result in results)
@@ -0,0 +1,14 @@
+import stripe_fetch_executor
+
+
+def test_settings_are_read_when_used(monkeypatch):
+    # Set after the module was imported, as when configure loads the .env file.
+    monkeypatch.setenv("STRIPE_SEARCH_RATE_LIMIT", "7")
+    monkeypatch.setenv("STRIPE_FETCH_WORKERS", "3")
+    monkeypatch.setattr(stripe_fetch_executor, "rate_limiters", {})
+    token = stripe_fetch_executor.rate_limit_account.set("test_settings_account")
+    try:
+        assert stripe_fetch_executor.get_rate_limiter("search").rate == 7
+    finally:
+        stripe_fetch_executor.rate_limit_account.reset(token)
+    assert stripe_fetch_executor.FetchExecutor().max_workers == 3
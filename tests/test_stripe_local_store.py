@@ -0,0 +1,46 @@
+import stripe_local_store
+
+
+def create_event(event_id: str, event_type: str, created: int, stripe_object: dict) -> dict:
+    return {"id": event_id, "object": "event", "type": event_type, "created": created, "data": {"object": stripe_object}}
+
+
+def test_sync_applies_events_oldest_first(fake_stripe, tmp_path):
+    charge = {"id": "ch_1", "object": "charge", "customer": "cus_1", "amount": 2000, "status": "succeeded", "created": 1000}
+    refunded_charge = dict(charge, refunded=True)
+    succeeded_charge = dict(charge, refunded=False)
+    customer = {"id": "cus_2", "object": "customer", "email": "member2@example.com", "created": 1000}
+    fake_stripe({
+        # The deleted customer is no longer listed, the refunded charge is listed in its current state.
+        "customers": [],
+        "charges": [refunded_charge],
+        "events": [
+            create_event("evt_1", "charge.succeeded", 1000, succeeded_charge),
+            create_event("evt_2", "customer.created", 1000, customer),
+            create_event("evt_3", "customer.deleted", 1050, customer),
+            create_event("evt_4", "charge.refunded", 1100, refunded_charge),
+        ],
+    })
+    db_path = str(tmp_path / "store.db")
+
+    sync_counts = stripe_local_store.sync_local_store(db_path)
+
+    assert sync_counts["events"] == 4
+    charges = stripe_local_store.query_objects("charges", 0, 2000, db_path=db_path)
+    assert [stored_charge["refunded"] for stored_charge in charges] == [True]
+    assert stripe_local_store.query_objects("customers", 0, 2000, db_path=db_path) == []
+
+
+def test_sync_fetches_objects_created_in_the_cursor_second(fake_stripe, tmp_path):
+    first_customer = {"id": "cus_1", "object": "customer", "email": "member1@example.com", "created": 1000}
+    late_customer = {"id": "cus_2", "object": "customer", "email": "member2@example.com", "created": 1000}
+    db_path = str(tmp_path / "store.db")
+
+    fake_stripe({"customers": [first_customer]})
+    stripe_local_store.sync_local_store(db_path)
+    # Created in the same second as the newest synced customer, but only visible after the first sync.
+    fake_stripe({"customers": [first_customer, late_customer]})
+    stripe_local_store.sync_local_store(db_path)
+
+    customers = stripe_local_store.query_objects("customers", 0, 2000, db_path=db_path)
+    assert sorted(customer["id"] for customer in customers) == ["cus_1", "cus_2"]
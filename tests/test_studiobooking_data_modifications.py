@@ -0,0 +1,36 @@
+import os
+
+import studiobooking_data_modifications
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "studiobooking_reports")
+
+
+def read_output_files(directory: str) -> dict:
+    output_files = {}
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name), "rb") as read_file:
+            output_files[file_name] = read_file.read()
+    return output_files
+
+
+def test_pool_transform_matches_serial_transform(monkeypatch, tmp_path):
+    # The blank list and timings are written to cwd.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(studiobooking_data_modifications, "blank_files", [])
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "pool").mkdir()
+
+    serial_results = studiobooking_data_modifications.transform_file_directory(fixture_dir, max_workers=1, save_path=str(tmp_path / "serial"))
+    with open("blank_files_list.csv", "rb") as read_file:
+        serial_blank_list = read_file.read()
+    studiobooking_data_modifications.blank_files.clear()
+    pool_results = studiobooking_data_modifications.transform_file_directory(fixture_dir, max_workers=2, save_path=str(tmp_path / "pool"))
+    with open("blank_files_list.csv", "rb") as read_file:
+        pool_blank_list = read_file.read()
+
+    serial_files = read_output_files(tmp_path / "serial")
+    assert len(serial_files) == 4
+    assert read_output_files(tmp_path / "pool") == serial_files
+    assert pool_blank_list == serial_blank_list == b"5_MemberCreditReport.xls\r\n"
+    assert [(result["file_name"], result["status"]) for result in pool_results] == \
+        [(result["file_name"], result["status"]) for result in serial_results]
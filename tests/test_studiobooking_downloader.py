@@ -0,0 +1,25 @@
+import requests
+
+from fake_studiobooking_server import start_fake_studiobooking_server
+from studiobooking_downloader import download_member_reports
+
+
+def test_download_member_reports_with_a_shared_file_name(tmp_path):
+    reports = {member_id: f"report of member {member_id}".encode() for member_id in range(1, 21)}
+    # The real site suggests the same file name for every member.
+    server = start_fake_studiobooking_server(reports, file_name="MemberCreditReport.xls")
+    try:
+        results = download_member_reports(requests.Session(), "gym", list(range(1, 23)), str(tmp_path), max_workers=8,
+                                          requests_per_second=1000, base_url=server.url)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [result["member_id"] for result in results] == list(range(1, 23))
+    assert [result["status"] for result in results] == ["downloaded"] * 20 + ["failed"] * 2
+    for result in results[:20]:
+        with open(result["file_path"], "rb") as read_file:
+            assert read_file.read() == reports[result["member_id"]]
+    assert len({result["file_path"] for result in results[:20]}) == 20
+    assert not list(tmp_path.glob("*.part"))
+    assert sorted(server.requested_member_ids) == list(range(1, 23))
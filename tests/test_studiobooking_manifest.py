@@ -0,0 +1,52 @@
+import studiobooking_manifest
+
+
+def fake_downloads(monkeypatch, tmp_path, row_counts: dict):
+    """Serves every member ID with a report of row_counts[member_id] rows, 3 (a blank report) for unknown IDs."""
+    requested_ids = []
+
+    def download_member_reports(session, gym_name, member_ids, target_dir):
+        results = []
+        for member_id in member_ids:
+            requested_ids.append(member_id)
+            file_path = tmp_path / f"member_{member_id}.xls"
+            file_path.write_text(str(row_counts.get(member_id, 3)))
+            results.append({"member_id": member_id, "status": "downloaded", "file_path": str(file_path)})
+        return results
+
+    monkeypatch.setattr(studiobooking_manifest, "download_member_reports", download_member_reports)
+    monkeypatch.setattr(studiobooking_manifest, "count_report_rows", lambda file_path: int(open(file_path).read()))
+    return requested_ids
+
+
+def test_discovery_stops_at_a_batch_of_blank_reports(monkeypatch, tmp_path):
+    requested_ids = fake_downloads(monkeypatch, tmp_path, {11: 20, 12: 3, 18: 9})
+
+    results = studiobooking_manifest.discover_new_member_reports(None, "gym", str(tmp_path), 11, probe_limit=5)
+
+    # The blank report of member 12 is kept because its batch holds a member with attendance, the batch of 21 to 25 ends discovery.
+    assert [result["member_id"] for result in results] == list(range(11, 21))
+    assert requested_ids == list(range(11, 26))
+    assert not (tmp_path / "member_21.xls").exists()
+
+
+def test_discovery_is_capped(monkeypatch, tmp_path):
+    requested_ids = fake_downloads(monkeypatch, tmp_path, {member_id: 20 for member_id in range(1, 1000)})
+
+    results = studiobooking_manifest.discover_new_member_reports(None, "gym", str(tmp_path), 1, probe_limit=10, max_probe_batches=3)
+
+    assert len(results) == 30
+    assert requested_ids == list(range(1, 31))
+
+
+def test_first_run_downloads_the_whole_member_range(monkeypatch, tmp_path):
+    requested_ids = fake_downloads(monkeypatch, tmp_path, {member_id: 20 for member_id in range(5, 346)})
+    manifest_path = str(tmp_path / "manifest.json")
+
+    changed_files = studiobooking_manifest.download_changed_member_reports(None, "gym", str(tmp_path), manifest_path,
+                                                                          default_max_member_id=345, first_member_id=5)
+
+    # The range is downloaded in full, then one batch of blank reports past it ends discovery.
+    assert requested_ids == list(range(5, 356))
+    assert len(changed_files) == 341
+    assert sorted(int(member_id) for member_id in studiobooking_manifest.load_manifest(manifest_path)["members"]) == list(range(5, 346))